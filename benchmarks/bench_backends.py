@@ -0,0 +1,125 @@
+"""
+Routing of a `PhyxieService` across several mock Dify backends.
+
+Starts `--backends` `MockDify` servers in-process, points
+`PHYXIE_BACKENDS` at them and drives the service the way the handlers
+do: `--users` users concurrently start `--conversations` conversations of
+`--turns` messages each, attaching an uploaded photo to a share of the
+messages, and one heavy user starts `--heavy` conversations in a row.
+
+Reports how new conversations spread over the backends and counts
+misroutes: calls that reached a backend without their conversation
+(404) or upload (400). Any misroute exits with status 1.
+
+    python -m benchmarks.bench_backends [--backends 3] [--users 20] [--conversations 5]
+                                        [--turns 3] [--upload-share 0.3] [--heavy 30] [--seed 1]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import random
+import sys
+from collections import Counter
+from typing import Dict, List
+
+import structlog
+
+from benchmarks.mock_dify import MockConfig, MockDify
+from bot.models.schemas import ChatMessage, FileType, FileUpload, TransferMethod
+from bot.services.phyxie_service import PhyxieAPIError, PhyxieService
+from config.settings import settings
+
+
+class Run:
+    def __init__(self, service: PhyxieService, rng: random.Random, upload_share: float) -> None:
+        self.service = service
+        self.rng = rng
+        self.upload_share = upload_share
+        self.messages = 0
+        self.uploads = 0
+        self.misroutes: Counter = Counter()
+
+    async def conversation(self, user: str, turns: int) -> None:
+        conversation_id = None
+        for turn in range(turns):
+            files: List[FileUpload] = []
+            try:
+                if self.rng.random() < self.upload_share:
+                    upload = await self.service.upload_file(b"\xff\xd8 not really a jpeg", "photo.jpg", user,
+                                                            conversation_id)
+                    self.uploads += 1
+                    files.append(FileUpload(type=FileType.IMAGE, transfer_method=TransferMethod.LOCAL_FILE,
+                                            upload_file_id=upload.id))
+                response = await self.service.send_message(ChatMessage(
+                    query=f"question {turn}", user=user, conversation_id=conversation_id, files=files,
+                ))
+            except PhyxieAPIError as e:
+                if e.status in (400, 404):
+                    self.misroutes["upload" if e.status == 400 else "conversation"] += 1
+                    return
+                raise
+            self.messages += 1
+            conversation_id = conversation_id or response.conversation_id
+
+    async def user(self, user: str, conversations: int, turns: int) -> None:
+        for _ in range(conversations):
+            await self.conversation(user, turns)
+
+
+def spread(mocks: List[MockDify], users: List[str]) -> List[int]:
+    """New conversations of `users` per backend."""
+    return [sum(c["user"] in users for c in mock.conversations.values()) for mock in mocks]
+
+
+async def run(args: argparse.Namespace) -> bool:
+    mocks = [MockDify(MockConfig(ttft=args.ttft, token_rate=0, answer_tokens=20, upload_latency=0, seed=i))
+             for i in range(args.backends)]
+    urls = [await mock.start() for mock in mocks]
+    settings.phyxie_backends = ",".join(f"m{i}={url}|mock-key" for i, url in enumerate(urls))
+    settings.phyxie_health_interval = 0
+
+    service = PhyxieService()
+    await service.start()
+    state = Run(service, random.Random(args.seed), args.upload_share)
+    try:
+        users = [f"user-{i}" for i in range(args.users)]
+        await asyncio.gather(*(state.user(u, args.conversations, args.turns) for u in users))
+        await state.user("heavy", args.heavy, 1)
+    finally:
+        await service.close()
+        for mock in mocks:
+            await mock.close()
+
+    rows: Dict[str, List[int]] = {"concurrent users": spread(mocks, users), "heavy user": spread(mocks, ["heavy"])}
+    print(f"{args.backends} backends, {state.messages} messages, {state.uploads} uploads\n")
+    print(f"{'new conversations':<18} " + " ".join(f"{f'm{i}':>6}" for i in range(args.backends)) + f" {'max/mean':>9}")
+    for name, counts in rows.items():
+        mean = sum(counts) / len(counts)
+        print(f"{name:<18} " + " ".join(f"{c:>6}" for c in counts) + f" {max(counts) / max(mean, 1e-9):>8.2f}x")
+    print(f"\nmisroutes: {sum(state.misroutes.values())} "
+          f"(conversation {state.misroutes['conversation']}, upload {state.misroutes['upload']})")
+    return not state.misroutes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", type=int, default=3)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--conversations", type=int, default=5, help="conversations per user")
+    parser.add_argument("--turns", type=int, default=3, help="messages per conversation")
+    parser.add_argument("--upload-share", type=float, default=0.3, help="share of messages with an upload")
+    parser.add_argument("--heavy", type=int, default=30, help="conversations of the heavy user")
+    parser.add_argument("--ttft", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+    if not asyncio.run(run(args)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Compare the available JSON codecs on Dify-shaped traffic.
+
+    python -m benchmarks.bench_json [--size-mb 4] [--recording stream.txt]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import Callable
+
+from benchmarks.recordings import dify_blocking_response, dify_stream, load_recording
+from bot.models.schemas import PhyxieResponse
+from bot.utils.json_codec import available_codecs
+from bot.utils.sse import SSEDecoder
+
+
+def _best(fn: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=float, default=4.0)
+    parser.add_argument("--recording", help="raw SSE body captured from Dify")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    chunks = load_recording(args.recording) or dify_stream(int(args.size_mb * 1024 * 1024))
+    decoder = SSEDecoder()
+    frames = [e.data for c in chunks for e in decoder.feed(c) if e.data]
+
+    blocking = json.dumps(dify_blocking_response(4000)).encode()
+    payload = {
+        "query": "Derive the de Broglie wavelength of an electron at 100 eV",
+        "user": "user_42",
+        "inputs": {},
+        "response_mode": "streaming",
+        "auto_generate_name": True,
+        "conversation_id": "45701982-8118-4bc5-8e9b-64562b4555f2",
+        "files": [{"type": "image", "transfer_method": "local_file", "upload_file_id": "72fa9618"}],
+    }
+
+    print(f"{len(frames)} SSE frames, blocking body {len(blocking)} bytes\n")
+    print(f"{'codec':>8} {'sse frames':>12} {'blocking x1k':>14} {'encode x10k':>13}")
+    for name, codec_cls in available_codecs().items():
+        codec = codec_cls()
+        sse = _best(lambda: [codec.decode_stream_event(f) for f in frames], args.repeat)
+        block = _best(lambda: [codec.decode_into(blocking, PhyxieResponse) for _ in range(1000)], args.repeat)
+        enc = _best(lambda: [codec.encode(payload) for _ in range(10000)], args.repeat)
+        print(f"{name:>8} {sse * 1000:10.1f}ms {block * 1000:12.1f}ms {enc * 1000:11.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Scaling of the render pipeline's text pass on adversarial answers: the
+regex passes it used to run (`contains_math`, delimiter normalisation,
+the `_BLOCK_RE` block splitter) vs. `markdown_lexer.tokenize` feeding
+math detection and `MarkdownMathTiler.plan`.
+
+Each input is generated at sizes doubling from `--start`; the growth
+column is the time ratio between consecutive sizes: ~2 is linear, ~4 is
+quadratic. The legacy pass is skipped at larger sizes once a run takes
+longer than `--budget` seconds.
+
+    python -m benchmarks.bench_lexer [--start 10000] [--steps 4] [--budget 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+import time
+from typing import Callable, Dict, Optional, Union
+
+from bot.utils.latex_render import MarkdownMathTiler
+from bot.utils.markdown_lexer import contains_math
+
+# The passes `plan` and the handlers ran before the lexer (mathtext mode).
+_LEGACY_MATH_RE = re.compile(r'(\$.*?\$|\\\[.*?\\\]|\\\(.*?\\\)|\\begin\{.*?\})', re.DOTALL)
+_LEGACY_INLINE_RE = re.compile(r"\\\((.*?)\\\)", re.DOTALL)
+_LEGACY_DISPLAY_RE = re.compile(r"\\\[(.*?)\\\]", re.DOTALL)
+_LEGACY_BLOCK_RE = re.compile(
+    r"(```.*?```|"
+    r"\$\$.*?\$\$|"
+    r"\$.*?\$|"
+    r"^\s*#{1,6} .*?$|"
+    r"\s*---\s*$|"
+    r"[^\n]*?(?:\n|$))",
+    re.DOTALL | re.MULTILINE
+)
+
+
+def distinct_envs(size: int) -> str:
+    """Unclosed environments that all have different names: `\\begin{ea}`, `\\begin{eb}`, ..."""
+    names, out, length, n = "abcdefghijklmnopqrstuvwxyz", [], 0, 0
+    while length < size:
+        name, k = "", n
+        while True:
+            name, k = names[k % 26] + name, k // 26
+            if not k:
+                break
+        out.append(f"\\begin{{e{name}}} ")
+        length += len(out[-1])
+        n += 1
+    return "".join(out)[:size]
+
+
+# name -> unit repeated to the requested size, or a function of the size
+CASES: Dict[str, Union[str, Callable[[int], str]]] = {
+    "unclosed \\(": "see \\(x ",
+    "unclosed \\[": "note \\[ y ",
+    "distinct envs": distinct_envs,
+    "blank lines": " \n",
+    "dangling $": "costs $5 and\n",
+    "prose + math": "The energy $E = h\\nu$ of a photon grows with frequency.\n",
+}
+
+
+def legacy_pass(text: str) -> None:
+    _LEGACY_MATH_RE.search(text)
+    text = _LEGACY_INLINE_RE.sub(r"$\1$", text)
+    text = _LEGACY_DISPLAY_RE.sub(lambda m: "$" + " ".join(m.group(1).splitlines()) + "$", text)
+    for _ in _LEGACY_BLOCK_RE.finditer(text):
+        pass
+
+
+def lexer_pass(text: str, tiler: MarkdownMathTiler) -> None:
+    contains_math(text)
+    tiler.plan(text)
+
+
+def timed(run: Callable[[], object]) -> float:
+    started = time.perf_counter()
+    run()
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--start", type=int, default=10_000, help="smallest input, in characters")
+    parser.add_argument("--steps", type=int, default=4, help="number of doublings")
+    parser.add_argument("--budget", type=float, default=5.0, help="stop timing the legacy pass beyond this (s)")
+    args = parser.parse_args()
+
+    tiler = MarkdownMathTiler()
+    sizes = [args.start * 2 ** i for i in range(args.steps)]
+    print(f"{'input':<14} {'chars':>8} {'legacy ms':>10} {'growth':>7} {'lexer ms':>9} {'growth':>7}")
+    for name, unit in CASES.items():
+        legacy_before: Optional[float] = None
+        lexer_before: Optional[float] = None
+        for size in sizes:
+            text = unit(size) if callable(unit) else (unit * (size // len(unit) + 1))[:size]
+            legacy = None
+            if legacy_before is None or legacy_before <= args.budget:
+                legacy = timed(lambda: legacy_pass(text))
+            lexer = min(timed(lambda: lexer_pass(text, tiler)) for _ in range(3))
+            print(f"{name:<14} {size:>8} {_ms(legacy):>10} {_growth(legacy, legacy_before):>7} "
+                  f"{_ms(lexer):>9} {_growth(lexer, lexer_before):>7}")
+            legacy_before = legacy if legacy is not None else float("inf")
+            lexer_before = lexer
+        print()
+
+
+def _ms(seconds: Optional[float]) -> str:
+    return "skipped" if seconds is None else f"{seconds * 1000:.1f}"
+
+
+def _growth(seconds: Optional[float], before: Optional[float]) -> str:
+    if seconds is None or not before or before == float("inf"):
+        return ""
+    return f"{seconds / before:.1f}x"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Replay a corpus of answers through the handlers' math decision and
+report how many the Unicode fast path (`simplify_inline_math`) keeps
+out of the image renderer, and how many tiles that saves.
+
+The corpus is JSON lines with an `answer` field (a Dify `/messages`
+export) or a raw SSE body captured from Dify; several files may be
+given. Without one, synthetic answers from `physics_answers` are used,
+so the numbers only mean something for a real corpus.
+
+Before the replay, the converter is checked against `CONVERSIONS`, known
+inputs and their expected text; a mismatch exits with status 1.
+
+    python -m benchmarks.bench_math_path [--corpus answers.jsonl ...] [--answers 1000] [--samples 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from benchmarks.recordings import load_answers, physics_answers
+from bot.utils.latex_render import MarkdownMathTiler
+from bot.utils.markdown_lexer import TokenKind, contains_math, tokenize
+from bot.utils.unicode_math import latex_to_unicode, simplify_inline_math
+
+# (LaTeX, expected text or None for "needs rendering")
+CONVERSIONS: List[Tuple[str, Optional[str]]] = [
+    (r"E = h\nu", "E = hν"),
+    (r"2 m_e e V", "2mₑeV"),
+    (r"\lambda = \frac{h}{p}", "λ = h/p"),
+    # spaces in text fonts are kept
+    (r"\text{hello world}", "hello world"),
+    (r"\text{if } x > 0", "if x > 0"),
+    (r"\text{m s}^{-1}", "m s⁻¹"),
+    # a fraction followed by a factor or script is parenthesised
+    (r"\frac{1}{2} m v^2", "(1/2)mv²"),
+    (r"\frac{a}{b}^2", "(a/b)²"),
+    (r"\frac{1}{2} + x", "1/2 + x"),
+    (r"\frac{1}{2} \cdot x", "1/2 · x"),
+    (r"\frac{\frac{a}{b}}{c}", None),
+]
+
+
+def check_conversions() -> bool:
+    ok = True
+    for tex, expected in CONVERSIONS:
+        got = latex_to_unicode(tex)
+        if got != expected:
+            print(f"conversion mismatch: {tex!r} gave {got!r}, expected {expected!r}")
+            ok = False
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", nargs="*", default=[], help="JSON-lines answers or captured SSE bodies")
+    parser.add_argument("--answers", type=int, default=1000, help="synthetic answers without --corpus")
+    parser.add_argument("--samples", type=int, default=5, help="converted answers to print")
+    args = parser.parse_args()
+
+    if not check_conversions():
+        sys.exit(1)
+
+    if args.corpus:
+        answers: List[str] = [a for path in args.corpus for a in load_answers(path)]
+        source = ", ".join(args.corpus)
+    else:
+        answers = physics_answers(args.answers)
+        source = "synthetic (physics_answers)"
+
+    tiler = MarkdownMathTiler()
+    outcome: Counter = Counter()
+    tiles: Counter = Counter()
+    samples: List[str] = []
+    classify_time = 0.0
+    for answer in answers:
+        if not contains_math(answer):
+            outcome["no math"] += 1
+            continue
+        started = time.perf_counter()
+        simplified = simplify_inline_math(answer)
+        classify_time += time.perf_counter() - started
+
+        count = len(tiler.plan(answer))
+        if simplified is not None:
+            outcome["unicode text"] += 1
+            tiles["saved"] += count
+            if len(samples) < args.samples:
+                samples.append(simplified)
+        else:
+            display = any(t.kind is TokenKind.DISPLAY_MATH for t in tokenize(answer))
+            outcome["display math" if display else "complex inline"] += 1
+            tiles["rendered"] += count
+
+    with_math = len(answers) - outcome["no math"]
+    print(f"corpus: {source}, {len(answers)} answers, {with_math} with math\n")
+    for name in ("no math", "unicode text", "complex inline", "display math"):
+        print(f"  {name:<15} {outcome[name]:>6}  {outcome[name] / max(len(answers), 1):>6.1%}")
+    print(f"\nanswers with math sent as text: {outcome['unicode text'] / max(with_math, 1):.1%}")
+    total_tiles = tiles["saved"] + tiles["rendered"]
+    print(f"tiles not rendered: {tiles['saved']} of {total_tiles} ({tiles['saved'] / max(total_tiles, 1):.1%})")
+    print(f"classifier: {classify_time / max(with_math, 1) * 1e6:.0f} µs per answer with math")
+    for sample in samples:
+        print(f"\n> {sample[:300]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Per-tile cost of `MarkdownMathTiler.draw_tile` for each engine: pyplot
+(savefig with a tight bbox, PIL decode, paste, second PNG encode), agg
+(one layout, one rasterisation, one encode) and compose (cached word and
+expression bitmaps blitted into the tile, one encode). The compose cache
+is warm after the first pass, as in a long-running render worker; its
+hit rate is printed.
+
+Time is measured without tracing; allocations in a second pass with
+`tracemalloc`: peak Python-heap bytes per tile and blocks allocated per
+tile that are still alive afterwards (matplotlib's caches). Buffers
+allocated in C by Agg and PIL are not traced.
+
+    python -m benchmarks.bench_render [--repeat 20]
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import statistics
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from bot.utils.latex_render import MarkdownMathTiler
+
+_ANSWER = r"""
+# Photoelectric effect
+
+Light of frequency $\nu$ ejects electrons only above a threshold. Each photon carries
+energy $E = h\nu$, and the fastest electrons leave with $K_{max} = h\nu - \phi$.
+
+$$K_{max} = h\nu - \phi$$
+
+$$\lambda = \frac{h}{\sqrt{2 m_e e V}} \approx \frac{1.23\,\mathrm{nm}}{\sqrt{V}}$$
+
+$$\oint_{\partial V} \mathbf{E} \cdot d\mathbf{A} = \frac{Q_{enc}}{\varepsilon_0} \\ \nabla \cdot \mathbf{E} = \frac{\rho}{\varepsilon_0}$$
+
+The stopping potential $V_0$ satisfies $e V_0 = h\nu - \phi$, so plotting $V_0$ against
+$\nu$ gives a straight line of slope $h/e$ whose intercept is the work function.
+"""
+
+
+def measure(draw: Callable[[str, bool], object], chunks: List[Tuple[str, bool]], repeat: int) -> Dict:
+    for chunk, is_math in chunks:  # warm fonts and mathtext caches
+        draw(chunk, is_math)
+
+    times: List[float] = []
+    for _ in range(repeat):
+        for chunk, is_math in chunks:
+            started = time.perf_counter()
+            draw(chunk, is_math)
+            times.append(time.perf_counter() - started)
+
+    gc.collect()
+    tracemalloc.start()
+    peaks, blocks = [], []
+    for chunk, is_math in chunks:
+        gc.collect()
+        before = tracemalloc.take_snapshot()
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        draw(chunk, is_math)
+        gc.collect()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        peaks.append(peak - base)
+        blocks.append(sum(stat.count_diff for stat in after.compare_to(before, "filename")))
+    tracemalloc.stop()
+
+    times.sort()
+    return {
+        "p50": statistics.median(times) * 1000,
+        "p95": times[int(0.95 * (len(times) - 1))] * 1000,
+        "peak": statistics.mean(peaks) / 1024,
+        "leaked": statistics.mean(blocks),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    tiler = MarkdownMathTiler()
+    chunks = tiler.plan(_ANSWER)
+    tilers = {engine: MarkdownMathTiler(engine) for engine in ("pyplot", "agg", "compose")}
+    print(f"{len(chunks)} tiles x {args.repeat}\n")
+    print(f"{'engine':<8} {'ms/tile p50':>12} {'p95':>8} {'heap peak KiB':>14} {'blocks kept':>12} {'speedup':>8}")
+    results = {name: measure(tiler.draw_tile, chunks, args.repeat) for name, tiler in tilers.items()}
+    for name, r in results.items():
+        print(f"{name:<8} {r['p50']:>12.1f} {r['p95']:>8.1f} {r['peak']:>14.0f} {r['leaked']:>12.1f} "
+              f"{results['pyplot']['p50'] / r['p50']:>7.2f}x")
+
+    stats = tilers["compose"].compositor.cache.stats()
+    print(f"\ncompose bitmap cache: {stats['entries']} entries, {stats['bytes'] / 1024:.0f} KiB, "
+          f"hit rate {stats['hits'] / (stats['hits'] + stats['misses']):.1%}")
+
+
+if __name__ == "__main__":
+    main()
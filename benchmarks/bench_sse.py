@@ -0,0 +1,80 @@
+"""
+Compare the legacy line-by-line SSE handling with `SSEDecoder`.
+
+    python -m benchmarks.bench_sse [--size-mb 8] [--recording stream.txt]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import Callable, List
+
+from benchmarks.recordings import dify_stream, load_recording
+from bot.utils.sse import SSEDecoder
+
+
+def legacy_path(chunks: List[bytes]) -> int:
+    """What `stream_message` did before: readline, decode, strip, loads."""
+    buf = bytearray()
+    count = 0
+    for chunk in chunks:
+        buf += chunk
+        start = 0
+        while True:
+            end = buf.find(b"\n", start)
+            if end < 0:
+                break
+            line = bytes(buf[start:end + 1])
+            start = end + 1
+            text = line.decode().strip()
+            if not text.startswith("data: "):
+                continue
+            payload = text[6:]
+            if payload:
+                json.loads(payload)
+                count += 1
+        del buf[:start]
+    return count
+
+
+def decoder_path(chunks: List[bytes]) -> int:
+    decoder = SSEDecoder()
+    count = 0
+    for chunk in chunks:
+        for event in decoder.feed(chunk):
+            if event.data:
+                json.loads(event.data)
+                count += 1
+    return count
+
+
+def _time(fn: Callable[[List[bytes]], int], chunks: List[bytes], repeat: int) -> tuple:
+    best = float("inf")
+    events = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        events = fn(chunks)
+        best = min(best, time.perf_counter() - started)
+    return best, events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=float, default=8.0)
+    parser.add_argument("--recording", help="raw SSE body captured from Dify")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    chunks = load_recording(args.recording) or dify_stream(int(args.size_mb * 1024 * 1024))
+    size_mb = sum(map(len, chunks)) / (1024 * 1024)
+    print(f"stream: {size_mb:.1f} MB in {len(chunks)} chunks")
+
+    for name, fn in (("legacy", legacy_path), ("decoder", decoder_path)):
+        seconds, events = _time(fn, chunks, args.repeat)
+        print(f"{name:>8}: {seconds * 1000:8.1f} ms  {size_mb / seconds:7.1f} MB/s  {events} events")
+
+
+if __name__ == "__main__":
+    main()
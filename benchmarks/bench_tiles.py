@@ -0,0 +1,110 @@
+"""
+Wall time to deliver a LaTeX answer of N tiles: one `sendPhoto` per tile
+vs. albums of up to 10 tiles (`reply_photos`), and albums of tiles that
+were sent before and go out by their cached Telegram file id.
+
+The Bot API is simulated by `RecordingRequest` with a per-call latency
+plus upload time at `--uplink` Mbit/s. Tiles are real PNGs from
+`MarkdownMathTiler`. By default the outbound `TelegramRateLimiter` is on,
+so the per-chat limit (1 message/s, burst 3) is part of the result.
+
+    python -m benchmarks.bench_tiles [--tiles 1 5 10 20] [--tg-latency 0.15] [--uplink 20] [--no-rate-limit]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import structlog
+from telegram import Chat, Message, User
+from telegram.ext import ExtBot
+
+from benchmarks.load_test import RecordingRequest
+from bot.services.photo_cache import PhotoCache
+from bot.services.rate_limiter import TelegramRateLimiter
+from bot.utils.latex_render import MarkdownMathTiler
+from bot.utils.media import reply_photos
+
+_ANSWER = (
+    "The de Broglie wavelength is $\\lambda = \\frac{h}{p}$. For an electron accelerated "
+    "through a potential $V$ we get\n\n$$p = \\sqrt{2 m_e e V}$$\n\nand therefore\n\n"
+    "$$\\lambda = \\frac{h}{\\sqrt{2 m_e e V}} \\approx \\frac{1.23\\,\\mathrm{nm}}{\\sqrt{V}}$$\n\n"
+)
+
+
+class UplinkRequest(RecordingRequest):
+    """`RecordingRequest` that also charges upload time for multipart bodies."""
+
+    def __init__(self, latency: float, uplink_mbit: float) -> None:
+        super().__init__(latency)
+        self.bytes_per_second = uplink_mbit * 1_000_000 / 8
+        self.uploaded = 0
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        if request_data is not None and request_data.multipart_data:
+            size = sum(len(part[1]) for part in request_data.multipart_data.values())
+            self.uploaded += size
+            await asyncio.sleep(size / self.bytes_per_second)
+        return await super().do_request(url, method, request_data, **kwargs)
+
+
+def make_tiles(count: int) -> List[bytes]:
+    tiles: List[bytes] = []
+    tiler = MarkdownMathTiler()
+    while len(tiles) < count:
+        tiles.extend(buf.getvalue() for buf in tiler.render(_ANSWER * 4))
+    return tiles[:count]
+
+
+async def deliver(tiles: List[bytes], batched: bool, args, cache: Optional[PhotoCache] = None) -> dict:
+    request = UplinkRequest(args.tg_latency, args.uplink)
+    limiter = None if args.no_rate_limit else TelegramRateLimiter()
+    bot = ExtBot("123:bench", request=request, rate_limiter=limiter)
+    async with bot:
+        message = Message(
+            message_id=1, date=datetime.now(timezone.utc), chat=Chat(id=42, type=Chat.PRIVATE),
+            from_user=User(id=42, first_name="bench", is_bot=False), text="?",
+        )
+        message.set_bot(bot)
+
+        started = time.perf_counter()
+        if batched:
+            await reply_photos(message, tiles, cache=cache)
+        else:
+            for tile in tiles:
+                await message.reply_photo(photo=tile)
+        elapsed = time.perf_counter() - started
+    calls = request.calls["sendPhoto"] + request.calls["sendMediaGroup"]
+    return {"elapsed": elapsed, "calls": calls, "uploaded": request.uploaded}
+
+
+async def main(args) -> None:
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+    tiles = make_tiles(max(args.tiles))
+    size = sum(len(t) for t in tiles) / len(tiles)
+    print(f"tile size ~{size / 1024:.0f} KiB, Bot API latency {args.tg_latency * 1000:.0f} ms, "
+          f"uplink {args.uplink} Mbit/s, rate limiter {'off' if args.no_rate_limit else 'on'}")
+    print(f"\n{'tiles':>6} {'sequential s':>13} {'calls':>6} {'albums s':>9} {'calls':>6} {'speedup':>8} "
+          f"{'cached s':>9} {'KiB up':>7} {'speedup':>8}")
+    for count in args.tiles:
+        seq = await deliver(tiles[:count], False, args)
+        cache = PhotoCache(max_entries=10_000, db_path="")
+        alb = await deliver(tiles[:count], True, args, cache)
+        hot = await deliver(tiles[:count], True, args, cache)
+        print(f"{count:>6} {seq['elapsed']:>13.2f} {seq['calls']:>6} {alb['elapsed']:>9.2f} {alb['calls']:>6} "
+              f"{seq['elapsed'] / alb['elapsed']:>7.1f}x {hot['elapsed']:>9.2f} {hot['uploaded'] / 1024:>7.0f} "
+              f"{seq['elapsed'] / hot['elapsed']:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiles", type=int, nargs="+", default=[1, 5, 10, 20])
+    parser.add_argument("--tg-latency", type=float, default=0.15, help="Bot API round trip (s)")
+    parser.add_argument("--uplink", type=float, default=20.0, help="upload bandwidth (Mbit/s)")
+    parser.add_argument("--no-rate-limit", action="store_true", help="disable the outbound rate limiter")
+    asyncio.run(main(parser.parse_args()))
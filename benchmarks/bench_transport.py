@@ -0,0 +1,245 @@
+"""
+Connection count and latency of the aiohttp (HTTP/1.1) and httpx (HTTP/2)
+transports with many concurrent `/chat-messages` streams.
+
+Two local mock servers stream the same Dify-shaped SSE answer: an aiohttp
+HTTP/1.1 server and a cleartext HTTP/2 (h2c, prior knowledge) server built
+on the `h2` package. Both count the TCP connections they accept.
+
+    python -m benchmarks.bench_transport [--streams 200] [--tokens 40] [--interval 0.02] [--ttft 0.1]
+
+Needs `pip install httpx[http2]` for the HTTP/2 run.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+from bot.models.schemas import ChatMessage
+from bot.services.backends import Backend, LoadBalancer
+from bot.services.flow_control import AdaptiveLimiter, FlowControl
+from bot.services.http_pool import HTTPPool
+from bot.services.phyxie_service import PhyxieService, _is_upstream_healthy
+from bot.services.transport import AiohttpTransport, HttpxTransport, Transport
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+except ImportError:  # pragma: no cover - optional dependency
+    h2 = None
+
+
+def sse_frames(tokens: int) -> List[bytes]:
+    """One SSE frame per answer token, then `message_end`."""
+    ids = {"task_id": "t-1", "message_id": "m-1", "conversation_id": "c-1"}
+    frames = [
+        ("data: " + json.dumps({"event": "message", "answer": f"tok{i} ", **ids}) + "\n\n").encode()
+        for i in range(tokens)
+    ]
+    frames.append(("data: " + json.dumps({"event": "message_end", "metadata": {}, **ids}) + "\n\n").encode())
+    return frames
+
+
+class Shape:
+    def __init__(self, tokens: int, interval: float, ttft: float):
+        self.frames = sse_frames(tokens)
+        self.interval = interval
+        self.ttft = ttft
+
+
+# --------------------------------------------------------------------- #
+#  HTTP/1.1 mock                                                        #
+# --------------------------------------------------------------------- #
+
+async def start_http1(shape: Shape, port: int) -> tuple:
+    connections = set()
+
+    async def chat(request: web.Request) -> web.StreamResponse:
+        connections.add(id(request.transport))
+        await request.read()
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        await asyncio.sleep(shape.ttft)
+        for frame in shape.frames:
+            await resp.write(frame)
+            await asyncio.sleep(shape.interval)
+        await resp.write_eof()
+        return resp
+
+    app = web.Application()
+    app.router.add_post("/v1/chat-messages", chat)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner, connections
+
+
+# --------------------------------------------------------------------- #
+#  HTTP/2 (h2c) mock                                                    #
+# --------------------------------------------------------------------- #
+
+class H2Protocol(asyncio.Protocol):
+    """Minimal h2c server: streams the SSE answer for every request."""
+
+    def __init__(self, shape: Shape, stats: Dict):
+        self.shape = shape
+        self.stats = stats
+        self.conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False))
+        self.transport: Optional[asyncio.Transport] = None
+        self.window_open = asyncio.Event()
+        self.tasks = set()
+
+    def connection_made(self, transport):
+        self.stats["connections"] += 1
+        self.transport = transport
+        self.conn.initiate_connection()
+        transport.write(self.conn.data_to_send())
+
+    def connection_lost(self, exc):
+        for task in self.tasks:
+            task.cancel()
+
+    def data_received(self, data: bytes):
+        for event in self.conn.receive_data(data):
+            if isinstance(event, h2.events.DataReceived):
+                self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+            elif isinstance(event, h2.events.StreamEnded):
+                task = asyncio.get_running_loop().create_task(self.respond(event.stream_id))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+            elif isinstance(event, (h2.events.WindowUpdated, h2.events.RemoteSettingsChanged)):
+                self.window_open.set()
+        self.flush()
+
+    def flush(self):
+        data = self.conn.data_to_send()
+        if data and self.transport is not None and not self.transport.is_closing():
+            self.transport.write(data)
+
+    async def send(self, stream_id: int, data: bytes):
+        while data:
+            window = min(self.conn.local_flow_control_window(stream_id), self.conn.max_outbound_frame_size)
+            if window <= 0:
+                self.window_open.clear()
+                await self.window_open.wait()
+                continue
+            self.conn.send_data(stream_id, data[:window])
+            data = data[window:]
+            self.flush()
+
+    async def respond(self, stream_id: int):
+        self.conn.send_headers(stream_id, [(":status", "200"), ("content-type", "text/event-stream")])
+        self.flush()
+        await asyncio.sleep(self.shape.ttft)
+        for frame in self.shape.frames:
+            await self.send(stream_id, frame)
+            await asyncio.sleep(self.shape.interval)
+        self.conn.end_stream(stream_id)
+        self.flush()
+
+
+async def start_h2c(shape: Shape, port: int):
+    stats = {"connections": 0}
+    server = await asyncio.get_running_loop().create_server(lambda: H2Protocol(shape, stats), "127.0.0.1", port)
+    return server, stats
+
+
+# --------------------------------------------------------------------- #
+#  Client side                                                          #
+# --------------------------------------------------------------------- #
+
+def make_service(transport: Transport, pool: HTTPPool, base_url: str, streams: int) -> PhyxieService:
+    # Flow control wide open: the benchmark measures the transport only.
+    flow = FlowControl(_is_upstream_healthy,
+                       limiter=AdaptiveLimiter(initial_limit=streams, min_limit=streams,
+                                               max_limit=streams, max_queue=streams))
+    backend = Backend("bench", base_url, "bench-key", 1.0, flow)
+    return PhyxieService(pool=pool, balancer=LoadBalancer([backend]), transport=transport)
+
+
+async def one_stream(service: PhyxieService, user: str) -> tuple:
+    started = time.perf_counter()
+    ttft = None
+    async for event in service.stream_message(ChatMessage(query="bench", user=user)):
+        if ttft is None and event.is_answer:
+            ttft = time.perf_counter() - started
+    return ttft, time.perf_counter() - started
+
+
+async def run(service: PhyxieService, streams: int) -> Dict:
+    await service.start()
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one_stream(service, f"u{i}") for i in range(streams)))
+    wall = time.perf_counter() - started
+    stats = service.transport_stats()
+    await service.close()
+
+    ttfts = sorted(r[0] for r in results)
+    totals = sorted(r[1] for r in results)
+
+    def pct(values, q):
+        return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+    return {
+        "wall_s": wall,
+        "ttft_p50": statistics.median(ttfts) * 1000,
+        "ttft_p95": pct(ttfts, 0.95),
+        "total_p50": statistics.median(totals) * 1000,
+        "total_p95": pct(totals, 0.95),
+        "stats": stats,
+    }
+
+
+async def main(args) -> None:
+    shape = Shape(args.tokens, args.interval, args.ttft)
+    ideal = (args.ttft + (args.tokens + 1) * args.interval) * 1000
+    print(f"{args.streams} concurrent streams, {args.tokens} tokens, "
+          f"ideal stream time {ideal:.0f} ms\n")
+    header = f"{'transport':<28}{'conns':>7}{'wall s':>8}{'ttft p50':>10}{'ttft p95':>10}{'total p50':>11}{'total p95':>11}"
+    print(header)
+    print("-" * len(header))
+
+    def row(label, conns, r):
+        print(f"{label:<28}{conns:>7}{r['wall_s']:>8.2f}{r['ttft_p50']:>10.0f}{r['ttft_p95']:>10.0f}"
+              f"{r['total_p50']:>11.0f}{r['total_p95']:>11.0f}")
+
+    for per_host in args.per_host:
+        runner, connections = await start_http1(shape, args.port)
+        pool = HTTPPool(limit=max(per_host, 1), limit_per_host=per_host)
+        service = make_service(AiohttpTransport(pool), pool, f"http://127.0.0.1:{args.port}/v1", args.streams)
+        result = await run(service, args.streams)
+        row(f"aiohttp h1.1 per_host={per_host}", len(connections), result)
+        await runner.cleanup()
+
+    if h2 is None or HttpxTransport is None:
+        print("httpx/h2 not installed; skipping HTTP/2 (pip install httpx[http2])")
+        return
+
+    server, stats = await start_h2c(shape, args.port + 1)
+    pool = HTTPPool()
+    transport = HttpxTransport(http2=True, prior_knowledge=True, max_connections=args.streams)
+    service = make_service(transport, pool, f"http://127.0.0.1:{args.port + 1}/v1", args.streams)
+    result = await run(service, args.streams)
+    row("httpx h2 (prior knowledge)", stats["connections"], result)
+    server.close()
+    await server.wait_closed()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--interval", type=float, default=0.02)
+    parser.add_argument("--ttft", type=float, default=0.1)
+    parser.add_argument("--per-host", type=int, nargs="+", default=[30, 200],
+                        help="aiohttp limit_per_host values to compare (30 is the default setting)")
+    parser.add_argument("--port", type=int, default=8941)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,87 @@
+"""
+Throughput of sequential vs. chat-ordered concurrent update processing.
+
+Each simulated user sends a burst of messages; every handler call waits
+for a simulated LLM round trip. Per-chat ordering is verified as well.
+
+    python -m benchmarks.bench_updates [--users 1 10 50 200] [--messages 3] [--latency 0.2]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from telegram import Chat, Message, Update, User
+from telegram.ext import BaseUpdateProcessor, SimpleUpdateProcessor
+
+from bot.services.update_processor import ChatOrderedUpdateProcessor
+
+
+def make_updates(users: int, messages: int) -> List[Update]:
+    updates = []
+    update_id = 0
+    for seq in range(messages):
+        for uid in range(1, users + 1):
+            update_id += 1
+            user = User(id=uid, first_name=f"u{uid}", is_bot=False)
+            chat = Chat(id=uid, type=Chat.PRIVATE)
+            message = Message(
+                message_id=seq, date=datetime.now(timezone.utc), chat=chat, from_user=user, text=str(seq)
+            )
+            updates.append(Update(update_id=update_id, message=message))
+    return updates
+
+
+async def run(processor: BaseUpdateProcessor, updates: List[Update], latency: float) -> Dict:
+    seen: Dict[int, List[int]] = defaultdict(list)
+    rng = random.Random(1)
+
+    async def handler(update: Update):
+        await asyncio.sleep(latency * rng.uniform(0.5, 1.5))
+        seen[update.effective_chat.id].append(update.message.message_id)
+
+    started = time.perf_counter()
+    async with processor:
+        if processor.max_concurrent_updates > 1:
+            # What Application does: one task per update, in arrival order.
+            tasks = [asyncio.create_task(processor.process_update(u, handler(u))) for u in updates]
+            await asyncio.gather(*tasks)
+        else:
+            for u in updates:
+                await processor.process_update(u, handler(u))
+    elapsed = time.perf_counter() - started
+
+    ordered = all(ids == sorted(ids) for ids in seen.values())
+    return {"elapsed": elapsed, "throughput": len(updates) / elapsed, "ordered": ordered}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--messages", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    print(f"{'users':>6} {'updates':>8} {'sequential upd/s':>17} {'concurrent upd/s':>17} {'speedup':>8} ordered")
+    for users in args.users:
+        updates = make_updates(users, args.messages)
+        if users * args.messages * args.latency <= 60:
+            seq = await run(SimpleUpdateProcessor(1), updates, args.latency)
+            seq_tp = f"{seq['throughput']:17.1f}"
+        else:
+            seq = {"throughput": 1 / args.latency}
+            seq_tp = f"{seq['throughput']:16.1f}~"
+        conc = await run(ChatOrderedUpdateProcessor(args.concurrency, 10_000), updates, args.latency)
+        print(f"{users:>6} {len(updates):>8} {seq_tp} {conc['throughput']:17.1f} "
+              f"{conc['throughput'] / seq['throughput']:7.1f}x {conc['ordered']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,334 @@
+"""
+End-to-end load test: `PhyxieBot` against the mock Dify with a fake Telegram API.
+
+Synthetic updates (plain text, math-heavy questions, photos, documents,
+commands)
+arrive as a Poisson process and go through the same path the polling
+loop uses: the application's update processor, then `process_update`.
+Outgoing Bot API calls are answered locally by `RecordingRequest` after
+a configurable latency, so nothing leaves the machine.
+
+    python -m benchmarks.load_test [--rate 20] [--duration 30] [--users 200]
+                                   [--mix text=0.55,math=0.2,photo=0.1,document=0.1,command=0.05]
+                                   [--ttft 0.3] [--token-rate 50] [--tg-latency 0.03]
+                                   [--reply-mode blocking|streaming]
+
+Reports throughput, latency percentiles per update kind (time to the first
+reply and to handler completion), Bot API calls, outbound rate-limiter
+waits, LaTeX render pool metrics and event-loop lag. Replies starting
+with "❌" are counted as errors, so a broken handler shows up.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import logging
+import random
+import statistics
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import structlog
+from telegram import Update
+from telegram.request import BaseRequest, RequestData
+
+from benchmarks.mock_dify import MockConfig, MockDify
+from bot.services.stream_reply import PLACEHOLDER
+from config.settings import settings
+
+_QUESTIONS = (
+    "What is the photoelectric effect?",
+    "Explain wave-particle duality in simple terms.",
+    "Why is the sky blue?",
+    "How does a transformer change voltage?",
+)
+_MATH_QUESTIONS = (
+    "Show the math for the de Broglie wavelength of an electron.",
+    "Derive the math behind the uncertainty principle.",
+    "Give the math for Gauss's law with an example.",
+)
+_COMMANDS = ("/start", "/help", "/new", "/clear")
+
+
+class RecordingRequest(BaseRequest):
+    """
+    Fake Bot API transport: answers every method locally after `latency`
+    seconds and records what was sent, per chat and per method.
+    """
+
+    def __init__(self, latency: float = 0.03, files: Optional[Dict[str, Path]] = None) -> None:
+        self.latency = latency
+        self.files = files or {}
+        self.calls: Counter = Counter()
+        self.replies: Dict[int, List[Tuple[float, str, str]]] = defaultdict(list)
+        self._message_id = 0
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _message(self, chat_id: int, **extra) -> Dict:
+        self._message_id += 1
+        return {"message_id": self._message_id, "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}, **extra}
+
+    def _photo(self) -> List[Dict]:
+        file_id = f"sent-photo-{self._message_id + 1}"
+        return [{"file_id": file_id, "file_unique_id": file_id, "width": 1200, "height": 400}]
+
+    async def do_request(self, url, method, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] += 1
+        params = request_data.parameters if request_data is not None else {}
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+
+        chat_id = params.get("chat_id")
+        if api_method in ("sendMessage", "sendPhoto", "sendDocument", "sendMediaGroup", "editMessageText"):
+            self.replies[int(chat_id)].append((time.perf_counter(), api_method, params.get("text", "")))
+
+        if api_method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Phyxie", "username": "phyxie_load_bot"}
+        elif api_method in ("sendMessage", "editMessageText"):
+            result = self._message(int(chat_id), text=params.get("text", ""))
+        elif api_method == "sendPhoto":
+            result = self._message(int(chat_id), photo=self._photo())
+        elif api_method == "sendDocument":
+            result = self._message(int(chat_id))
+        elif api_method == "sendMediaGroup":
+            result = [self._message(int(chat_id), photo=self._photo()) for _ in params.get("media", [])]
+        elif api_method == "getFile":
+            file_id = params["file_id"]
+            path = self.files[file_id.split(":", 1)[0]]
+            result = {"file_id": file_id, "file_unique_id": file_id, "file_size": path.stat().st_size,
+                      "file_path": str(path)}
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def make_files(directory: Path) -> Dict[str, Path]:
+    """A JPEG photo and a small PDF-like document served through `getFile`."""
+    from PIL import Image
+
+    photo = directory / "photo.jpg"
+    buf = io.BytesIO()
+    Image.new("RGB", (1280, 960), (120, 160, 200)).save(buf, format="JPEG", quality=85)
+    photo.write_bytes(buf.getvalue())
+
+    document = directory / "notes.pdf"
+    document.write_bytes(b"%PDF-1.4\n" + b"0" * 200_000 + b"\n%%EOF\n")
+    return {"photo": photo, "document": document}
+
+
+def make_update(kind: str, update_id: int, user_id: int, files: Dict[str, Path]) -> Dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"load{user_id}", "username": f"load_{user_id}"}
+    message = {"message_id": update_id, "date": int(time.time()),
+               "chat": {"id": user_id, "type": "private"}, "from": user}
+    if kind == "text":
+        message["text"] = random.choice(_QUESTIONS)
+    elif kind == "math":
+        message["text"] = random.choice(_MATH_QUESTIONS)
+    elif kind == "command":
+        message["text"] = random.choice(_COMMANDS)
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(message["text"])}]
+    elif kind == "photo":
+        size = files["photo"].stat().st_size
+        message["photo"] = [{"file_id": f"photo:{update_id}", "file_unique_id": f"p{update_id}",
+                             "width": 1280, "height": 960, "file_size": size}]
+        message["caption"] = "What is shown here?"
+    elif kind == "document":
+        message["document"] = {"file_id": f"document:{update_id}", "file_unique_id": f"d{update_id}",
+                               "file_name": "notes.pdf", "mime_type": "application/pdf",
+                               "file_size": files["document"].stat().st_size}
+        message["caption"] = "Summarise this document"
+    return {"update_id": update_id, "message": message}
+
+
+class LagMonitor:
+    """Measure how late a periodic timer fires: a proxy for event-loop blocking."""
+
+    def __init__(self, interval: float = 0.05) -> None:
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for item in spec.split(","):
+        kind, _, weight = item.partition("=")
+        mix[kind.strip()] = float(weight)
+    unknown = set(mix) - {"text", "math", "photo", "document", "command"}
+    if unknown:
+        raise SystemExit(f"Unknown update kinds in --mix: {sorted(unknown)}")
+    return mix
+
+
+def percentiles(values: List[float]) -> str:
+    if not values:
+        return f"{'-':>8}{'-':>8}{'-':>8}{'-':>8}"
+    values = sorted(values)
+
+    def pct(q):
+        return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+    return f"{statistics.median(values) * 1000:>8.0f}{pct(0.9):>8.0f}{pct(0.99):>8.0f}{values[-1] * 1000:>8.0f}"
+
+
+async def main(args) -> None:
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+    logging.basicConfig(level=logging.WARNING)
+    random.seed(args.seed)
+
+    mock = MockDify(MockConfig(ttft=args.ttft, token_rate=args.token_rate, answer_tokens=args.answer_tokens,
+                               error_rate=args.error_rate, drop_rate=args.drop_rate, seed=args.seed))
+    settings.phyxie_api_base_url = await mock.start()
+    settings.reply_mode = args.reply_mode
+
+    from bot.bot import PhyxieBot
+
+    tmp = tempfile.TemporaryDirectory()
+    files = make_files(Path(tmp.name))
+    request = RecordingRequest(args.tg_latency, files)
+    bot = PhyxieBot(request=request, get_updates_request=RecordingRequest(0))
+    app = bot.application
+
+    mix = parse_mix(args.mix)
+    kinds, weights = list(mix), list(mix.values())
+
+    arrivals: Dict[int, Tuple[str, int, float]] = {}
+    done: Dict[int, float] = {}
+    tasks = set()
+
+    async def handle(update: Update) -> None:
+        # What Application's update fetcher does for each polled update.
+        await app.update_processor.process_update(update, app.process_update(update))
+        done[update.update_id] = time.perf_counter()
+
+    lag = LagMonitor()
+    async with app:
+        await bot.post_init(app)
+        lag.start()
+        started = time.perf_counter()
+        update_id = 0
+        next_at = started
+        while next_at - started < args.duration:
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            update_id += 1
+            kind = random.choices(kinds, weights)[0]
+            user_id = random.randint(1, args.users)
+            update = Update.de_json(make_update(kind, update_id, user_id, files), app.bot)
+            arrivals[update_id] = (kind, user_id, time.perf_counter())
+            task = asyncio.create_task(handle(update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            next_at += random.expovariate(args.rate)
+
+        injected = time.perf_counter() - started
+        if tasks:
+            await asyncio.wait(tasks, timeout=args.drain_timeout)
+        elapsed = time.perf_counter() - started
+        await lag.stop()
+        flow = bot.phyxie_service.flow_stats()
+        render = bot.render_service.stats()
+        await bot.post_shutdown(app)
+    await mock.close()
+    tmp.cleanup()
+
+    # First reply per update: the first answer text (not the streaming
+    # placeholder) or image sent to its chat after it arrived.
+    first_reply: Dict[str, List[float]] = defaultdict(list)
+    completion: Dict[str, List[float]] = defaultdict(list)
+    for uid, (kind, chat_id, arrived) in arrivals.items():
+        if uid in done:
+            completion[kind].append(done[uid] - arrived)
+        replies = [t for t, _, text in request.replies.get(chat_id, []) if t >= arrived and text != PLACEHOLDER]
+        if replies:
+            first_reply[kind].append(min(replies) - arrived)
+
+    completed = len(done)
+    print(f"\n{update_id} updates injected over {injected:.1f}s (target {args.rate}/s), "
+          f"{completed} completed in {elapsed:.1f}s -> {completed / elapsed:.1f} updates/s")
+    if update_id - completed:
+        print(f"{update_id - completed} updates still running after --drain-timeout")
+
+    print(f"\n{'kind':<10}{'n':>6}  {'first reply ms (p50/p90/p99/max)':<34}{'completion ms (p50/p90/p99/max)'}")
+    for kind in kinds:
+        print(f"{kind:<10}{len(completion[kind]):>6}  {percentiles(first_reply[kind]):<34}"
+              f"{percentiles(completion[kind])}")
+
+    lags = lag.samples or [0.0]
+    print(f"\nevent-loop lag ms: p50 {statistics.median(lags) * 1000:.1f}  "
+          f"p99 {sorted(lags)[int(0.99 * (len(lags) - 1))] * 1000:.1f}  max {max(lags) * 1000:.1f}")
+    print(f"Bot API calls: {dict(request.calls)}")
+    errors = sum(text.startswith("❌") for replies in request.replies.values() for _, _, text in replies)
+    stopped = sum(text.startswith("⏹") for replies in request.replies.values() for _, _, text in replies)
+    print(f"Error replies: {errors}, superseded notes: {stopped}")
+    limiter = app.bot.rate_limiter
+    if limiter is not None:
+        for lane, lane_stats in limiter.stats()["lanes"].items():
+            print(f"Telegram lane {lane}: sent {lane_stats['sent']}, retried {lane_stats['retried']}, "
+                  f"wait ms p50 {lane_stats['wait_p50'] * 1000:.0f} p95 {lane_stats['wait_p95'] * 1000:.0f} "
+                  f"max {lane_stats['wait_max'] * 1000:.0f}")
+    print(f"LaTeX render: workers {render['workers']}, tiles {render['rendered']}, "
+          f"rejected {render['rejected']}, timeouts {render['timeouts']}, "
+          f"queue wait ms p50 {render['queue_wait']['p50'] * 1000:.0f} p95 {render['queue_wait']['p95'] * 1000:.0f}, "
+          f"render ms p50 {render['render_time']['p50'] * 1000:.0f} p95 {render['render_time']['p95'] * 1000:.0f}")
+    cache = render["cache"]
+    print(f"Tile cache: hits {cache['hits']}, disk hits {cache['disk_hits']}, misses {cache['misses']}, "
+          f"coalesced {cache['coalesced']}, {cache['memory_bytes'] // 1024} KiB in memory")
+    for name, backend in flow.items():
+        print(f"Phyxie backend {name}: limit {backend['limit']}, shed {backend['shed']}, "
+              f"rejected {backend['rejected']}, circuit {backend['state']}")
+    print(f"mock Dify: {mock.stats.requests}, peak streams {mock.stats.peak_streams}, "
+          f"errors injected {mock.stats.errors_injected}, drops {mock.stats.drops}, stops {mock.stats.stops}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=20.0, help="updates per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of arrivals")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--mix", default="text=0.55,math=0.2,photo=0.1,document=0.1,command=0.05")
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--token-rate", type=float, default=50.0)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--reply-mode", choices=("blocking", "streaming"), default=settings.reply_mode)
+    parser.add_argument("--tg-latency", type=float, default=0.03, help="simulated Bot API latency (s)")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,403 @@
+"""
+Self-contained mock of the Dify Service-API for offline load and latency tests.
+
+Serves `/chat-messages` (blocking and SSE streaming), `/files/upload`,
+`/conversations/{id}`, `/chat-messages/{task_id}/stop` and `/parameters`
+with configurable time-to-first-token, token rate, answer size, error
+injection and connection drops.
+
+    python -m benchmarks.mock_dify [--port 8900] [--ttft 0.3] [--token-rate 50]
+                                   [--answer-tokens 120] [--error-rate 0.01] [--drop-rate 0.01]
+
+then run the bot with `PHYXIE_API_BASE_URL=http://127.0.0.1:8900/v1`.
+`GET /_stats` returns counters and `PATCH /_config` changes any
+`MockConfig` field while the server is running.
+
+From code::
+
+    async with MockDify(MockConfig(ttft=0.1)) as mock:
+        settings.phyxie_api_base_url = mock.base_url
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import asdict, dataclass, field, fields
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+_PROSE = (
+    "the energy of a photon is proportional to its frequency so a shorter "
+    "wavelength means more energy per quantum and the photoelectric effect "
+    "shows that light behaves as particles when it ejects electrons"
+).split()
+
+_MATH = (
+    r"$E = h\nu$", r"$p = \frac{h}{\lambda}$", r"$\Delta x \Delta p \geq \frac{\hbar}{2}$",
+    r"$\vec F = m \vec a$", r"$\int_0^\infty e^{-x^2} dx = \frac{\sqrt{\pi}}{2}$",
+    "\n$$\\nabla \\cdot \\vec E = \\frac{\\rho}{\\varepsilon_0}$$\n",
+    r"$\sum_{n=1}^{\infty} \frac{1}{n^2} = \frac{\pi^2}{6}$", r"$x^2 + y^2 = r^2$",
+    r"$\alpha \approx 1/137$", r"$\psi(x,t)$",
+)
+
+
+@dataclass
+class MockConfig:
+    """Behaviour of the mock; every field can be changed at runtime."""
+    ttft: float = 0.3                  # seconds before the first answer token
+    token_rate: float = 50.0           # answer tokens per second (0 = as fast as possible)
+    answer_tokens: int = 120           # tokens per answer
+    math_ratio: float = 0.0            # share of tokens that are LaTeX (queries containing "math" use 0.2)
+    error_rate: float = 0.0            # share of chat/upload requests answered with an error
+    error_statuses: Tuple[int, ...] = (500, 502, 503, 429)
+    retry_after: Optional[float] = 1.0  # Retry-After sent with injected 429/503
+    drop_rate: float = 0.0             # share of chat requests whose connection is dropped
+    drop_after_tokens: int = 5         # streamed tokens before a drop
+    upload_latency: float = 0.05       # seconds added to every upload
+    max_upload_bytes: int = 15 * 1024 * 1024
+    api_key: Optional[str] = None      # require this bearer token when set
+    seed: Optional[int] = None
+
+
+@dataclass
+class MockStats:
+    requests: Dict[str, int] = field(default_factory=dict)
+    errors_injected: int = 0
+    drops: int = 0
+    stops: int = 0
+    active_streams: int = 0
+    peak_streams: int = 0
+    tokens_sent: int = 0
+    bytes_uploaded: int = 0
+
+
+class MockDify:
+    """aiohttp application emulating one Dify chat app."""
+
+    def __init__(self, config: Optional[MockConfig] = None) -> None:
+        self.config = config or MockConfig()
+        self.stats = MockStats()
+        self.rng = random.Random(self.config.seed)
+        self.conversations: Dict[str, Dict] = {}
+        self.uploads: Dict[str, Dict] = {}
+        self.tasks: Dict[str, asyncio.Event] = {}
+        self.base_url = ""
+        self._runner: Optional[web.AppRunner] = None
+
+    # ----------------------------------------------------------------- #
+    #  Lifecycle                                                        #
+    # ----------------------------------------------------------------- #
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=self.config.max_upload_bytes + 1024 * 1024)
+        app.router.add_post("/v1/chat-messages", self.chat_messages)
+        app.router.add_post("/v1/chat-messages/{task_id}/stop", self.stop)
+        app.router.add_post("/v1/files/upload", self.upload)
+        app.router.add_delete("/v1/conversations/{conversation_id}", self.delete_conversation)
+        app.router.add_get("/v1/parameters", self.parameters)
+        app.router.add_get("/_stats", self.get_stats)
+        app.router.add_patch("/_config", self.patch_config)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving; `port=0` picks a free port. Returns the API base URL."""
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}/v1"
+        return self.base_url
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "MockDify":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    # ----------------------------------------------------------------- #
+    #  Helpers                                                          #
+    # ----------------------------------------------------------------- #
+
+    def _count(self, name: str) -> None:
+        self.stats.requests[name] = self.stats.requests.get(name, 0) + 1
+
+    @staticmethod
+    def _error(status: int, code: str, message: str, headers: Optional[Dict] = None) -> web.Response:
+        return web.json_response({"code": code, "message": message, "status": status},
+                                 status=status, headers=headers)
+
+    def _check_auth(self, request: web.Request) -> Optional[web.Response]:
+        if self.config.api_key and request.headers.get("Authorization") != f"Bearer {self.config.api_key}":
+            return self._error(401, "unauthorized", "Access token is invalid")
+        return None
+
+    def _injected_error(self) -> Optional[web.Response]:
+        if self.rng.random() >= self.config.error_rate:
+            return None
+        self.stats.errors_injected += 1
+        status = self.rng.choice(self.config.error_statuses)
+        headers = None
+        if status in (429, 503) and self.config.retry_after is not None:
+            headers = {"Retry-After": str(int(self.config.retry_after))}
+        return self._error(status, "injected_error", f"Injected {status}", headers)
+
+    def _tokens(self, query: str) -> List[str]:
+        math_ratio = 0.2 if "math" in query.lower() else self.config.math_ratio
+        rng = random.Random(self.rng.random())
+        tokens = []
+        for _ in range(self.config.answer_tokens):
+            if rng.random() < math_ratio:
+                tokens.append(" " + rng.choice(_MATH) + " ")
+            else:
+                tokens.append(rng.choice(_PROSE) + " ")
+        return tokens
+
+    async def _pace(self, index: int, started: float) -> None:
+        """Sleep until token `index` is due."""
+        due = started + self.config.ttft
+        if self.config.token_rate > 0:
+            due += index / self.config.token_rate
+        delay = due - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    # ----------------------------------------------------------------- #
+    #  Endpoints                                                        #
+    # ----------------------------------------------------------------- #
+
+    async def chat_messages(self, request: web.Request) -> web.StreamResponse:
+        self._count("chat_messages")
+        started = time.monotonic()
+        if (denied := self._check_auth(request)) is not None:
+            return denied
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            return self._error(400, "invalid_param", "Request body must be JSON")
+
+        user = body.get("user")
+        query = body.get("query")
+        if not user or query is None:
+            return self._error(400, "invalid_param", "query and user are required")
+
+        conversation_id = body.get("conversation_id") or ""
+        if conversation_id:
+            conversation = self.conversations.get(conversation_id)
+            if conversation is None or conversation["user"] != user:
+                return self._error(404, "not_found", "Conversation Not Exists.")
+        else:
+            conversation_id = str(uuid.uuid4())
+            self.conversations[conversation_id] = {"user": user, "messages": 0, "created_at": int(time.time())}
+
+        for f in body.get("files") or []:
+            if f.get("transfer_method") == "local_file" and f.get("upload_file_id") not in self.uploads:
+                return self._error(400, "invalid_param", "Invalid upload file id")
+
+        if (injected := self._injected_error()) is not None:
+            return injected
+
+        self.conversations[conversation_id]["messages"] += 1
+        task_id, message_id = str(uuid.uuid4()), str(uuid.uuid4())
+        drop = self.rng.random() < self.config.drop_rate
+        tokens = self._tokens(query)
+
+        if body.get("response_mode") == "streaming":
+            return await self._stream(request, tokens, task_id, message_id, conversation_id, started, drop)
+
+        if drop:
+            self.stats.drops += 1
+            await asyncio.sleep(self.config.ttft)
+            request.transport.close()
+            return web.Response(status=500)
+
+        await self._pace(len(tokens), started)
+        self.stats.tokens_sent += len(tokens)
+        return web.json_response({
+            "event": "message",
+            "task_id": task_id,
+            "id": message_id,
+            "message_id": message_id,
+            "conversation_id": conversation_id,
+            "mode": "chat",
+            "answer": "".join(tokens),
+            "metadata": {"usage": self._usage(len(tokens))},
+            "created_at": int(time.time()),
+        })
+
+    async def _stream(self, request: web.Request, tokens: List[str], task_id: str, message_id: str,
+                      conversation_id: str, started: float, drop: bool) -> web.StreamResponse:
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await resp.prepare(request)
+
+        stop = self.tasks[task_id] = asyncio.Event()
+        self.stats.active_streams += 1
+        self.stats.peak_streams = max(self.stats.peak_streams, self.stats.active_streams)
+        ids = {"task_id": task_id, "message_id": message_id, "conversation_id": conversation_id}
+        created_at = int(time.time())
+        sent = 0
+        try:
+            await resp.write(b"event: ping\n\n")
+            for index, token in enumerate(tokens):
+                await self._pace(index, started)
+                if stop.is_set():
+                    break
+                if drop and index >= self.config.drop_after_tokens:
+                    self.stats.drops += 1
+                    request.transport.close()
+                    return resp
+                frame = {"event": "message", "id": message_id, "answer": token, "created_at": created_at, **ids}
+                await resp.write(b"data: " + json.dumps(frame).encode() + b"\n\n")
+                sent += 1
+
+            end = {"event": "message_end", "id": message_id, "metadata": {"usage": self._usage(sent)}, **ids}
+            await resp.write(b"data: " + json.dumps(end).encode() + b"\n\n")
+            await resp.write_eof()
+        except ConnectionResetError:
+            # Client went away (e.g. a superseded generation); nothing to send.
+            pass
+        finally:
+            self.stats.tokens_sent += sent
+            self.stats.active_streams -= 1
+            self.tasks.pop(task_id, None)
+        return resp
+
+    @staticmethod
+    def _usage(completion_tokens: int) -> Dict:
+        return {"prompt_tokens": 100, "completion_tokens": completion_tokens,
+                "total_tokens": 100 + completion_tokens}
+
+    async def stop(self, request: web.Request) -> web.Response:
+        self._count("stop")
+        if (denied := self._check_auth(request)) is not None:
+            return denied
+        event = self.tasks.get(request.match_info["task_id"])
+        if event is not None:
+            event.set()
+            self.stats.stops += 1
+        return web.json_response({"result": "success"})
+
+    async def upload(self, request: web.Request) -> web.Response:
+        self._count("upload")
+        started = time.monotonic()
+        if (denied := self._check_auth(request)) is not None:
+            return denied
+
+        reader = await request.multipart()
+        filename, mime_type, size, user = None, None, 0, None
+        async for part in reader:
+            if part.name == "file":
+                filename = part.filename
+                mime_type = part.headers.get("Content-Type", "application/octet-stream")
+                while chunk := await part.read_chunk(64 * 1024):
+                    size += len(chunk)
+                    if size > self.config.max_upload_bytes:
+                        return self._error(413, "file_too_large", "File size exceeded")
+            elif part.name == "user":
+                user = (await part.read()).decode()
+
+        if not filename or not user:
+            return self._error(400, "no_file_uploaded", "Please upload your file")
+        if (injected := self._injected_error()) is not None:
+            return injected
+
+        delay = started + self.config.upload_latency - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        self.stats.bytes_uploaded += size
+        upload_id = str(uuid.uuid4())
+        upload = {
+            "id": upload_id,
+            "name": filename,
+            "size": size,
+            "extension": filename.rsplit(".", 1)[-1] if "." in filename else "",
+            "mime_type": mime_type,
+            "created_by": user,
+            "created_at": int(time.time()),
+        }
+        self.uploads[upload_id] = upload
+        return web.json_response(upload, status=201)
+
+    async def delete_conversation(self, request: web.Request) -> web.Response:
+        self._count("delete_conversation")
+        if (denied := self._check_auth(request)) is not None:
+            return denied
+        body = await request.json() if request.can_read_body else {}
+        conversation = self.conversations.get(request.match_info["conversation_id"])
+        if conversation is None or conversation["user"] != body.get("user"):
+            return self._error(404, "not_found", "Conversation Not Exists.")
+        del self.conversations[request.match_info["conversation_id"]]
+        return web.Response(status=204)
+
+    async def parameters(self, request: web.Request) -> web.Response:
+        self._count("parameters")
+        if (denied := self._check_auth(request)) is not None:
+            return denied
+        return web.json_response({"opening_statement": "", "file_upload": {"image": {"enabled": True}}})
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({**asdict(self.stats), "conversations": len(self.conversations),
+                                  "uploads": len(self.uploads)})
+
+    async def patch_config(self, request: web.Request) -> web.Response:
+        changes = await request.json()
+        known = {f.name for f in fields(MockConfig)}
+        unknown = set(changes) - known
+        if unknown:
+            return self._error(400, "invalid_param", f"Unknown fields: {sorted(unknown)}")
+        for name, value in changes.items():
+            setattr(self.config, name, tuple(value) if isinstance(value, list) else value)
+        return web.json_response(asdict(self.config))
+
+
+async def serve(config: MockConfig, host: str, port: int) -> None:
+    mock = MockDify(config)
+    base_url = await mock.start(host, port)
+    print(f"Mock Dify listening; set PHYXIE_API_BASE_URL={base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await mock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    defaults = MockConfig()
+    parser.add_argument("--ttft", type=float, default=defaults.ttft)
+    parser.add_argument("--token-rate", type=float, default=defaults.token_rate)
+    parser.add_argument("--answer-tokens", type=int, default=defaults.answer_tokens)
+    parser.add_argument("--math-ratio", type=float, default=defaults.math_ratio)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--error-statuses", type=int, nargs="+", default=list(defaults.error_statuses))
+    parser.add_argument("--drop-rate", type=float, default=defaults.drop_rate)
+    parser.add_argument("--drop-after-tokens", type=int, default=defaults.drop_after_tokens)
+    parser.add_argument("--upload-latency", type=float, default=defaults.upload_latency)
+    parser.add_argument("--api-key", default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        ttft=args.ttft, token_rate=args.token_rate, answer_tokens=args.answer_tokens,
+        math_ratio=args.math_ratio, error_rate=args.error_rate, error_statuses=tuple(args.error_statuses),
+        drop_rate=args.drop_rate, drop_after_tokens=args.drop_after_tokens,
+        upload_latency=args.upload_latency, api_key=args.api_key, seed=args.seed,
+    )
+    try:
+        asyncio.run(serve(config, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,165 @@
+"""Synthetic Dify traffic shaped like recorded production responses."""
+
+from __future__ import annotations
+
+import json
+import random
+import uuid
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+_WORDS = (
+    "the energy of a photon is proportional to its frequency so that "
+    "$E = h\\nu$ where $h$ is Planck's constant and momentum follows "
+    "from $p = E / c$ which gives the de Broglie wavelength $\\lambda = h/p$ "
+    "für Elektronen — λ ≈ 0.1 nm at typical accelerating voltages"
+).split()
+
+
+def _answer_piece(rng: random.Random) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(rng.randint(1, 4))) + " "
+
+
+def dify_stream(size_bytes: int = 4 * 1024 * 1024, chunk_size: int = 1400,
+                seed: int = 7, crlf: bool = False) -> List[bytes]:
+    """
+    Return an SSE body of roughly `size_bytes`, split into network-sized
+    chunks the way aiohttp hands them to us.
+    """
+    rng = random.Random(seed)
+    task_id, message_id, conversation_id = (str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(3))
+    nl = "\r\n" if crlf else "\n"
+
+    parts: List[str] = []
+    total = 0
+    created = 1_705_395_332
+    while total < size_bytes:
+        if rng.random() < 0.01:
+            frame = f"event: ping{nl}{nl}"
+        else:
+            frame = "data: " + json.dumps({
+                "event": "message",
+                "task_id": task_id,
+                "id": message_id,
+                "message_id": message_id,
+                "conversation_id": conversation_id,
+                "answer": _answer_piece(rng),
+                "created_at": created,
+            }, ensure_ascii=False) + nl + nl
+        parts.append(frame)
+        total += len(frame)
+
+    parts.append("data: " + json.dumps({
+        "event": "message_end",
+        "task_id": task_id,
+        "id": message_id,
+        "message_id": message_id,
+        "conversation_id": conversation_id,
+        "metadata": {"usage": {"prompt_tokens": 1033, "completion_tokens": 128, "total_tokens": 1161}},
+    }) + nl + nl)
+
+    body = "".join(parts).encode()
+    return [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+
+def dify_blocking_response(answer_chars: int = 2000, seed: int = 7) -> Dict:
+    """Return a blocking-mode `/chat-messages` response body."""
+    rng = random.Random(seed)
+    answer = ""
+    while len(answer) < answer_chars:
+        answer += _answer_piece(rng)
+    return {
+        "event": "message",
+        "task_id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "message_id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "conversation_id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "mode": "chat",
+        "answer": answer,
+        "metadata": {
+            "usage": {"prompt_tokens": 1033, "completion_tokens": 512, "total_tokens": 1545,
+                      "latency": 1.56, "currency": "USD", "total_price": "0.0012"},
+            "retriever_resources": [
+                {"position": 1, "dataset_name": "physics", "score": 0.98,
+                 "content": answer[:300]},
+            ],
+        },
+        "created_at": 1_705_407_629,
+    }
+
+
+def load_recording(path: Optional[str], chunk_size: int = 1400) -> Optional[List[bytes]]:
+    """Load a captured SSE body from disk, split into network-sized chunks."""
+    if not path:
+        return None
+    body = Path(path).read_bytes()
+    return [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+
+# Inline math as it shows up in answers: mostly symbols and short
+# formulas, some that only an image can show.
+_SIMPLE_INLINE = (
+    r"$x^2$", r"$\alpha$", r"$E = h\nu$", r"$p = \frac{h}{\lambda}$", r"$v = 3\times10^8\,\text{m/s}$",
+    r"$\lambda$", r"$K_{max} = h\nu - \phi$", r"$F = -kx$", r"$\Delta x \Delta p \geq \frac{\hbar}{2}$",
+    r"$\theta$", r"$30^\circ$", r"$\vec F = m \vec a$", r"\(\omega = 2\pi f\)", r"$T = \frac{1}{f}$",
+)
+_COMPLEX_INLINE = (
+    r"$\int_0^\infty e^{-x^2} dx$", r"$\sum_{n=1}^{\infty} \frac{1}{n^2}$", r"$\mathbf{E}$",
+    r"$Q_{enc}$", r"$\frac{\frac{a}{b}}{c}$", r"$e^{i\omega t}$",
+)
+_DISPLAY = (
+    "$$\\nabla \\cdot \\vec E = \\frac{\\rho}{\\varepsilon_0}$$",
+    "\\[ \\lambda = \\frac{h}{\\sqrt{2 m_e e V}} \\]",
+    "$$\\oint \\vec B \\cdot d\\vec l = \\mu_0 I_{enc}$$",
+)
+
+
+def physics_answers(count: int = 1000, seed: int = 7) -> List[str]:
+    """
+    Return synthetic tutor answers: plain prose, prose with simple or
+    complex inline math, and answers with display equations, in roughly
+    the proportions seen in production (60% with some math, a third of
+    those with a display equation).
+    """
+    rng = random.Random(seed)
+    prose = [word for word in _WORDS if word.isalpha()]
+    answers = []
+    for _ in range(count):
+        sentences = []
+        roll = rng.random()
+        for _ in range(rng.randint(2, 6)):
+            sentence = " ".join(rng.choice(prose) for _ in range(rng.randint(6, 14)))
+            if roll >= 0.4 and rng.random() < 0.5:
+                pool = _COMPLEX_INLINE if roll < 0.5 and rng.random() < 0.5 else _SIMPLE_INLINE
+                sentence += f" {rng.choice(pool)}"
+            sentences.append(sentence[0].upper() + sentence[1:] + ".")
+        if roll >= 0.8:
+            sentences.insert(rng.randint(1, len(sentences)), f"\n\n{rng.choice(_DISPLAY)}\n\n")
+        answers.append(" ".join(sentences))
+    return answers
+
+
+def load_answers(path: str) -> Iterator[str]:
+    """
+    Yield the answers in a replay corpus: JSON lines with an `answer`
+    field (a Dify `/messages` export), or a raw SSE body captured from
+    Dify, whose `message` deltas are joined per message id.
+    """
+    text = Path(path).read_text(encoding="utf-8")
+    if not text.lstrip().startswith(("data:", "event:")):
+        for line in text.splitlines():
+            if line.strip():
+                yield json.loads(line)["answer"]
+        return
+
+    answers: Dict[str, List[str]] = {}
+    for line in text.splitlines():
+        if not line.startswith("data:"):
+            continue
+        event = json.loads(line[5:])
+        if event.get("event") in ("message", "agent_message"):
+            answers.setdefault(event["message_id"], []).append(event.get("answer", ""))
+        elif event.get("event") == "message_replace":
+            answers[event["message_id"]] = [event.get("answer", "")]
+    for parts in answers.values():
+        yield "".join(parts)
@@ -1,15 +1,24 @@
 """Main bot class."""
 
+import asyncio
+from typing import Optional
+
 import structlog
 from telegram import Update, BotCommand
 from telegram.ext import (
     Application, CommandHandler, MessageHandler,
     filters, ContextTypes
 )
+from telegram.request import BaseRequest
 
 from config.settings import settings
 from bot.services.conversation_manager import ConversationManager
+from bot.services.photo_cache import PhotoCache
 from bot.services.phyxie_service import PhyxieService
+from bot.services.rate_limiter import TelegramRateLimiter
+from bot.services.render_service import RenderService
+from bot.services.update_processor import ChatOrderedUpdateProcessor
+from bot.services.webhook import run_webhook
 from bot.handlers.command_handlers import CommandHandlers
 from bot.handlers.message_handlers import MessageHandlers
 from bot.handlers.file_handlers import FileHandlers
@@ -20,10 +29,17 @@ logger = structlog.get_logger(__name__)
 class PhyxieBot:
     """Main bot class."""
 
-    def __init__(self):
+    def __init__(
+            self,
+            request: Optional[BaseRequest] = None,
+            get_updates_request: Optional[BaseRequest] = None,
+    ):
+        """`request`/`get_updates_request` replace PTB's HTTP clients (e.g. in load tests)."""
         self.token = settings.telegram_bot_token
         self.conversation_manager = ConversationManager()
         self.phyxie_service = PhyxieService()
+        self.photo_cache = PhotoCache()
+        self.render_service = RenderService()
 
         # Initialize handlers
         self.command_handlers = CommandHandlers(
@@ -32,7 +48,9 @@ class PhyxieBot:
         )
         self.message_handlers = MessageHandlers(
             self.conversation_manager,
-            self.phyxie_service
+            self.phyxie_service,
+            self.photo_cache,
+            self.render_service,
         )
         self.file_handlers = FileHandlers(
             self.conversation_manager,
@@ -40,9 +58,43 @@ class PhyxieBot:
         )
 
         # Build application
-        self.application = Application.builder().token(self.token).build()
+        builder = Application.builder().token(self.token)
+        if request is not None:
+            builder = builder.request(request)
+        if get_updates_request is not None:
+            builder = builder.get_updates_request(get_updates_request)
+        if settings.telegram_rate_limit:
+            builder = builder.rate_limiter(TelegramRateLimiter())
+        if settings.update_concurrency > 1:
+            builder = builder.concurrent_updates(
+                ChatOrderedUpdateProcessor(on_arrival=self._supersede_generation)
+            )
+        self.application = builder.build()
         self._setup_handlers()
 
+    def _supersede_generation(self, update: object) -> None:
+        """Stop the user's running answer when a newer request arrives."""
+        if not settings.supersede_generations or not isinstance(update, Update):
+            return
+
+        message = update.message
+        user = update.effective_user
+        if message is None or user is None:
+            return
+
+        text = message.text or ""
+        if text.startswith("/"):
+            reason = text.split()[0].split("@")[0]
+            if reason not in ("/new", "/clear"):
+                return
+        elif text or message.photo or message.document:
+            reason = "new_message"
+        else:
+            return
+
+        username = user.username or f"user_{user.id}"
+        self.phyxie_service.cancel_generation(username, reason=reason)
+
     def _setup_handlers(self):
         """Set up message handlers."""
 
@@ -65,7 +117,13 @@ class PhyxieBot:
         async def handle_document(update, context):
             return await self.file_handlers.handle_document(update, context)
 
+        reply_mode = settings.reply_mode.lower()
+        if reply_mode not in ("blocking", "streaming"):
+            raise ValueError(f"Unknown reply mode {reply_mode!r}; choose blocking or streaming")
+
         async def handle_text_message(update, context):
+            if reply_mode == "streaming":
+                return await self.message_handlers.handle_streaming_message(update, context)
             return await self.message_handlers.handle_text_message(update, context)
 
         # Register handlers
@@ -112,20 +170,34 @@ class PhyxieBot:
 
     async def post_init(self, application: Application) -> None:
         """Initialize the bot after application is built."""
+        await self.phyxie_service.start()
+        await self.render_service.start()
         await self._set_bot_commands()
         logger.info("Bot commands set successfully")
 
-    def run(self):
-        """Run the bot."""
-        logger.info("Starting Phyxie Telegram Bot...")
+    async def post_shutdown(self, application: Application) -> None:
+        """Release shared resources once the application has stopped."""
+        await self.phyxie_service.close()
+        self.photo_cache.close()
+        await self.render_service.close()
 
-        # Add post init
-        self.application.post_init = self.post_init
+    def run(self, mode: Optional[str] = None):
+        """Run the bot with long polling or, for `mode="webhook"`, the embedded webhook server."""
+        mode = (mode or settings.bot_mode).lower()
+        if mode not in ("polling", "webhook"):
+            raise ValueError(f"Unknown bot mode {mode!r}; choose polling or webhook")
+        logger.info("Starting Phyxie Telegram Bot...", mode=mode)
 
-        # Initialize bot
-        self.application.run_polling(
-            allowed_updates=Update.ALL_TYPES,
-            drop_pending_updates=True
-        )
+        # Add lifecycle hooks
+        self.application.post_init = self.post_init
+        self.application.post_shutdown = self.post_shutdown
+
+        if mode == "webhook":
+            asyncio.run(run_webhook(self.application))
+        else:
+            self.application.run_polling(
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True
+            )
 
         logger.info("Bot stopped")
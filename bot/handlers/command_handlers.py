@@ -8,6 +8,7 @@ from bot.utils.decorators import log_command
 from bot.utils.helpers import format_welcome_message, format_help_message
 from bot.services.conversation_manager import ConversationManager
 from bot.services.phyxie_service import PhyxieService
+from bot.services.rate_limiter import Priority
 
 logger = structlog.get_logger(__name__)
 
@@ -19,6 +20,16 @@ class CommandHandlers:
         self.conversation_manager = conversation_manager
         self.phyxie_service = phyxie_service
 
+    @staticmethod
+    async def _reply(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, **kwargs) -> None:
+        """
+        Answer a command ahead of queued answers. Only bot methods accept
+        `rate_limit_args`, and only when a rate limiter is installed.
+        """
+        if context.bot.rate_limiter is not None:
+            kwargs["rate_limit_args"] = Priority.HIGH
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=text, **kwargs)
+
     @log_command
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle /start command."""
@@ -26,7 +37,7 @@ class CommandHandlers:
         username = user.username or f"user_{user.id}"
 
         welcome_message = format_welcome_message(username)
-        await update.message.reply_text(welcome_message)
+        await self._reply(update, context, welcome_message)
 
     @log_command
     async def new_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -38,7 +49,8 @@ class CommandHandlers:
         # Create new conversation
         conversation = self.conversation_manager.create_new_conversation(user_id, username)
 
-        await update.message.reply_text(
+        await self._reply(
+            update, context,
             f"✨ New conversation started!\n\n"
             f"Send me your first message to begin chatting.\n"
             f"You can send text, images, or documents."
@@ -68,20 +80,23 @@ class CommandHandlers:
                 # Create new conversation placeholder
                 new_conversation = self.conversation_manager.create_new_conversation(user_id, username)
 
-                await update.message.reply_text(
+                await self._reply(
+                    update, context,
                     f"🗑️ Previous conversation cleared!\n\n"
                     f"✨ Ready to start fresh!\n"
                     f"Send me a message to begin a new conversation."
                 )
             except Exception as e:
                 logger.error("Failed to clear conversation", error=str(e))
-                await update.message.reply_text(
+                await self._reply(
+                    update, context,
                     "❌ Failed to clear conversation. Please try again."
                 )
         else:
             # No existing conversation, just create new one
             new_conversation = self.conversation_manager.create_new_conversation(user_id, username)
-            await update.message.reply_text(
+            await self._reply(
+                update, context,
                 f"✨ Ready to start!\n"
                 f"Send me a message to begin a new conversation."
             )
@@ -90,4 +105,4 @@ class CommandHandlers:
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle /help command."""
         help_message = format_help_message()
-        await update.message.reply_text(help_message, parse_mode="MarkdownV2")
+        await self._reply(update, context, help_message, parse_mode="MarkdownV2")
@@ -1,13 +1,14 @@
 """File handlers for the bot."""
 
-import io
 import structlog
 from telegram import Update, PhotoSize, Document
 from telegram.ext import ContextTypes
+from telegram.error import RetryAfter
 
 from bot.models.schemas import ChatMessage, FileUpload, TransferMethod
 from bot.services.conversation_manager import ConversationManager
-from bot.services.phyxie_service import PhyxieService, PhyxieAPIError
+from bot.services.file_relay import FileRelay, TelegramDownloadError
+from bot.services.phyxie_service import PhyxieService, PhyxieAPIError, PhyxieCancelledError, PhyxieOverloadedError
 from bot.utils.decorators import typing_action
 from config.settings import settings
 from bot.utils.helpers import (
@@ -24,6 +25,7 @@ class FileHandlers:
     def __init__(self, conversation_manager: ConversationManager, phyxie_service: PhyxieService):
         self.conversation_manager = conversation_manager
         self.phyxie_service = phyxie_service
+        self.file_relay = FileRelay(phyxie_service)
 
     @typing_action
     async def handle_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -40,29 +42,26 @@ class FileHandlers:
         caption = update.message.caption or "Analyze this image"
 
         try:
-            # Download photo
-            file = await context.bot.get_file(photo.file_id)
-            file_data = io.BytesIO()
-            await file.download_to_memory(file_data)
-            file_data.seek(0)
-
             # Generate filename
             filename = f"photo_{photo.file_unique_id}.jpg"
 
-            # Upload to Phyxie
+            # Stream from Telegram to Phyxie (or reuse an earlier upload)
             await update.message.reply_text("📤 Uploading image...")
 
-            upload_response = await self.phyxie_service.upload_file(
-                file_data.read(),
+            upload_file_id = await self.file_relay.upload(
+                context.bot,
+                photo.file_id,
+                photo.file_unique_id,
                 filename,
-                username
+                username,
+                conversation.conversation_id
             )
 
             # Create file upload object
             file_upload = FileUpload(
                 type=get_file_type(filename),
                 transfer_method=TransferMethod.LOCAL_FILE,
-                upload_file_id=upload_response.id
+                upload_file_id=upload_file_id
             )
 
             # Send message with file
@@ -73,7 +72,7 @@ class FileHandlers:
                 files=[file_upload]
             )
 
-            response = await self.phyxie_service.send_message(chat_message)
+            response = await self.phyxie_service.complete_message(chat_message)
 
             # If this was the first message, update conversation ID
             if not conversation.conversation_id and response.conversation_id:
@@ -88,13 +87,30 @@ class FileHandlers:
             logger.info("Photo processed successfully",
                         user_id=user_id,
                         filename=filename,
-                        file_id=upload_response.id)
+                        file_id=upload_file_id)
 
+        except PhyxieCancelledError:
+            logger.info("Generation superseded by a newer request", user_id=user_id)
+            await update.message.reply_text("⏹ Stopped: answering your newer message instead.")
+        except PhyxieOverloadedError as e:
+            logger.warning("Phyxie overloaded, request shed", error=str(e))
+            await update.message.reply_text(
+                "⏳ I'm handling a lot of requests right now. Please try again in a moment."
+            )
+        except TelegramDownloadError as e:
+            logger.warning("Telegram file download failed", error=str(e))
+            await update.message.reply_text(
+                "❌ I couldn't download your image from Telegram. Please send it again."
+            )
         except PhyxieAPIError as e:
             logger.error("Failed to process photo", error=str(e))
+            self.file_relay.forget(photo.file_unique_id, username, conversation.conversation_id)
             await update.message.reply_text(
                 "❌ Failed to process the image. Please try again."
             )
+        except RetryAfter as e:
+            # The rate limiter already waited and retried; another reply would be throttled too.
+            logger.warning("Telegram flood control; reply dropped", user_id=user_id, error=str(e))
         except Exception as e:
             logger.error("Unexpected error", error=str(e), exc_info=True)
             await update.message.reply_text(
@@ -130,28 +146,25 @@ class FileHandlers:
             return
 
         try:
-            # Download document
-            file = await context.bot.get_file(document.file_id)
-            file_data = io.BytesIO()
-            await file.download_to_memory(file_data)
-            file_data.seek(0)
-
-            # Upload to Phyxie
+            # Stream from Telegram to Phyxie (or reuse an earlier upload)
             await update.message.reply_text(
                 f"📤 Uploading {document.file_name} ({format_file_size(document.file_size)})..."
             )
 
-            upload_response = await self.phyxie_service.upload_file(
-                file_data.read(),
+            upload_file_id = await self.file_relay.upload(
+                context.bot,
+                document.file_id,
+                document.file_unique_id,
                 document.file_name,
-                username
+                username,
+                conversation.conversation_id
             )
 
             # Create file upload object
             file_upload = FileUpload(
                 type=get_file_type(document.file_name),
                 transfer_method=TransferMethod.LOCAL_FILE,
-                upload_file_id=upload_response.id
+                upload_file_id=upload_file_id
             )
 
             # Send message with file
@@ -162,7 +175,7 @@ class FileHandlers:
                 files=[file_upload]
             )
 
-            response = await self.phyxie_service.send_message(chat_message)
+            response = await self.phyxie_service.complete_message(chat_message)
 
             # If this was the first message, update conversation ID
             if not conversation.conversation_id and response.conversation_id:
@@ -177,14 +190,31 @@ class FileHandlers:
             logger.info("Document processed successfully",
                         user_id=user_id,
                         filename=document.file_name,
-                        file_id=upload_response.id,
+                        file_id=upload_file_id,
                         file_size=document.file_size)
 
+        except PhyxieCancelledError:
+            logger.info("Generation superseded by a newer request", user_id=user_id)
+            await update.message.reply_text("⏹ Stopped: answering your newer message instead.")
+        except PhyxieOverloadedError as e:
+            logger.warning("Phyxie overloaded, request shed", error=str(e))
+            await update.message.reply_text(
+                "⏳ I'm handling a lot of requests right now. Please try again in a moment."
+            )
+        except TelegramDownloadError as e:
+            logger.warning("Telegram file download failed", error=str(e))
+            await update.message.reply_text(
+                "❌ I couldn't download your file from Telegram. Please send it again."
+            )
         except PhyxieAPIError as e:
             logger.error("Failed to process document", error=str(e))
+            self.file_relay.forget(document.file_unique_id, username, conversation.conversation_id)
             await update.message.reply_text(
                 "❌ Failed to process the document. Please try again."
             )
+        except RetryAfter as e:
+            # The rate limiter already waited and retried; another reply would be throttled too.
+            logger.warning("Telegram flood control; reply dropped", user_id=user_id, error=str(e))
         except Exception as e:
             logger.error("Unexpected error", error=str(e), exc_info=True)
             await update.message.reply_text(
@@ -1,17 +1,25 @@
 """Message handlers for the bot."""
 
+import io
 import structlog
-import re
+from typing import List, Optional
+
 from telegram import Update
 from telegram.ext import ContextTypes
-from telegram.error import BadRequest
+from telegram.error import BadRequest, RetryAfter
 
-from bot.models.schemas import ChatMessage
+from bot.models.schemas import ChatMessage, StreamEventType
 from bot.services.conversation_manager import ConversationManager
-from bot.services.phyxie_service import PhyxieService, PhyxieAPIError
+from bot.services.photo_cache import PhotoCache
+from bot.services.render_service import RenderError, RenderService
+from bot.services.phyxie_service import PhyxieService, PhyxieAPIError, PhyxieCancelledError, PhyxieOverloadedError
+from bot.services.stream_reply import StreamingReply
 from bot.utils.decorators import typing_action
-from bot.utils.helpers import truncate_text, escape_markdown
-from bot.utils.latex_render import MarkdownMathTiler
+from bot.utils.helpers import truncate_text, format_markdown_v2
+from bot.utils.markdown_lexer import contains_math
+from bot.utils.media import reply_photos
+from bot.utils.unicode_math import simplify_inline_math
+from config.settings import settings
 
 logger = structlog.get_logger(__name__)
 
@@ -21,12 +29,32 @@ logger = structlog.get_logger(__name__)
 class MessageHandlers:
     """Handlers for text messages."""
 
-    def __init__(self, conversation_manager: ConversationManager, phyxie_service: PhyxieService):
+    def __init__(
+            self,
+            conversation_manager: ConversationManager,
+            phyxie_service: PhyxieService,
+            photo_cache: Optional[PhotoCache] = None,
+            render_service: Optional[RenderService] = None,
+    ):
         self.conversation_manager = conversation_manager
         self.phyxie_service = phyxie_service
+        self.photo_cache = PhotoCache() if photo_cache is None else photo_cache
+        # Not started, a RenderService draws inline; PhyxieBot starts its worker pool.
+        self.render_service = RenderService() if render_service is None else render_service
 
     def contains_math(self, answer):
-        return bool(re.search(r'(\$.*?\$|\\\[.*?\\\]|\\\(.*?\\\)|\\begin\{.*?\})', answer, re.DOTALL))
+        return contains_math(answer)
+
+    def simplify_math(self, answer: str) -> str:
+        """
+        Rewrite simple inline math (`$x^2$`, `$\\alpha$`, `$h/p$`) as Unicode,
+        so the answer goes out as text instead of rendered images. Answers
+        with any math that needs rendering are returned unchanged.
+        """
+        if not settings.math_unicode:
+            return answer
+        simplified = simplify_inline_math(answer)
+        return answer if simplified is None else simplified
 
     @typing_action
     async def handle_text_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -50,7 +78,7 @@ class MessageHandlers:
                 user=username,
                 conversation_id=conversation.conversation_id,
             )
-            response = await self.phyxie_service.send_message(chat_message)
+            response = await self.phyxie_service.complete_message(chat_message)
 
             # If this was the first message, store conversation_id
             if not conversation.conversation_id and response.conversation_id:
@@ -59,28 +87,16 @@ class MessageHandlers:
             # Update stats
             self.conversation_manager.increment_message_count(user_id)
 
-            answer = response.answer
+            answer = self.simplify_math(response.answer)
 
             # --- Decide how to present the answer -------------------
             contains_math = self.contains_math(answer)
-            if contains_math:
-                # Render LaTeX → image(s)
-                renderer = MarkdownMathTiler()
-                buffers = renderer.render(answer)
-                for buf in buffers:
-                    await update.message.reply_photo(photo=buf)
+            # Render LaTeX → image(s); plain text if there is none or rendering failed
+            tiles = await self._render_tiles(answer) if contains_math else None
+            if tiles:
+                await reply_photos(update.message, tiles, cache=self.photo_cache)
             else:
-                # Plain text response
-                text_to_send = truncate_text(answer)
-
-                try:
-                    await update.message.reply_text(
-                        escape_markdown(text_to_send),
-                        parse_mode="MarkdownV2",
-                    )
-                except BadRequest:
-                    # If Telegram still complains about entities, send as plain text
-                    await update.message.reply_text(text_to_send)
+                await self._send_text(update, answer)
 
             logger.info(
                 "Message processed successfully",
@@ -89,19 +105,36 @@ class MessageHandlers:
                 message_id=response.message_id,
             )
 
+        except PhyxieCancelledError:
+            logger.info("Generation superseded by a newer request", user_id=user_id)
+            await update.message.reply_text("⏹ Stopped: answering your newer message instead.")
+        except PhyxieOverloadedError as e:
+            logger.warning("Phyxie overloaded, request shed", error=str(e))
+            await update.message.reply_text(
+                "⏳ I'm handling a lot of requests right now. Please try again in a moment."
+            )
         except PhyxieAPIError as e:
             logger.error("Phyxie API error", error=str(e))
             await update.message.reply_text(
                 "❌ Sorry, I couldn't process your message. Please try again."
             )
+        except RetryAfter as e:
+            # The rate limiter already waited and retried; another reply would be throttled too.
+            logger.warning("Telegram flood control; reply dropped", user_id=user_id, error=str(e))
         except Exception as e:
             logger.error("Unexpected error", error=str(e), exc_info=True)
             await update.message.reply_text(
                 "❌ An unexpected error occurred. Please try again later."
             )
 
+    @typing_action
     async def handle_streaming_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Handle text messages with streaming response."""
+        """
+        Like `handle_text_message`, but show the answer while it is being
+        generated: deltas go to a `StreamingReply`, which edits the reply
+        at a throttled pace and formats it once the answer is complete.
+        Answers with LaTeX math still end up as rendered images.
+        """
         user = update.effective_user
         user_id = str(user.id)
         username = user.username or f"user_{user.id}"
@@ -110,58 +143,103 @@ class MessageHandlers:
         # Get or create conversation
         conversation = self.conversation_manager.get_or_create_conversation(user_id, username)
 
-        # Send initial message
-        sent_message = await update.message.reply_text("💭 Thinking...")
-
+        reply = StreamingReply(update.message)
         try:
-            # Create chat message
+            await reply.start()
+
             chat_message = ChatMessage(
                 query=message_text,
                 user=username,
                 conversation_id=conversation.conversation_id
             )
 
-            # Stream response
-            full_answer = ""
             message_id = None
             conversation_id = None
 
-            async for chunk in self.phyxie_service.stream_message(chat_message):
-                if chunk.get("event") == "message":
-                    answer_chunk = chunk.get("answer", "")
-                    full_answer += answer_chunk
-                    conversation_id = chunk.get("conversation_id")
-
-                    # Update message periodically
-                    if len(full_answer) % 100 == 0:  # Update every 100 chars
-                        await sent_message.edit_text(truncate_text(full_answer))
-
-                elif chunk.get("event") == "message_end":
-                    message_id = chunk.get("message_id")
-                    conversation_id = chunk.get("conversation_id")
+            async for event in self.phyxie_service.stream_message(chat_message):
+                if event.is_answer:
+                    reply.feed(event.answer)
+                elif event.event == StreamEventType.MESSAGE_REPLACE:
+                    reply.replace(event.answer)
+                elif event.event == StreamEventType.MESSAGE_END:
+                    message_id = event.message_id
+                elif event.event == StreamEventType.ERROR:
+                    status = event.data.get("status")
+                    raise PhyxieAPIError(
+                        f"{status}: {event.data.get('message', 'stream error')}",
+                        status=status if isinstance(status, int) else None,
+                    )
+                else:
+                    continue
 
-                    # If this was the first message, update conversation ID
-                    if not conversation.conversation_id and conversation_id:
+                # If this was the first message, store conversation_id
+                if conversation_id is None and event.conversation_id:
+                    conversation_id = event.conversation_id
+                    if not conversation.conversation_id:
                         self.conversation_manager.update_conversation_id(user_id, conversation_id)
 
-                    # Update conversation stats
-                    self.conversation_manager.increment_message_count(user_id)
+            if not reply.text:
+                raise PhyxieAPIError("Stream ended without an answer")
 
-            # Final update
-            await sent_message.edit_text(truncate_text(full_answer))
+            # Update stats
+            self.conversation_manager.increment_message_count(user_id)
+
+            answer = self.simplify_math(reply.text)
+            tiles = await self._render_tiles(answer) if self.contains_math(answer) else None
+            if tiles:
+                await reply.discard()
+                await reply_photos(update.message, tiles, cache=self.photo_cache)
+            else:
+                if answer != reply.text:
+                    reply.replace(answer)
+                await reply.finish()
 
             logger.info("Streaming message processed successfully",
                         user_id=user_id,
                         conversation_id=conversation_id,
-                        message_id=message_id)
-
+                        message_id=message_id,
+                        edits=reply.edits)
+
+        except PhyxieCancelledError:
+            logger.info("Generation superseded by a newer request", user_id=user_id)
+            await reply.abort("⏹ Stopped: answering your newer message instead.")
+        except PhyxieOverloadedError as e:
+            logger.warning("Phyxie overloaded, request shed", error=str(e))
+            await reply.abort(
+                "⏳ I'm handling a lot of requests right now. Please try again in a moment."
+            )
         except PhyxieAPIError as e:
             logger.error("Phyxie API error", error=str(e))
-            await sent_message.edit_text(
+            await reply.abort(
                 "❌ Sorry, I couldn't process your message. Please try again."
             )
+        except RetryAfter as e:
+            # The rate limiter already waited and retried; another reply would be throttled too.
+            logger.warning("Telegram flood control; reply dropped", user_id=user_id, error=str(e))
         except Exception as e:
             logger.error("Unexpected error", error=str(e), exc_info=True)
-            await sent_message.edit_text(
+            await reply.abort(
                 "❌ An unexpected error occurred. Please try again later."
             )
+        finally:
+            await reply.close()
+
+    async def _render_tiles(self, answer: str) -> Optional[List[io.BytesIO]]:
+        """Render an answer with LaTeX math to image(s); None if rendering failed or is overloaded."""
+        try:
+            return await self.render_service.render(answer)
+        except RenderError as e:
+            logger.warning("LaTeX rendering failed, sending text instead", error=str(e))
+            return None
+
+    async def _send_text(self, update: Update, answer: str) -> None:
+        text_to_send = truncate_text(answer)
+
+        try:
+            await update.message.reply_text(
+                format_markdown_v2(text_to_send),
+                parse_mode="MarkdownV2",
+            )
+        except BadRequest:
+            # If Telegram still complains about entities, send as plain text
+            await update.message.reply_text(text_to_send)
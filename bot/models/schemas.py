@@ -72,6 +72,51 @@ class PhyxieResponse:
     created_at: int = 0
 
 
+class StreamEventType(str, Enum):
+    """Event types emitted by the streaming `/chat-messages` endpoint."""
+    MESSAGE = "message"
+    MESSAGE_END = "message_end"
+    MESSAGE_REPLACE = "message_replace"
+    MESSAGE_FILE = "message_file"
+    AGENT_MESSAGE = "agent_message"
+    AGENT_THOUGHT = "agent_thought"
+    ERROR = "error"
+    PING = "ping"
+
+
+@dataclass
+class StreamEvent:
+    """
+    One decoded chunk of a streaming Phyxie response.
+
+    `data` holds the raw payload; typed codecs may leave it empty for
+    plain answer deltas.
+    """
+    event: str
+    task_id: Optional[str] = None
+    message_id: Optional[str] = None
+    conversation_id: Optional[str] = None
+    answer: str = ""
+    data: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "StreamEvent":
+        """Build an event from a decoded SSE `data` payload."""
+        return cls(
+            event=data.get("event", StreamEventType.MESSAGE.value),
+            task_id=data.get("task_id"),
+            message_id=data.get("message_id"),
+            conversation_id=data.get("conversation_id"),
+            answer=data.get("answer") or "",
+            data=data,
+        )
+
+    @property
+    def is_answer(self) -> bool:
+        """True for events that carry a piece of the answer text."""
+        return self.event in (StreamEventType.MESSAGE, StreamEventType.AGENT_MESSAGE)
+
+
 @dataclass
 class FileUploadResponse:
     """File upload response."""
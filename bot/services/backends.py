@@ -0,0 +1,320 @@
+"""Routing of Phyxie calls across several Dify backends."""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Collection, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import structlog
+
+from bot.services.flow_control import CircuitBreaker, FlowControl
+from bot.services.transport import NETWORK_ERRORS, Transport
+from config.settings import settings
+
+logger = structlog.get_logger(__name__)
+
+
+class Backend:
+    """One Dify app endpoint with its own API key, weight and flow control."""
+
+    def __init__(self, name: str, base_url: str, api_key: str, weight: float, flow: FlowControl) -> None:
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.weight = weight
+        self.headers: Dict[str, str] = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        }
+        self.flow = flow
+        self.healthy = True
+        self.requests = 0
+        self._failed_checks = 0
+        self._passed_checks = 0
+
+    @property
+    def outstanding(self) -> int:
+        """Requests in flight or queued on this backend."""
+        return self.flow.limiter.inflight + self.flow.limiter.queued
+
+    @property
+    def available(self) -> bool:
+        """Whether new conversations may be routed here."""
+        return self.healthy and self.weight > 0 and self.flow.breaker.state != CircuitBreaker.OPEN
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}{path}"
+
+
+def parse_backends(spec: str) -> List[Dict]:
+    """
+    Parse `PHYXIE_BACKENDS`: comma-separated `[name=]url|api_key[|weight]`,
+    e.g. `a=https://x/v1|app-1|2,https://y/v1|app-2`. Unnamed backends are
+    called `<host>#<position>`.
+    """
+    backends = []
+    for index, entry in enumerate(e.strip() for e in spec.split(",")):
+        if not entry:
+            continue
+        name, sep, rest = entry.partition("=")
+        if not sep or "|" in name or "://" in name:
+            name, rest = "", entry
+        parts = [p.strip() for p in rest.split("|")]
+        if len(parts) not in (2, 3) or not parts[0] or not parts[1]:
+            raise ValueError(f"Invalid PHYXIE_BACKENDS entry: {entry!r}")
+        base_url, api_key = parts[0], parts[1]
+        backends.append({
+            "name": name.strip() or f"{urlparse(base_url).netloc}#{index}",
+            "base_url": base_url,
+            "api_key": api_key,
+            "weight": float(parts[2]) if len(parts) == 3 else 1.0,
+        })
+    return backends
+
+
+class LoadBalancer:
+    """
+    Pick a backend for each Phyxie call.
+
+    A conversation always goes back to the backend that created it, since
+    Dify conversations (and uploaded files) only exist there. Calls that
+    upload files or reference uploads pin the user to their backend for
+    `upload_affinity_ttl` seconds, so that an upload and the message using
+    it land together. Everything else, including every new conversation
+    without files, goes to the available backend with the fewest
+    outstanding requests per unit of weight; a backend stops taking new
+    conversations while its health check fails or its circuit breaker is
+    open.
+    """
+
+    def __init__(
+            self,
+            backends: List[Backend],
+            affinity_size: Optional[int] = None,
+            upload_affinity_ttl: Optional[float] = None,
+            health_interval: Optional[float] = None,
+            health_path: Optional[str] = None,
+            health_timeout: Optional[float] = None,
+            unhealthy_threshold: Optional[int] = None,
+            healthy_threshold: Optional[int] = None,
+    ) -> None:
+        if not backends:
+            raise ValueError("At least one Phyxie backend is required")
+        self.backends = backends
+        self._by_name: Dict[str, Backend] = {b.name: b for b in backends}
+        if len(self._by_name) != len(backends):
+            raise ValueError("Phyxie backend names must be unique")
+
+        self.affinity_size = settings.phyxie_affinity_size if affinity_size is None else affinity_size
+        self.upload_affinity_ttl = (
+            settings.phyxie_upload_affinity_ttl if upload_affinity_ttl is None else upload_affinity_ttl
+        )
+        self.health_interval = settings.phyxie_health_interval if health_interval is None else health_interval
+        self.health_path = settings.phyxie_health_path if health_path is None else health_path
+        self.health_timeout = settings.phyxie_health_timeout if health_timeout is None else health_timeout
+        self.unhealthy_threshold = (
+            settings.phyxie_unhealthy_threshold if unhealthy_threshold is None else unhealthy_threshold
+        )
+        self.healthy_threshold = (
+            settings.phyxie_healthy_threshold if healthy_threshold is None else healthy_threshold
+        )
+
+        self._conversations: "OrderedDict[str, str]" = OrderedDict()
+        self._users: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()  # user -> (backend, expiry)
+        self._health_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_settings(
+            cls,
+            classify: Callable[[BaseException], Optional[bool]],
+            overloaded: Optional[Callable[[BaseException], bool]] = None,
+    ) -> "LoadBalancer":
+        """Build backends from `PHYXIE_BACKENDS`, or the single base URL and key."""
+        specs = parse_backends(settings.phyxie_backends) or [{
+            "name": "default",
+            "base_url": settings.phyxie_api_base_url,
+            "api_key": settings.phyxie_api_key,
+            "weight": 1.0,
+        }]
+        return cls([Backend(flow=FlowControl(classify, overloaded=overloaded), **spec) for spec in specs])
+
+    @property
+    def multiple(self) -> bool:
+        return len(self.backends) > 1
+
+    # ----------------------------------------------------------------- #
+    #  Routing                                                          #
+    # ----------------------------------------------------------------- #
+
+    def route(
+            self,
+            conversation_id: Optional[str] = None,
+            user: Optional[str] = None,
+            exclude: Collection[str] = (),
+            uploads: bool = False,
+    ) -> Backend:
+        """
+        Return the backend for a call; `exclude` only applies to unpinned picks.
+
+        `uploads` marks calls that upload files or send uploaded ones: they
+        follow the user's upload pin and renew it.
+        """
+        if not self.multiple:
+            return self.backends[0]
+
+        if conversation_id:
+            name = self._conversations.get(conversation_id)
+            if name is not None:
+                self._conversations.move_to_end(conversation_id)
+                if uploads and user:
+                    self._pin(user, name)
+                return self._by_name[name]
+
+        if not (uploads and user):
+            return self._pick(exclude)
+
+        backend = self._pinned(user)
+        if backend is None or not backend.available or backend.name in exclude:
+            backend = self._pick(exclude)
+        self._pin(user, backend.name)
+        return backend
+
+    def bind(self, conversation_id: Optional[str], backend: Backend) -> None:
+        """Record that `conversation_id` lives on `backend`."""
+        if conversation_id and self.multiple:
+            self._remember(self._conversations, conversation_id, backend.name)
+
+    def forget(self, conversation_id: str) -> None:
+        self._conversations.pop(conversation_id, None)
+
+    def export_affinity(self, user: str, conversation_id: Optional[str]) -> Dict[str, str]:
+        """Backends pinned for `user` and their conversation, keyed `user`/`conversation`."""
+        state = {}
+        pinned = self._pinned(user)
+        if pinned is not None:
+            state["user"] = pinned.name
+        if conversation_id and conversation_id in self._conversations:
+            state["conversation"] = self._conversations[conversation_id]
+        return state
+
+    def import_affinity(self, user: str, conversation_id: Optional[str], state: Dict[str, str]) -> None:
+        """Restore pins exported by `export_affinity`, skipping unknown backends."""
+        if not self.multiple:
+            return
+        if state.get("user") in self._by_name:
+            self._pin(user, state["user"])
+        if conversation_id and state.get("conversation") in self._by_name:
+            self._remember(self._conversations, conversation_id, state["conversation"])
+
+    def _pick(self, exclude: Collection[str]) -> Backend:
+        candidates = [b for b in self.backends if b.available and b.name not in exclude]
+        if not candidates:
+            candidates = [b for b in self.backends if b.available]
+        if not candidates:
+            # Nothing looks healthy; let flow control reject or probe.
+            candidates = [b for b in self.backends if b.weight > 0] or self.backends
+
+        best: List[Backend] = []
+        best_score = float("inf")
+        for backend in candidates:
+            score = (backend.outstanding + 1) / (backend.weight or 1e-9)
+            if score < best_score:
+                best, best_score = [backend], score
+            elif score == best_score:
+                best.append(backend)
+        # Break ties in proportion to weight so idle backends share load fairly.
+        return random.choices(best, weights=[b.weight or 1e-9 for b in best])[0]
+
+    def _pinned(self, user: str) -> Optional[Backend]:
+        """The backend of the user's recent uploads, if the pin has not expired."""
+        entry = self._users.get(user)
+        if entry is None:
+            return None
+        name, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._users[user]
+            return None
+        return self._by_name.get(name)
+
+    def _pin(self, user: str, name: str) -> None:
+        self._remember(self._users, user, (name, time.monotonic() + self.upload_affinity_ttl))
+
+    def _remember(self, table: "OrderedDict[str, Any]", key: str, value: Any) -> None:
+        table[key] = value
+        table.move_to_end(key)
+        while len(table) > self.affinity_size:
+            table.popitem(last=False)
+
+    # ----------------------------------------------------------------- #
+    #  Health checks                                                    #
+    # ----------------------------------------------------------------- #
+
+    def start(self, transport: Transport) -> None:
+        """Start active health checks when there is more than one backend."""
+        if self.multiple and self.health_interval > 0 and self._health_task is None:
+            self._health_task = asyncio.get_running_loop().create_task(self._health_loop(transport))
+
+    async def close(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    async def _health_loop(self, transport: Transport) -> None:
+        while True:
+            results = await asyncio.gather(*(self.check(b, transport) for b in self.backends),
+                                           return_exceptions=True)
+            for backend, result in zip(self.backends, results):
+                if isinstance(result, Exception):
+                    # A bug in one probe must not end health checking for good.
+                    logger.error("Phyxie health check crashed", backend=backend.name,
+                                 error=str(result), exc_info=result)
+            await asyncio.sleep(self.health_interval)
+
+    async def check(self, backend: Backend, transport: Transport) -> bool:
+        """Probe `backend` once and update its health state."""
+        try:
+            async with transport.request(
+                    "GET",
+                    backend.url(self.health_path),
+                    headers=backend.headers,
+                    params={"user": "health-check"},
+                    timeout=self.health_timeout,
+            ) as resp:
+                ok = resp.status < 400
+        except NETWORK_ERRORS:
+            ok = False
+
+        if ok:
+            backend._failed_checks = 0
+            backend._passed_checks += 1
+            if not backend.healthy and backend._passed_checks >= self.healthy_threshold:
+                backend.healthy = True
+                logger.info("Phyxie backend healthy again", backend=backend.name)
+        else:
+            backend._passed_checks = 0
+            backend._failed_checks += 1
+            if backend.healthy and backend._failed_checks >= self.unhealthy_threshold:
+                backend.healthy = False
+                logger.warning("Phyxie backend unhealthy", backend=backend.name)
+        return ok
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per-backend routing and flow-control state."""
+        return {
+            b.name: {
+                "healthy": b.healthy,
+                "weight": b.weight,
+                "outstanding": b.outstanding,
+                "requests": b.requests,
+                **b.flow.stats(),
+            }
+            for b in self.backends
+        }
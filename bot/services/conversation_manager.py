@@ -2,7 +2,8 @@
 
 import uuid
 import structlog
-from typing import Dict, Optional
+from dataclasses import asdict
+from typing import Any, Dict, Optional
 from datetime import datetime
 
 from bot.models.schemas import UserConversation
@@ -68,6 +69,23 @@ class ConversationManager:
         if user_id in self._conversations:
             self._conversations[user_id].message_count += 1
 
+    def export_state(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """JSON-serialisable state of a user's conversation, for handing it to another process."""
+        conversation = self._conversations.get(user_id)
+        if conversation is None:
+            return None
+        state = asdict(conversation)
+        state["created_at"] = conversation.created_at.isoformat()
+        return state
+
+    def import_state(self, user_id: str, state: Optional[Dict[str, Any]]) -> None:
+        """Replace a user's conversation with exported state (`None` clears it)."""
+        if state is None:
+            self._conversations.pop(user_id, None)
+            return
+        state = dict(state, created_at=datetime.fromisoformat(state["created_at"]))
+        self._conversations[user_id] = UserConversation(**state)
+
     @staticmethod
     def _generate_conversation_id() -> str:
         """Generate a unique conversation ID."""
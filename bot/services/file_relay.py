@@ -0,0 +1,105 @@
+"""Stream Telegram files straight into Phyxie uploads."""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import aiofiles
+import aiohttp
+import structlog
+from telegram import Bot, File
+
+from bot.models.schemas import FileUploadResponse
+from bot.services.phyxie_service import PhyxieService, UploadSourceError
+from bot.services.upload_cache import UploadCache
+from config.settings import settings
+
+logger = structlog.get_logger(__name__)
+
+
+class TelegramDownloadError(UploadSourceError):
+    """Raised when a file cannot be downloaded from Telegram."""
+
+
+class FileRelay:
+    """
+    Pipe a Telegram download into a chunked multipart upload to
+    `/files/upload` without holding the whole file in memory.
+
+    Backpressure is end-to-end: the next chunk is only read from Telegram
+    once the previous one has been written to the Phyxie socket, and
+    aiohttp pauses the download socket while its read buffer is full.
+    """
+
+    def __init__(self, phyxie_service: PhyxieService, chunk_size: int = None):
+        self.phyxie_service = phyxie_service
+        self.chunk_size = chunk_size or settings.upload_chunk_size
+
+    async def upload(self, bot: Bot, file_id: str, file_unique_id: str, filename: str, user: str,
+                     conversation_id: Optional[str] = None) -> str:
+        """
+        Return a Phyxie `upload_file_id` for a Telegram file, to be sent in
+        `conversation_id` (None for a new conversation).
+
+        Files this user already uploaded are served from the upload cache
+        without downloading or uploading anything.
+        """
+        cache = self.phyxie_service.upload_cache
+        scope = self.phyxie_service.upload_scope(user, conversation_id)
+        key = UploadCache.key(scope, file_unique_id=file_unique_id)
+
+        cached_id = cache.get(key)
+        if cached_id:
+            logger.info("Reusing uploaded file", filename=filename, file_id=cached_id)
+            return cached_id
+
+        file = await bot.get_file(file_id)
+        upload = await self.relay(file, filename, user, conversation_id)
+
+        cache.put(key, upload.id)
+        return upload.id
+
+    def forget(self, file_unique_id: str, user: str, conversation_id: Optional[str] = None) -> None:
+        """Drop a cached upload, e.g. after Phyxie rejected it."""
+        scope = self.phyxie_service.upload_scope(user, conversation_id)
+        self.phyxie_service.upload_cache.invalidate(UploadCache.key(scope, file_unique_id=file_unique_id))
+
+    async def relay(self, file: File, filename: str, user: str,
+                    conversation_id: Optional[str] = None) -> FileUploadResponse:
+        """Stream `file` to Phyxie and return the upload response."""
+        logger.info("Relaying file to Phyxie",
+                    filename=filename,
+                    file_size=file.file_size)
+        return await self.phyxie_service.upload_stream(
+            self._iter_file(file),
+            filename,
+            user,
+            conversation_id,
+        )
+
+    async def _iter_file(self, file: File) -> AsyncIterator[bytes]:
+        """Yield the file body in chunks, from the Bot API or a local server."""
+        file_path = file.file_path or ""
+
+        if not file_path.startswith(("http://", "https://")):
+            # Local Bot API server (`local_mode`) hands out filesystem paths.
+            try:
+                async with aiofiles.open(Path(file_path), "rb") as fh:
+                    while chunk := await fh.read(self.chunk_size):
+                        yield chunk
+            except OSError as e:
+                logger.error("Could not read local file", error=str(e))
+                raise TelegramDownloadError(f"Could not read {file_path}: {e}") from e
+            return
+
+        session = await self.phyxie_service.pool.session()
+        try:
+            async with session.get(file_path) as resp:
+                if resp.status >= 400:
+                    raise TelegramDownloadError(f"Telegram download failed: {resp.status}")
+                async for chunk in resp.content.iter_chunked(self.chunk_size):
+                    yield chunk
+        except aiohttp.ClientError as e:
+            logger.error("Network error during file download", error=str(e))
+            raise TelegramDownloadError(f"Network error: {str(e)}") from e
@@ -0,0 +1,306 @@
+"""Adaptive concurrency limiting and circuit breaking for upstream calls."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager, suppress
+from typing import AsyncIterator, Callable, Deque, Dict, Optional
+
+import structlog
+
+from config.settings import settings
+
+logger = structlog.get_logger(__name__)
+
+
+class OverloadedError(Exception):
+    """Raised when a call is shed instead of being sent upstream."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(OverloadedError):
+    """Raised while the circuit breaker is open."""
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limiter driven by latency and errors.
+
+    The limit grows by roughly one slot per limit-worth of fast successes
+    while the limiter is busy, and is cut multiplicatively on overload
+    signals (rejections, timeouts) or when short-term latency drifts above
+    `latency_tolerance` times the long-term average. Other failures leave
+    the limit alone; they are the circuit breaker's business. Callers
+    beyond the limit wait in a bounded FIFO queue for at most `max_wait`
+    seconds.
+    """
+
+    def __init__(
+            self,
+            initial_limit: Optional[int] = None,
+            min_limit: Optional[int] = None,
+            max_limit: Optional[int] = None,
+            max_queue: Optional[int] = None,
+            max_wait: Optional[float] = None,
+            latency_tolerance: Optional[float] = None,
+            backoff_ratio: float = 0.75,
+            decrease_cooldown: float = 1.0,
+    ) -> None:
+        self.min_limit = settings.phyxie_concurrency_min if min_limit is None else min_limit
+        self.max_limit = settings.phyxie_concurrency_max if max_limit is None else max_limit
+        initial = settings.phyxie_concurrency_initial if initial_limit is None else initial_limit
+        self.max_queue = settings.phyxie_queue_size if max_queue is None else max_queue
+        self.max_wait = settings.phyxie_queue_timeout if max_wait is None else max_wait
+        self.latency_tolerance = (
+            settings.phyxie_latency_tolerance if latency_tolerance is None else latency_tolerance
+        )
+        self.backoff_ratio = backoff_ratio
+        self.decrease_cooldown = decrease_cooldown
+
+        self._limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self._inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._short_latency: Optional[float] = None
+        self._long_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self.shed = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        """Take a slot, waiting in the queue if needed; raise OverloadedError if shed."""
+        if self._inflight < self.limit and not self._waiters:
+            self._inflight += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.shed += 1
+            raise OverloadedError("Phyxie request queue is full")
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(fut, self.max_wait)
+        except BaseException as e:
+            if fut.done() and not fut.cancelled():
+                # The slot was handed over just as we gave up; give it back.
+                self._release_slot()
+            else:
+                with suppress(ValueError):
+                    self._waiters.remove(fut)
+            if isinstance(e, asyncio.TimeoutError):
+                self.shed += 1
+                raise OverloadedError("Timed out waiting for a Phyxie slot") from None
+            raise
+
+    def release(self, latency: Optional[float], ok: Optional[bool], overloaded: bool = False) -> None:
+        """
+        Return a slot and feed the outcome into the limit.
+
+        `ok=None` means the call was abandoned locally and says nothing
+        about upstream health; `overloaded` marks a failure that says
+        upstream has no room for more calls.
+        """
+        if overloaded:
+            self._decrease()
+        elif ok and latency is not None:
+            self._observe(latency)
+        self._release_slot()
+
+    def _observe(self, latency: float) -> None:
+        self._short_latency = latency if self._short_latency is None else (
+                0.8 * self._short_latency + 0.2 * latency)
+        self._long_latency = latency if self._long_latency is None else (
+                0.98 * self._long_latency + 0.02 * latency)
+
+        if self._short_latency > self._long_latency * self.latency_tolerance:
+            self._decrease()
+        elif self._inflight >= self._limit / 2:
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self.decrease_cooldown:
+            return
+        self._last_decrease = now
+        old = self.limit
+        self._limit = max(self.min_limit, self._limit * self.backoff_ratio)
+        if self.limit != old:
+            logger.warning("Phyxie concurrency limit reduced", old_limit=old, new_limit=self.limit)
+
+    def _release_slot(self) -> None:
+        self._inflight -= 1
+        while self._waiters and self._inflight < self.limit:
+            fut = self._waiters.popleft()
+            if fut.done():
+                continue
+            self._inflight += 1
+            fut.set_result(None)
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    every call is rejected for `reset_timeout` seconds. Then up to
+    `half_open_probes` calls are let through; one success closes the
+    circuit, one failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+            self,
+            failure_threshold: Optional[int] = None,
+            reset_timeout: Optional[float] = None,
+            half_open_probes: Optional[int] = None,
+    ) -> None:
+        self.failure_threshold = (
+            settings.phyxie_breaker_failure_threshold if failure_threshold is None else failure_threshold
+        )
+        self.reset_timeout = settings.phyxie_breaker_reset_timeout if reset_timeout is None else reset_timeout
+        self.half_open_probes = (
+            settings.phyxie_breaker_half_open_probes if half_open_probes is None else half_open_probes
+        )
+
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self.rejected = 0
+
+    def check(self) -> None:
+        """Fail fast without reserving anything while the circuit is open."""
+        if self.state == self.OPEN:
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError("Phyxie circuit is open", retry_after=remaining)
+
+    def before_call(self) -> None:
+        """Admit a call, moving to half-open and reserving a probe if due."""
+        self.check()
+        if self.state == self.OPEN:
+            self.state = self.HALF_OPEN
+            self._probes = 0
+            logger.info("Phyxie circuit half-open, probing")
+        if self.state == self.HALF_OPEN:
+            if self._probes >= self.half_open_probes:
+                self.rejected += 1
+                raise CircuitOpenError("Phyxie circuit is half-open", retry_after=self.reset_timeout)
+            self._probes += 1
+
+    def record(self, ok: Optional[bool]) -> None:
+        """Record a call outcome; `ok=None` only releases a probe."""
+        if self.state == self.HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+            if ok:
+                self._close()
+            elif ok is False:
+                self._open()
+            return
+
+        if ok:
+            self._failures = 0
+        elif ok is False:
+            self._failures += 1
+            if self.state == self.CLOSED and self._failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self) -> None:
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        logger.warning("Phyxie circuit opened",
+                       failures=self._failures,
+                       reset_timeout=self.reset_timeout)
+
+    def _close(self) -> None:
+        self.state = self.CLOSED
+        self._failures = 0
+        logger.info("Phyxie circuit closed")
+
+
+class Permit:
+    """Handle for one admitted call; lets streams report time-to-first-byte."""
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.latency: Optional[float] = None
+
+    def first_byte(self) -> None:
+        if self.latency is None:
+            self.latency = time.monotonic() - self.started
+
+
+class FlowControl:
+    """Circuit breaker plus adaptive limiter, shared by all service methods."""
+
+    def __init__(
+            self,
+            classify: Callable[[BaseException], Optional[bool]],
+            limiter: Optional[AdaptiveLimiter] = None,
+            breaker: Optional[CircuitBreaker] = None,
+            overloaded: Optional[Callable[[BaseException], bool]] = None,
+    ) -> None:
+        """
+        `classify(exc)` returns False for upstream failures, True for errors
+        that still prove upstream is healthy (e.g. 4xx) and None to ignore.
+        `overloaded(exc)` picks the failures that should also shrink the
+        concurrency limit; by default none do.
+        """
+        self.classify = classify
+        self.overloaded = overloaded or (lambda exc: False)
+        self.limiter = limiter or AdaptiveLimiter()
+        self.breaker = breaker or CircuitBreaker()
+
+    @asynccontextmanager
+    async def permit(self) -> AsyncIterator[Permit]:
+        self.breaker.check()
+        await self.limiter.acquire()
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self.limiter.release(None, None)
+            raise
+
+        permit = Permit()
+        ok: Optional[bool] = True
+        overloaded = False
+        try:
+            yield permit
+        except BaseException as e:
+            ok = self.classify(e)
+            overloaded = ok is False and self.overloaded(e)
+            raise
+        finally:
+            latency = permit.latency if permit.latency is not None else time.monotonic() - permit.started
+            self.breaker.record(ok)
+            self.limiter.release(latency, ok, overloaded)
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.breaker.state,
+            "limit": self.limiter.limit,
+            "inflight": self.limiter.inflight,
+            "queued": self.limiter.queued,
+            "shed": self.limiter.shed,
+            "rejected": self.breaker.rejected,
+        }
@@ -0,0 +1,67 @@
+"""Tracking of in-flight Phyxie generations so they can be superseded."""
+
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+
+@dataclass
+class Generation:
+    """One in-flight answer for a Phyxie user."""
+    user: str
+    task: Optional[asyncio.Task]
+    task_id: Optional[str] = None
+    conversation_id: Optional[str] = None
+    superseded: bool = False
+
+
+class GenerationRegistry:
+    """
+    Remember which local asyncio task is generating an answer for each
+    user, and the Dify `task_id` once the stream reveals it.
+    """
+
+    def __init__(self) -> None:
+        self._active: Dict[str, Generation] = {}
+
+    def begin(self, user: str) -> Generation:
+        """Register the current task as the user's active generation."""
+        generation = Generation(user=user, task=asyncio.current_task())
+        self._active[user] = generation
+        return generation
+
+    def end(self, generation: Generation) -> None:
+        """Forget `generation` if it is still the user's active one."""
+        if self._active.get(generation.user) is generation:
+            del self._active[generation.user]
+
+    def get(self, user: str) -> Optional[Generation]:
+        return self._active.get(user)
+
+    def supersede(self, user: str, reason: str) -> Optional[Generation]:
+        """
+        Cancel the user's active generation, if any.
+
+        The local task is cancelled; the streaming code it is running then
+        asks Dify to stop the upstream task.
+        """
+        generation = self._active.pop(user, None)
+        if generation is None or generation.task is None or generation.task.done():
+            return None
+
+        generation.superseded = True
+        generation.task.cancel()
+        logger.info("Superseding generation",
+                    user=user,
+                    task_id=generation.task_id,
+                    reason=reason)
+        return generation
+
+    def __len__(self) -> int:
+        return len(self._active)
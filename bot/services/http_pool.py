@@ -0,0 +1,151 @@
+"""Shared keep-alive HTTP connection pool for outbound API traffic."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional
+
+import aiohttp
+import structlog
+
+from config.settings import settings
+
+logger = structlog.get_logger(__name__)
+
+
+@dataclass
+class PoolStats:
+    """Snapshot of connection pool usage."""
+    limit: int
+    limit_per_host: int
+    in_use: int = 0
+    idle: int = 0
+    waiting: int = 0
+    waits: int = 0
+    created: int = 0
+    reused: int = 0
+
+
+class HTTPPool:
+    """
+    One long-lived `aiohttp.ClientSession` backed by a keep-alive connector.
+
+    The session is opened lazily on first use (or explicitly via `start`)
+    and must be closed with `close` on shutdown.
+    """
+
+    def __init__(
+            self,
+            limit: Optional[int] = None,
+            limit_per_host: Optional[int] = None,
+            dns_cache_ttl: Optional[int] = None,
+            keepalive_timeout: Optional[float] = None,
+            connect_timeout: Optional[float] = None,
+            request_timeout: Optional[float] = None,
+    ) -> None:
+        self.limit = settings.http_pool_size if limit is None else limit
+        self.limit_per_host = (
+            settings.http_pool_size_per_host if limit_per_host is None else limit_per_host
+        )
+        self.dns_cache_ttl = settings.http_dns_cache_ttl if dns_cache_ttl is None else dns_cache_ttl
+        self.keepalive_timeout = (
+            settings.http_keepalive_timeout if keepalive_timeout is None else keepalive_timeout
+        )
+        self.connect_timeout = (
+            settings.http_connect_timeout if connect_timeout is None else connect_timeout
+        )
+        self.request_timeout = (
+            settings.http_request_timeout if request_timeout is None else request_timeout
+        )
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._connector: Optional[aiohttp.TCPConnector] = None
+        self._waits = 0
+        self._created = 0
+        self._reused = 0
+
+    # ----------------------------------------------------------------- #
+    #  Lifecycle                                                        #
+    # ----------------------------------------------------------------- #
+
+    async def start(self) -> aiohttp.ClientSession:
+        """Open the pooled session if it is not open yet."""
+        if self._session is not None and not self._session.closed:
+            return self._session
+
+        self._connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            use_dns_cache=self.dns_cache_ttl > 0,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=self._connector,
+            timeout=aiohttp.ClientTimeout(total=self.request_timeout, sock_connect=self.connect_timeout),
+            trace_configs=[self._trace_config()],
+        )
+        logger.info("HTTP pool opened",
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    dns_cache_ttl=self.dns_cache_ttl,
+                    keepalive_timeout=self.keepalive_timeout)
+        return self._session
+
+    async def close(self) -> None:
+        """Close the pooled session and every idle connection."""
+        if self._session is not None and not self._session.closed:
+            logger.info("Closing HTTP pool", **self.stats().__dict__)
+            await self._session.close()
+        self._session = None
+        self._connector = None
+
+    @property
+    def closed(self) -> bool:
+        return self._session is None or self._session.closed
+
+    async def session(self) -> aiohttp.ClientSession:
+        """Return the pooled session, opening it on first use."""
+        if self.closed:
+            return await self.start()
+        return self._session
+
+    # ----------------------------------------------------------------- #
+    #  Stats                                                            #
+    # ----------------------------------------------------------------- #
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_queued(session, ctx, params):
+            self._waits += 1
+
+        async def on_create(session, ctx, params):
+            self._created += 1
+
+        async def on_reuse(session, ctx, params):
+            self._reused += 1
+
+        trace.on_connection_queued_start.append(on_queued)
+        trace.on_connection_create_end.append(on_create)
+        trace.on_connection_reuseconn.append(on_reuse)
+        return trace
+
+    def stats(self) -> PoolStats:
+        """Return current pool usage (in-use, idle, queued) and counters."""
+        stats = PoolStats(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            waits=self._waits,
+            created=self._created,
+            reused=self._reused,
+        )
+        connector = self._connector
+        if connector is None or connector.closed:
+            return stats
+
+        # aiohttp does not expose these publicly; read them defensively.
+        stats.in_use = len(getattr(connector, "_acquired", ()))
+        stats.idle = sum(len(conns) for conns in getattr(connector, "_conns", {}).values())
+        stats.waiting = sum(len(waiters) for waiters in getattr(connector, "_waiters", {}).values())
+        return stats
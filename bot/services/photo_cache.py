@@ -0,0 +1,110 @@
+"""Cache of Telegram file ids for images the bot has already uploaded."""
+
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import structlog
+
+from config.settings import settings
+
+logger = structlog.get_logger(__name__)
+
+
+class PhotoCache:
+    """
+    Map the sha256 of an image's bytes to the Telegram `file_id` returned
+    when it was first sent, so the same image (a common identity, a worked
+    example header) can be sent again by id without uploading it.
+
+    File ids belong to the bot, not to a chat, and do not expire; the
+    in-memory tier evicts least recently used entries beyond `max_entries`
+    and `max_entries=0` disables the cache. When `db_path` is set, entries
+    are also written to SQLite so they survive restarts.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, db_path: Optional[str] = None) -> None:
+        self.max_entries = settings.photo_cache_size if max_entries is None else max_entries
+        db_path = settings.photo_cache_db if db_path is None else db_path
+
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path and self.enabled:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS photo_cache (digest TEXT PRIMARY KEY, file_id TEXT NOT NULL)"
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, data: bytes) -> Optional[str]:
+        """Return the cached file id for these image bytes, or None."""
+        if not self.enabled:
+            return None
+        digest = self.digest(data)
+        file_id = self._entries.get(digest)
+        if file_id is None and self._db is not None:
+            row = self._db.execute("SELECT file_id FROM photo_cache WHERE digest = ?", (digest,)).fetchone()
+            if row is not None:
+                file_id = row[0]
+                self._remember(digest, file_id)
+
+        if file_id is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        self.bytes_saved += len(data)
+        return file_id
+
+    def put(self, data: bytes, file_id: str) -> None:
+        """Remember the file id Telegram assigned to these image bytes."""
+        if not self.enabled:
+            return
+        digest = self.digest(data)
+        self._remember(digest, file_id)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO photo_cache (digest, file_id) VALUES (?, ?)", (digest, file_id)
+            )
+
+    def invalidate(self, data: bytes) -> None:
+        """Drop the entry for these bytes, e.g. after Telegram rejected its file id."""
+        digest = self.digest(data)
+        self._entries.pop(digest, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM photo_cache WHERE digest = ?", (digest,))
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes_saved": self.bytes_saved,
+        }
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _remember(self, digest: str, file_id: str) -> None:
+        self._entries[digest] = file_id
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -2,19 +2,32 @@
 
 from __future__ import annotations
 
-import json
-from typing import AsyncIterator, Dict, List
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterable, AsyncIterator, Dict, List, Optional, Set, Union
 
 import aiohttp
 import structlog
-from tenacity import retry, stop_after_attempt, wait_exponential
 from bot.utils.helpers import get_mime_type
 
+from bot.services.backends import Backend, LoadBalancer
+from bot.services.generation import GenerationRegistry
+from bot.services.flow_control import OverloadedError, Permit
+from bot.services.http_pool import HTTPPool, PoolStats
+from bot.services.retry import RetryPolicy, RetryStats, parse_retry_after
+from bot.services.transport import (
+    CLIENT_ERRORS, NETWORK_ERRORS, TIMEOUT_ERRORS, Transport, TransportResponse, get_transport,
+)
+from bot.services.upload_cache import UploadCache
+from bot.utils.json_codec import JSONCodec, get_codec
+from bot.utils.sse import SSEDecoder
 from bot.models.schemas import (
     ChatMessage,
     FileUploadResponse,
     PhyxieResponse,
     ResponseMode,
+    StreamEvent,
+    StreamEventType,
     TransferMethod,
 )
 from config.settings import settings
@@ -25,17 +38,117 @@ logger = structlog.get_logger(__name__)
 class PhyxieAPIError(Exception):
     """Raised for any non-network error returned by the Phyxie Service-API."""
 
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class PhyxieOverloadedError(PhyxieAPIError):
+    """Raised when a request is shed locally because Phyxie is overloaded."""
+
+
+class PhyxieCancelledError(PhyxieAPIError):
+    """Raised when a generation was superseded by a newer request of the same user."""
+
+
+class UploadSourceError(Exception):
+    """Raised by the byte stream fed to `upload_stream`; says nothing about Phyxie's health."""
+
+
+def _api_error(resp: Union[TransportResponse, aiohttp.ClientResponse], text: str) -> PhyxieAPIError:
+    """Build the error for a >= 400 response, keeping status and Retry-After."""
+    return PhyxieAPIError(
+        f"{resp.status}: {text}",
+        status=resp.status,
+        retry_after=parse_retry_after(resp.headers.get("Retry-After")),
+    )
+
+
+def _is_upstream_healthy(exc: BaseException) -> Optional[bool]:
+    """Classify an exception for flow control (see `FlowControl`)."""
+    if isinstance(exc, (asyncio.CancelledError, GeneratorExit, UploadSourceError)):
+        return None
+    if isinstance(exc, PhyxieAPIError):
+        return exc.status is not None and exc.status < 500 and exc.status != 429
+    if isinstance(exc, NETWORK_ERRORS):
+        return False
+    return None
+
+
+def _is_overload(exc: BaseException) -> bool:
+    """Failures that mean upstream has no room: 429/503/504 and timeouts. Plain 500/502 do not."""
+    if isinstance(exc, PhyxieAPIError):
+        if exc.status is None:
+            return isinstance(exc.__cause__, TIMEOUT_ERRORS)
+        return exc.status in (429, 503, 504)
+    return isinstance(exc, TIMEOUT_ERRORS)
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    """Transient: 408/429/5xx responses and connection errors. Everything else is permanent."""
+    if isinstance(exc, (PhyxieOverloadedError, PhyxieCancelledError)):
+        return False
+    if isinstance(exc, PhyxieAPIError):
+        if exc.status is None:
+            return isinstance(exc.__cause__, NETWORK_ERRORS)
+        return exc.status in (408, 429) or exc.status >= 500
+    return isinstance(exc, NETWORK_ERRORS)
+
 
 class PhyxieService:
     """Thin async client around the Phyxie Service-API."""
 
-    def __init__(self) -> None:
-        self.base_url: str = settings.phyxie_api_base_url.rstrip("/")
-        self.api_key: str = settings.phyxie_api_key
-        self.headers: Dict[str, str] = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
+    def __init__(
+            self,
+            pool: Optional[HTTPPool] = None,
+            codec: Optional[JSONCodec] = None,
+            balancer: Optional[LoadBalancer] = None,
+            transport: Optional[Transport] = None,
+    ) -> None:
+        self.pool: HTTPPool = pool or HTTPPool()
+        self.transport: Transport = transport or get_transport(settings.http_transport, self.pool)
+        self.codec: JSONCodec = codec or get_codec(settings.json_codec)
+        self.upload_cache: UploadCache = UploadCache()
+        self.balancer: LoadBalancer = balancer or LoadBalancer.from_settings(_is_upstream_healthy, _is_overload)
+        self.retry: RetryPolicy = RetryPolicy(_is_retryable)
+        self.generations: GenerationRegistry = GenerationRegistry()
+        self._background: Set[asyncio.Task] = set()
+
+    # ----------------------------------------------------------------- #
+    #  Lifecycle                                                        #
+    # ----------------------------------------------------------------- #
+
+    async def start(self) -> None:
+        """Open the pooled HTTP session (called from `PhyxieBot.post_init`)."""
+        await self.pool.start()
+        await self.transport.start()
+        self.balancer.start(self.transport)
+
+    async def close(self) -> None:
+        """Close the pooled HTTP session (called on application shutdown)."""
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        await self.balancer.close()
+        await self.transport.close()
+        await self.pool.close()
+        self.upload_cache.close()
+
+    def pool_stats(self) -> PoolStats:
+        """Return connection pool usage."""
+        return self.pool.stats()
+
+    def transport_stats(self) -> Dict:
+        """Return counters of the transport carrying JSON and streaming calls."""
+        return {"transport": self.transport.name, **self.transport.stats()}
+
+    def flow_stats(self) -> Dict[str, Dict]:
+        """Return routing, concurrency limiter and circuit breaker state per backend."""
+        return self.balancer.stats()
+
+    def retry_stats(self) -> Dict[str, RetryStats]:
+        """Return retry counters and time lost to failed attempts, per operation."""
+        return self.retry.stats
 
     # ----------------------------------------------------------------- #
     #  Helpers                                                          #
@@ -73,26 +186,56 @@ class PhyxieService:
 
         return file_payload
 
-    async def _post_json(self, url: str, payload: Dict) -> Dict:
-        """POST JSON and always return body (or raise PhyxieAPIError)."""
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=self.headers, json=payload) as resp:
-                text = await resp.text()
+    def _route(self, message: ChatMessage, tried: Set[str]) -> Backend:
+        """Pick the backend for one attempt of a chat call."""
+        # Existing conversations and already uploaded files only exist on
+        # one backend, so only fresh requests may move away from a failure.
+        uploads = any(f.upload_file_id for f in message.files)
+        pinned = bool(message.conversation_id) or uploads
+        backend = self.balancer.route(message.conversation_id, message.user,
+                                      exclude=() if pinned else tried, uploads=uploads)
+        tried.add(backend.name)
+        return backend
+
+    def upload_scope(self, user: str, conversation_id: Optional[str] = None) -> str:
+        """
+        Scope for upload-cache keys. Upload ids are only valid for the user
+        and, with several backends, the backend that received them.
+        """
+        if not self.balancer.multiple:
+            return user
+        return f"{self.balancer.route(conversation_id, user, uploads=True).name}/{user}"
+
+    @asynccontextmanager
+    async def _admit(self, backend: Backend) -> AsyncIterator[Permit]:
+        """Hold a flow-control slot on `backend` for one upstream call, or shed it."""
+        backend.requests += 1
+        try:
+            async with backend.flow.permit() as permit:
+                yield permit
+        except OverloadedError as e:
+            logger.warning("Phyxie request shed", backend=backend.name, reason=str(e), **backend.flow.stats())
+            raise PhyxieOverloadedError(str(e), retry_after=e.retry_after) from e
+
+    async def _post_json(self, backend: Backend, path: str, payload: Dict) -> bytes:
+        """POST JSON and always return the raw body (or raise PhyxieAPIError)."""
+        async with self._admit(backend):
+            async with self.transport.request("POST", backend.url(path), headers=backend.headers,
+                                              data=self.codec.encode(payload)) as resp:
+                body = await resp.read()
                 if resp.status >= 400:
+                    text = body.decode(errors="replace")
                     logger.error("Phyxie API error", status=resp.status, body=text)
-                    raise PhyxieAPIError(f"{resp.status}: {text}")
+                    raise _api_error(resp, text)
 
-                return json.loads(text)
+                return body
 
     # --------------------------------------------------------------------- #
     #  Chat endpoints                                                       #
     # --------------------------------------------------------------------- #
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     async def send_message(self, message: ChatMessage) -> PhyxieResponse:
         """Blocking mode request to `/chat-messages`."""
-        url = f"{self.base_url}{settings.chat_messages_endpoint}"
-
         payload: Dict = {
             "query": message.query,
             "user": message.user,
@@ -109,15 +252,27 @@ class PhyxieService:
 
         logger.info("Sending message to Phyxie", user=message.user, conversation_id=message.conversation_id)
 
-        data = await self._post_json(url, payload)
-        return PhyxieResponse(**data)
+        tried: Set[str] = set()
+
+        async def attempt() -> PhyxieResponse:
+            backend = self._route(message, tried)
+            body = await self._post_json(backend, settings.chat_messages_endpoint, payload)
+            response = self.codec.decode_into(body, PhyxieResponse)
+            self.balancer.bind(response.conversation_id, backend)
+            return response
+
+        return await self.retry.call("send_message", attempt)
 
     # ------------------------------------------------------------------ #
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-    async def stream_message(self, message: ChatMessage) -> AsyncIterator[Dict]:
-        """Send message in streaming mode and yield SSE chunks."""
-        url = f"{self.base_url}{settings.chat_messages_endpoint}"
+    async def stream_message(self, message: ChatMessage) -> AsyncIterator[StreamEvent]:
+        """
+        Send message in streaming mode and yield decoded SSE events.
+
+        Failures are retried only until the first event reached the caller.
+        If the stream is superseded, cancelled or abandoned before
+        `message_end`, the upstream task is stopped as well.
+        """
         message.response_mode = ResponseMode.STREAMING
 
         payload: Dict = {
@@ -134,82 +289,261 @@ class PhyxieService:
         if message.files:
             payload["files"] = self._build_files_section(message.files)
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(url, headers=self.headers, json=payload) as resp:
+        generation = self.generations.begin(message.user)
+        finished = False
+        tried: Set[str] = set()
+        try:
+            async for event in self.retry.stream("stream_message", lambda: self._stream_once(message, payload, tried)):
+                if generation.task_id is None and event.task_id:
+                    generation.task_id = event.task_id
+                    generation.conversation_id = event.conversation_id
+                if event.event in (StreamEventType.MESSAGE_END, StreamEventType.ERROR):
+                    finished = True
+                yield event
+            finished = True
+
+        except asyncio.CancelledError:
+            if not generation.superseded:
+                raise
+            # Python 3.11+ counts cancellations; this one is handled here.
+            current = asyncio.current_task()
+            if current is not None and hasattr(current, "uncancel"):
+                current.uncancel()
+            raise PhyxieCancelledError("Generation superseded by a newer request") from None
+
+        finally:
+            self.generations.end(generation)
+            if not finished and generation.task_id:
+                # Superseded, cancelled or abandoned mid-answer: stop Dify too.
+                self._spawn(self.stop_generation(generation.task_id, message.user, generation.conversation_id))
+
+    async def complete_message(self, message: ChatMessage) -> PhyxieResponse:
+        """
+        Stream a message and assemble the full answer.
+
+        Returns the same shape as `send_message`, but because the answer is
+        streamed the upstream task can be stopped when the request is
+        superseded (see `cancel_generation`).
+        """
+        parts: List[str] = []
+        first: Optional[StreamEvent] = None
+        end: Optional[StreamEvent] = None
+
+        async for event in self.stream_message(message):
+            if event.is_answer:
+                parts.append(event.answer)
+            elif event.event == StreamEventType.MESSAGE_REPLACE:
+                parts = [event.answer]
+            elif event.event == StreamEventType.MESSAGE_END:
+                end = event
+            elif event.event == StreamEventType.ERROR:
+                status = event.data.get("status")
+                raise PhyxieAPIError(
+                    f"{status}: {event.data.get('message', 'stream error')}",
+                    status=status if isinstance(status, int) else None,
+                )
+            else:
+                continue
+            first = first or event
+
+        if first is None:
+            raise PhyxieAPIError("Stream ended without an answer")
+
+        last = end or first
+        return PhyxieResponse(
+            event=StreamEventType.MESSAGE.value,
+            task_id=last.task_id or first.task_id or "",
+            id=last.message_id or "",
+            message_id=last.message_id or "",
+            conversation_id=last.conversation_id or first.conversation_id or "",
+            mode=first.data.get("mode", "chat") if first.data else "chat",
+            answer="".join(parts),
+            metadata=end.data.get("metadata", {}) if end else {},
+            created_at=first.data.get("created_at", 0) if first.data else 0,
+        )
+
+    def cancel_generation(self, user: str, reason: str = "superseded") -> bool:
+        """Cancel the user's in-flight generation locally and upstream."""
+        return self.generations.supersede(user, reason) is not None
+
+    async def stop_generation(self, task_id: str, user: str, conversation_id: Optional[str] = None) -> bool:
+        """POST `/chat-messages/{task_id}/stop`. Best effort; never raises."""
+        backend = self.balancer.route(conversation_id, user)
+        url = backend.url(f"{settings.chat_messages_endpoint}/{task_id}/stop")
+        try:
+            async with self.transport.request("POST", url, headers=backend.headers,
+                                              data=self.codec.encode({"user": user})) as resp:
+                if resp.status >= 400:
+                    body = await resp.text()
+                    logger.warning("Stop generation failed", task_id=task_id, status=resp.status, body=body)
+                    return False
+        except NETWORK_ERRORS as e:
+            logger.warning("Stop generation failed", task_id=task_id, error=str(e))
+            return False
+        except Exception as e:
+            logger.error("Stop generation failed", task_id=task_id, error=str(e), exc_info=True)
+            return False
+
+        logger.info("Stopped generation", task_id=task_id, user=user)
+        return True
+
+    def _spawn(self, coro) -> None:
+        """Run `coro` in the background, keeping a reference until it finishes."""
+        task = asyncio.get_running_loop().create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _stream_once(self, message: ChatMessage, payload: Dict, tried: Set[str]) -> AsyncIterator[StreamEvent]:
+        """One streaming `/chat-messages` attempt."""
+        backend = self._route(message, tried)
+        try:
+            async with self._admit(backend) as permit:
+                async with self.transport.request("POST", backend.url(settings.chat_messages_endpoint),
+                                                  headers=backend.headers, data=self.codec.encode(payload)) as resp:
+                    permit.first_byte()
+
                     # If the handshake itself fails, read body for details
                     if resp.status >= 400:
                         body = await resp.text()
                         logger.error("Phyxie API error", status=resp.status, body=body)
-                        raise PhyxieAPIError(f"{resp.status}: {body}")
-
-                    async for line in resp.content:
-                        if not line:
-                            continue
-                        text = line.decode().strip()
-                        if not text.startswith("data: "):
-                            continue
-                        chunk = text[6:]
-                        if chunk:
-                            yield json.loads(chunk)
-
-            except aiohttp.ClientError as e:
-                logger.error("Network error during streaming", error=str(e))
-                raise PhyxieAPIError(f"Network error: {str(e)}") from e
+                        raise _api_error(resp, body)
+
+                    decoder = SSEDecoder()
+                    bound = False
+                    async for raw in resp.iter_chunks():
+                        for sse in decoder.feed(raw):
+                            if not sse.data:
+                                # Keep-alive such as `event: ping` with no payload
+                                yield StreamEvent(event=sse.event)
+                                continue
+                            event = self.codec.decode_stream_event(sse.data)
+                            if not bound and event.conversation_id:
+                                self.balancer.bind(event.conversation_id, backend)
+                                bound = True
+                            yield event
+
+        except CLIENT_ERRORS as e:
+            logger.error("Network error during streaming", error=str(e))
+            raise PhyxieAPIError(f"Network error: {str(e)}") from e
 
     # --------------------------------------------------------------------- #
     #  File upload                                                          #
     # --------------------------------------------------------------------- #
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-    async def upload_file(self, file_data: bytes, filename: str, user: str) -> FileUploadResponse:
+    async def upload_file(self, file_data: bytes, filename: str, user: str,
+                          conversation_id: Optional[str] = None) -> FileUploadResponse:
         """Upload a file to Phyxie API and get an upload_file_id."""
-        url = f"{self.base_url}{settings.file_upload_endpoint}"
+        backend = self.balancer.route(conversation_id, user, uploads=True)
+        url = backend.url(settings.file_upload_endpoint)
 
         mime_type = get_mime_type(filename)  # ← new
+        headers = {"Authorization": f"Bearer {backend.api_key}"}
+
+        async def attempt() -> FileUploadResponse:
+            # A FormData body can only be sent once, so build it per attempt.
+            form = aiohttp.FormData()
+            form.add_field(
+                "file",
+                file_data,
+                filename=filename,
+                content_type=mime_type  # ← new
+            )
+            form.add_field("user", user)
+
+            session = await self.pool.session()
+            async with self._admit(backend):
+                try:
+                    async with session.post(url, headers=headers, data=form) as resp:
+                        body = await resp.read()
+                        if resp.status >= 400:
+                            text = body.decode(errors="replace")
+                            logger.error("File upload error", status=resp.status, body=text)
+                            raise _api_error(resp, text)
+
+                        return self.codec.decode_into(body, FileUploadResponse)
+                except aiohttp.ClientError as e:
+                    # aiohttp wraps errors of the body iterator in a connection error.
+                    if isinstance(e.__cause__, UploadSourceError):
+                        raise e.__cause__
+                    raise
+
+        return await self.retry.call("upload_file", attempt)
+
+    async def upload_stream(self, chunks: AsyncIterable[bytes], filename: str, user: str,
+                            conversation_id: Optional[str] = None) -> FileUploadResponse:
+        """
+        Upload a file from an async byte stream as a chunked multipart body,
+        to the backend of `conversation_id` when it already exists.
+
+        Not retried: the source stream cannot be replayed once consumed.
+        An `UploadSourceError` raised by `chunks` propagates unwrapped and
+        does not count against the backend.
+        """
+        backend = self.balancer.route(conversation_id, user, uploads=True)
+        url = backend.url(settings.file_upload_endpoint)
 
         form = aiohttp.FormData()
         form.add_field(
             "file",
-            file_data,
+            chunks,
             filename=filename,
-            content_type=mime_type  # ← new
+            content_type=get_mime_type(filename)
         )
         form.add_field("user", user)
 
-        headers = {"Authorization": f"Bearer {self.api_key}"}
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, data=form) as resp:
-                body = await resp.text()
-                if resp.status >= 400:
-                    logger.error("File upload error", status=resp.status, body=body)
-                    raise PhyxieAPIError(f"{resp.status}: {body}")
-
-                return FileUploadResponse(**json.loads(body))
+        headers = {"Authorization": f"Bearer {backend.api_key}"}
+
+        session = await self.pool.session()
+        try:
+            async with self._admit(backend):
+                try:
+                    async with session.post(url, headers=headers, data=form) as resp:
+                        body = await resp.read()
+                        if resp.status >= 400:
+                            text = body.decode(errors="replace")
+                            logger.error("File upload error", status=resp.status, body=text)
+                            raise _api_error(resp, text)
+
+                        return self.codec.decode_into(body, FileUploadResponse)
+                except aiohttp.ClientError as e:
+                    # aiohttp wraps errors of the body iterator in a connection error.
+                    if isinstance(e.__cause__, UploadSourceError):
+                        raise e.__cause__
+                    raise
+
+        except aiohttp.ClientError as e:
+            logger.error("Network error during file upload", error=str(e))
+            raise PhyxieAPIError(f"Network error: {str(e)}") from e
 
     # --------------------------------------------------------------------- #
     #  Conversation deletion                                                #
     # --------------------------------------------------------------------- #
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     async def delete_conversation(self, conversation_id: str, user: str) -> bool:
         """DELETE `/conversations/{conversation_id}`."""
-        url = f"{self.base_url}{settings.conversations_endpoint}/{conversation_id}"
+        backend = self.balancer.route(conversation_id, user)
+        url = backend.url(f"{settings.conversations_endpoint}/{conversation_id}")
         payload = {"user": user}
 
-        async with aiohttp.ClientSession() as session:
-            async with session.delete(url, headers=self.headers, json=payload) as resp:
-                body = await resp.text()
-
-                match resp.status:
-                    case 204:
-                        return True
-                    case 404:
-                        logger.warning("Conversation not found on server", conversation_id=conversation_id)
-                        return True
-                    case _ if resp.status >= 400:
-                        logger.error("Delete conversation error", status=resp.status, body=body)
-                        raise PhyxieAPIError(f"{resp.status}: {body}")
-
-        return False
+        async def attempt() -> bool:
+            async with self._admit(backend):
+                async with self.transport.request("DELETE", url, headers=backend.headers,
+                                                  data=self.codec.encode(payload)) as resp:
+                    body = await resp.text()
+
+                    match resp.status:
+                        case 204:
+                            return True
+                        case 404:
+                            logger.warning("Conversation not found on server", conversation_id=conversation_id)
+                            return True
+                        case _ if resp.status >= 400:
+                            logger.error("Delete conversation error", status=resp.status, body=body)
+                            raise _api_error(resp, body)
+
+            return False
+
+        deleted = await self.retry.call("delete_conversation", attempt)
+        if deleted:
+            self.balancer.forget(conversation_id)
+        return deleted
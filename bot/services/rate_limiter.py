@@ -0,0 +1,282 @@
+"""Outbound Telegram rate limiting with priority lanes and flood-control handling."""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import statistics
+import time
+from collections import OrderedDict, deque
+from enum import IntEnum
+from typing import Any, Callable, Coroutine, Deque, Dict, List, Optional, Tuple
+
+import structlog
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from config.settings import settings
+
+logger = structlog.get_logger(__name__)
+
+
+class Priority(IntEnum):
+    """
+    Lanes of the outbound scheduler; lower values are served first. They
+    start at 1 because PTB drops a falsy `rate_limit_args`.
+    """
+    HIGH = 1      # command replies, short interactive answers
+    NORMAL = 2    # text answers, edits, error replies
+    BULK = 3      # rendered tiles, photos, documents
+
+
+# Methods whose calls are bulk media unless the caller says otherwise.
+_BULK_ENDPOINTS = frozenset({
+    "sendPhoto", "sendMediaGroup", "sendDocument", "sendVideo", "sendAnimation", "sendAudio",
+})
+# Chat methods that do not count towards Telegram's message limits.
+_UNLIMITED_ENDPOINTS = frozenset({"sendChatAction"})
+
+
+def retry_seconds(error: RetryAfter) -> float:
+    """`RetryAfter` delay in seconds without tripping PTB's int/timedelta deprecation warning."""
+    delay = getattr(error, "_retry_after", None)
+    if delay is not None:
+        return delay.total_seconds()
+    return float(error.retry_after)
+
+
+class _Bucket:
+    """
+    Token bucket whose waiters are served by (priority, arrival). `pause`
+    withholds all tokens for a while, e.g. after Telegram's flood control.
+    """
+
+    def __init__(self, rate: float, burst: float) -> None:
+        if rate <= 0:
+            raise ValueError("Rate limits must be positive")
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    @property
+    def idle(self) -> bool:
+        self._refill(time.monotonic())
+        return not self._waiters and self.tokens >= self.burst and self.updated >= self.paused_until
+
+    @property
+    def paused(self) -> bool:
+        return time.monotonic() < self.paused_until
+
+    async def acquire(self, priority: int, seq: int) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        if not self._waiters and now >= self.paused_until and self.tokens >= 1:
+            self.tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, seq, future))
+        self._arm()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.tokens += 1  # granted, but the caller went away
+            raise
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._arm()
+
+    def _arm(self) -> None:
+        if self._timer is not None or not self._waiters:
+            return
+        now = time.monotonic()
+        self._refill(now)
+        delay = max(self.paused_until - now, (1 - self.tokens) / self.rate, 0.0)
+        self._timer = asyncio.get_running_loop().call_later(delay, self._wake)
+
+    def _wake(self) -> None:
+        self._timer = None
+        now = time.monotonic()
+        self._refill(now)
+        if now >= self.paused_until:
+            while self._waiters and self.tokens >= 1:
+                _, _, future = heapq.heappop(self._waiters)
+                if future.done():
+                    continue  # cancelled while waiting
+                self.tokens -= 1
+                future.set_result(None)
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        self._arm()
+
+
+class _Lane:
+    """Counters and recent wait times of one priority lane."""
+
+    def __init__(self, samples: int = 1024) -> None:
+        self.queued = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.max_wait = 0.0
+        self.waits: Deque[float] = deque(maxlen=samples)
+
+    def record_wait(self, seconds: float) -> None:
+        self.waits.append(seconds)
+        self.max_wait = max(self.max_wait, seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self.waits)
+        return {
+            "queued": self.queued,
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "wait_p50": round(statistics.median(waits), 3) if waits else 0.0,
+            "wait_p95": round(waits[int(0.95 * (len(waits) - 1))], 3) if waits else 0.0,
+            "wait_max": round(self.max_wait, 3),
+        }
+
+
+class TelegramRateLimiter(BaseRateLimiter[int]):
+    """
+    Schedule outgoing Bot API calls under a global and a per-chat limit.
+
+    Calls to a chat first take a token from that chat's bucket (private and
+    group chats have separate limits), then from the global one. Waiters
+    are served by priority lane and then in arrival order, so a command
+    reply overtakes a burst of answer tiles queued before it. The lane is
+    `rate_limit_args` when given (a `Priority`), otherwise BULK for media
+    and NORMAL for everything else. Calls without a chat (getMe, getFile,
+    ...) and chat actions are not limited.
+
+    On `RetryAfter` the chat's bucket is paused for the requested time and
+    the call is requeued in its lane, up to `max_retries` times; delays
+    longer than `max_retry_after` are raised to the caller.
+    """
+
+    def __init__(
+            self,
+            global_rate: Optional[float] = None,
+            global_burst: Optional[float] = None,
+            chat_rate: Optional[float] = None,
+            chat_burst: Optional[float] = None,
+            group_rate: Optional[float] = None,
+            group_burst: Optional[float] = None,
+            max_retries: Optional[int] = None,
+            max_retry_after: Optional[float] = None,
+            max_chats: int = 10000,
+    ) -> None:
+        self.global_rate = settings.telegram_global_rate if global_rate is None else global_rate
+        self.global_burst = settings.telegram_global_burst if global_burst is None else global_burst
+        self.chat_rate = settings.telegram_chat_rate if chat_rate is None else chat_rate
+        self.chat_burst = settings.telegram_chat_burst if chat_burst is None else chat_burst
+        self.group_rate = settings.telegram_group_rate if group_rate is None else group_rate
+        self.group_burst = settings.telegram_group_burst if group_burst is None else group_burst
+        self.max_retries = settings.telegram_max_retries if max_retries is None else max_retries
+        self.max_retry_after = (
+            settings.telegram_max_retry_after if max_retry_after is None else max_retry_after
+        )
+        self.max_chats = max_chats
+
+        self._global = _Bucket(self.global_rate, self.global_burst)
+        self._chats: "OrderedDict[str, _Bucket]" = OrderedDict()
+        self._lanes: Dict[Priority, _Lane] = {p: _Lane() for p in Priority}
+        self._seq = itertools.count()
+
+    async def initialize(self) -> None:
+        logger.info("Telegram rate limiter ready",
+                    global_rate=self.global_rate,
+                    chat_rate=self.chat_rate,
+                    group_rate=self.group_rate)
+
+    async def shutdown(self) -> None:
+        logger.info("Telegram rate limiter stopped", **self.stats())
+
+    def _chat_bucket(self, chat_id: Any) -> _Bucket:
+        key = str(chat_id)
+        bucket = self._chats.get(key)
+        if bucket is None:
+            # Negative ids are groups and channels; @usernames are channels.
+            group = not key.lstrip("-").isdigit() or key.startswith("-")
+            bucket = _Bucket(self.group_rate, self.group_burst) if group else _Bucket(self.chat_rate, self.chat_burst)
+            self._chats[key] = bucket
+            while len(self._chats) > self.max_chats:
+                oldest_key, oldest = next(iter(self._chats.items()))
+                if not oldest.idle:
+                    break
+                del self._chats[oldest_key]
+        else:
+            self._chats.move_to_end(key)
+        return bucket
+
+    async def process_request(
+            self,
+            callback: Callable[..., Coroutine[Any, Any, Any]],
+            args: Any,
+            kwargs: Dict[str, Any],
+            endpoint: str,
+            data: Dict[str, Any],
+            rate_limit_args: Optional[int],
+    ) -> Any:
+        chat_id = data.get("chat_id")
+        if chat_id is None or endpoint in _UNLIMITED_ENDPOINTS:
+            return await callback(*args, **kwargs)
+
+        if rate_limit_args is not None:
+            priority = Priority(rate_limit_args)
+        else:
+            priority = Priority.BULK if endpoint in _BULK_ENDPOINTS else Priority.NORMAL
+        lane = self._lanes[priority]
+        seq = next(self._seq)
+
+        for attempt in itertools.count():
+            bucket = self._chat_bucket(chat_id)
+            started = time.monotonic()
+            lane.queued += 1
+            try:
+                await bucket.acquire(priority, seq)
+                await self._global.acquire(priority, seq)
+            finally:
+                lane.queued -= 1
+            lane.record_wait(time.monotonic() - started)
+
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                delay = retry_seconds(e) + 0.1
+                if attempt >= self.max_retries or delay > self.max_retry_after:
+                    lane.failed += 1
+                    logger.error("Telegram flood control; giving up",
+                                 chat_id=chat_id, endpoint=endpoint, retry_after=delay, attempts=attempt + 1)
+                    raise
+                lane.retried += 1
+                logger.warning("Telegram flood control; requeueing",
+                               chat_id=chat_id, endpoint=endpoint, retry_after=delay, lane=priority.name)
+                bucket.pause(delay)
+                continue
+            lane.sent += 1
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-lane queue depth, counters and wait times (seconds), plus chat bucket state."""
+        return {
+            "lanes": {p.name.lower(): lane.stats() for p, lane in self._lanes.items()},
+            "chats": len(self._chats),
+            "paused_chats": sum(1 for b in self._chats.values() if b.paused),
+        }
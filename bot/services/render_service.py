@@ -0,0 +1,266 @@
+"""LaTeX tile rendering in a pool of worker processes, off the event loop."""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import io
+import multiprocessing
+import os
+import signal
+import statistics
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Deque, Dict, List, Optional
+
+import structlog
+
+from config.settings import settings
+from bot.utils.latex_render import MarkdownMathTiler, TileCache
+
+logger = structlog.get_logger(__name__)
+
+
+class RenderError(Exception):
+    """Raised when an answer could not be rendered to tiles."""
+
+
+class RenderOverloadedError(RenderError):
+    """Raised instead of queueing when the render queue is full."""
+
+
+class RenderTimeoutError(RenderError):
+    """Raised when a tile took longer than the render timeout."""
+
+
+# --- worker process side ------------------------------------------------
+
+_tiler: Optional[MarkdownMathTiler] = None
+_ready: Optional[Any] = None  # multiprocessing Barrier shared by the pool's workers
+
+# How long a warm-up ping waits for the other workers before giving up.
+_WARM_TIMEOUT = 60.0
+
+
+def _init_worker(ready: Optional[Any] = None) -> None:
+    """Pool initializer: build the tiler and draw once so fonts and mathtext are loaded."""
+    global _tiler, _ready
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent handles Ctrl+C
+    _tiler = MarkdownMathTiler()
+    _tiler.draw_tile(r"$E = mc^2$", True)
+    _ready = ready
+
+
+def _draw_tile(chunk: str, is_math: bool) -> bytes:
+    return _tiler.draw_tile(chunk, is_math).getvalue()
+
+
+def _ping() -> int:
+    """
+    Block until every worker holds a ping, so one ping per worker really
+    reaches every process instead of queueing on the first one up.
+    """
+    if _ready is not None:
+        try:
+            _ready.wait(_WARM_TIMEOUT)
+        except threading.BrokenBarrierError:
+            pass
+    return os.getpid()
+
+
+# --- event loop side ----------------------------------------------------
+
+class _Timings:
+    """Recent durations with percentiles."""
+
+    def __init__(self, samples: int = 1024) -> None:
+        self.values: Deque[float] = deque(maxlen=samples)
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.values.append(seconds)
+        self.max = max(self.max, seconds)
+
+    def stats(self) -> Dict[str, float]:
+        values = sorted(self.values)
+        return {
+            "p50": round(statistics.median(values), 3) if values else 0.0,
+            "p95": round(values[int(0.95 * (len(values) - 1))], 3) if values else 0.0,
+            "max": round(self.max, 3),
+        }
+
+
+class RenderService:
+    """
+    Render Markdown + LaTeX answers with `MarkdownMathTiler` in worker
+    processes, so matplotlib never blocks the event loop. Pyplot keeps
+    global state, which rules out threads.
+
+    The answer is split into tiles in the event loop (cheap) and the tiles
+    are drawn in parallel, at most `workers` at a time; further tiles wait
+    in a queue of `max_queue`, and answers that would overflow it are
+    rejected with `RenderOverloadedError` unless nothing else is pending.
+    A tile running longer than `timeout` raises `RenderTimeoutError`:
+    since a running job cannot be cancelled, the pool's processes are
+    killed and a fresh pool takes over. Tiles that were running next to it
+    are drawn again once.
+
+    Tiles already in the `TileCache` are not drawn again, and identical
+    tiles requested at the same time are drawn once. With `workers=0`
+    tiles are drawn inline, as before the pool existed.
+    """
+
+    def __init__(
+            self,
+            workers: Optional[int] = None,
+            max_queue: Optional[int] = None,
+            timeout: Optional[float] = None,
+            cache: Optional[TileCache] = None,
+    ) -> None:
+        self.workers = settings.render_workers if workers is None else workers
+        self.max_queue = settings.render_queue_size if max_queue is None else max_queue
+        self.timeout = settings.render_timeout if timeout is None else timeout
+        self.tiler = MarkdownMathTiler()
+        self.cache = TileCache() if cache is None else cache
+
+        self._context = multiprocessing.get_context("spawn")
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(max(1, self.workers))
+        self._pending = 0
+
+        self.rendered = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self._queue_wait = _Timings()
+        self._render_time = _Timings()
+
+    async def start(self) -> None:
+        """Start the worker processes and wait until each has loaded matplotlib."""
+        if self.workers <= 0 or self._pool is not None:
+            return
+        self._pool = self._new_pool()
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*(loop.run_in_executor(self._pool, _ping) for _ in range(self.workers)))
+        logger.info("Render workers ready", workers=self.workers, pids=sorted(set(pids)))
+
+    async def close(self) -> None:
+        pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        await asyncio.to_thread(pool.shutdown, True, cancel_futures=True)
+        logger.info("Render workers stopped", **self.stats())
+
+    async def render(self, markdown: str) -> List[io.BytesIO]:
+        """
+        Return the PNG tiles for `markdown`, like `MarkdownMathTiler.render`.
+
+        Every failure (a worker's MemoryError, a broken pool, a bug in
+        drawing) is raised as `RenderError`, so callers can fall back to text.
+        """
+        try:
+            return await self._render(markdown)
+        except RenderError:
+            raise
+        except Exception as e:
+            logger.error("Tile rendering failed", error=str(e), exc_info=True)
+            raise RenderError(f"Tile rendering failed: {e!r}") from e
+
+    async def _render(self, markdown: str) -> List[io.BytesIO]:
+        chunks = self.tiler.plan(markdown)
+        keys = [TileCache.key(chunk, is_math, self.tiler.engine) for chunk, is_math in chunks]
+        tiles: List[Optional[bytes]] = list(await asyncio.gather(*(self.cache.get(key) for key in keys)))
+        missing = [i for i, data in enumerate(tiles) if data is None]
+
+        if self._pool is None:
+            for i in missing:
+                tiles[i] = self.tiler.draw_tile(*chunks[i]).getvalue()
+                await self.cache.put(keys[i], tiles[i])
+            return [io.BytesIO(data) for data in tiles]
+
+        if self._pending and self._pending + len(missing) > self.workers + self.max_queue:
+            self.rejected += 1
+            raise RenderOverloadedError(
+                f"Render queue full ({self._pending} tiles pending, {len(missing)} more requested)"
+            )
+
+        self._pending += len(missing)
+        tasks = [
+            asyncio.ensure_future(self.cache.get_or_render(keys[i], functools.partial(self._draw, *chunks[i])))
+            for i in missing
+        ]
+        try:
+            for i, data in zip(missing, await asyncio.gather(*tasks)):
+                tiles[i] = data
+        finally:
+            for task in tasks:
+                task.cancel()  # after a failure the other tiles are not needed
+            self._pending -= len(missing)
+        return [io.BytesIO(data) for data in tiles]
+
+    async def _draw(self, chunk: str, is_math: bool) -> bytes:
+        loop = asyncio.get_running_loop()
+        queued = loop.time()
+        async with self._slots:
+            started = loop.time()
+            self._queue_wait.add(started - queued)
+            for attempt in range(2):
+                pool = self._pool
+                if pool is None:
+                    raise RenderError("Render service is closed")
+                try:
+                    data = await asyncio.wait_for(
+                        loop.run_in_executor(pool, _draw_tile, chunk, is_math), self.timeout
+                    )
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    logger.warning("Tile render timed out; restarting render workers",
+                                   timeout=self.timeout, chunk=chunk[:80])
+                    self._recycle(pool)
+                    raise RenderTimeoutError(f"Tile took longer than {self.timeout}s") from None
+                except BrokenProcessPool:
+                    # Killed for another tile's timeout, or a worker crashed: draw it once more.
+                    self._recycle(pool)
+                    if attempt:
+                        raise RenderError("Render workers keep failing") from None
+                    continue
+                self.rendered += 1
+                self._render_time.add(loop.time() - started)
+                return data
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        ready = self._context.Barrier(self.workers)
+        return ProcessPoolExecutor(self.workers, mp_context=self._context,
+                                   initializer=_init_worker, initargs=(ready,))
+
+    def _recycle(self, pool: ProcessPoolExecutor) -> None:
+        """Kill `pool`'s processes and replace it, unless that happened already."""
+        if pool is not self._pool:
+            return
+        self.restarts += 1
+        self._pool = self._new_pool()
+        # Executors cannot cancel running jobs, so the processes are killed directly.
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
+        # Spawn the new workers now rather than on the next tile.
+        loop = asyncio.get_running_loop()
+        for _ in range(self.workers):
+            warm = loop.run_in_executor(self._pool, _ping)
+            warm.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters, queue depth, and queue-wait / render-time percentiles (seconds)."""
+        return {
+            "workers": self.workers,
+            "pending": self._pending,
+            "rendered": self.rendered,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "restarts": self.restarts,
+            "queue_wait": self._queue_wait.stats(),
+            "render_time": self._render_time.stats(),
+            "cache": self.cache.stats(),
+        }
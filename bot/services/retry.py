@@ -0,0 +1,151 @@
+"""Retry engine with error classification, Retry-After, full jitter and deadlines."""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+
+import structlog
+
+from config.settings import settings
+
+logger = structlog.get_logger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class RetryStats:
+    """Per-operation retry counters."""
+    calls: int = 0
+    attempts: int = 0
+    retries: int = 0
+    giveups: int = 0
+    wasted_seconds: float = 0.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a `Retry-After` header (delta-seconds or HTTP-date) into seconds."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RetryPolicy:
+    """
+    Retry async calls whose failure `classify` marks as transient.
+
+    Delays use full jitter (uniform between 0 and an exponential cap), but
+    a server-supplied `retry_after` on the exception is slept in full; when
+    it would end past the deadline the call gives up instead. `deadline`
+    only stops new attempts: no attempt starts once `deadline` seconds have
+    passed since the first one, but a running attempt is bounded by the
+    request timeout alone. Streams are only retried until their first item
+    reached the caller.
+    """
+
+    def __init__(
+            self,
+            classify: Callable[[BaseException], bool],
+            max_attempts: Optional[int] = None,
+            base_delay: Optional[float] = None,
+            max_delay: Optional[float] = None,
+            deadline: Optional[float] = None,
+    ) -> None:
+        self.classify = classify
+        self.max_attempts = settings.phyxie_retry_attempts if max_attempts is None else max_attempts
+        self.base_delay = settings.phyxie_retry_base_delay if base_delay is None else base_delay
+        self.max_delay = settings.phyxie_retry_max_delay if max_delay is None else max_delay
+        self.deadline = settings.phyxie_retry_deadline if deadline is None else deadline
+        self.stats: Dict[str, RetryStats] = {}
+
+    def _delay(self, exc: BaseException, attempt: int, started: float) -> Optional[float]:
+        """Return how long to sleep before the next attempt, or None to give up."""
+        if attempt >= self.max_attempts or not self.classify(exc):
+            return None
+
+        retry_after = getattr(exc, "retry_after", None)
+        if retry_after is not None:
+            # The server asked for this wait; retrying sooner just fails again.
+            delay = float(retry_after)
+        else:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+        if time.monotonic() + delay - started > self.deadline:
+            return None
+        return delay
+
+    async def _backoff(self, op: str, exc: BaseException, attempt: int, started: float,
+                       attempt_started: float) -> None:
+        """Account for a failed attempt; sleep before the next one or re-raise."""
+        stats = self.stats[op]
+        stats.wasted_seconds += time.monotonic() - attempt_started
+
+        delay = self._delay(exc, attempt, started)
+        if delay is None:
+            if attempt > 1:
+                stats.giveups += 1
+            raise exc
+
+        stats.retries += 1
+        stats.wasted_seconds += delay
+        logger.warning("Retrying Phyxie call",
+                       operation=op,
+                       attempt=attempt,
+                       delay=round(delay, 2),
+                       error=str(exc))
+        await asyncio.sleep(delay)
+
+    async def call(self, op: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Await `fn()` with retries."""
+        stats = self.stats.setdefault(op, RetryStats())
+        stats.calls += 1
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            stats.attempts += 1
+            attempt_started = time.monotonic()
+            try:
+                return await fn()
+            except Exception as e:
+                await self._backoff(op, e, attempt, started, attempt_started)
+
+    async def stream(self, op: str, open_stream: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """Iterate `open_stream()`, retrying only before the first item."""
+        stats = self.stats.setdefault(op, RetryStats())
+        stats.calls += 1
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            stats.attempts += 1
+            attempt_started = time.monotonic()
+            stream = open_stream()
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                await stream.aclose()
+                await self._backoff(op, e, attempt, started, attempt_started)
+                continue
+            break
+
+        try:
+            yield first
+            async for item in stream:
+                yield item
+        finally:
+            await stream.aclose()
@@ -0,0 +1,491 @@
+"""Fan updates out to worker processes, sharded by a consistent hash of the user."""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import hashlib
+import multiprocessing
+import os
+import signal
+import struct
+import tempfile
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+import structlog
+from telegram import Update
+
+from bot.utils.json_codec import JSONCodec, get_codec
+from config.settings import settings
+
+logger = structlog.get_logger(__name__)
+
+_HEADER = struct.Struct("!I")
+
+
+async def read_frame(reader: asyncio.StreamReader, codec: JSONCodec) -> Dict[str, Any]:
+    """Read one length-prefixed JSON frame; raises `IncompleteReadError` on EOF."""
+    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return codec.decode(await reader.readexactly(size))
+
+
+def write_frame(writer: asyncio.StreamWriter, codec: JSONCodec, message: Dict[str, Any]) -> None:
+    """Queue one frame; a single `write` keeps frames from concurrent tasks whole."""
+    body = codec.encode(message)
+    writer.write(_HEADER.pack(len(body)) + body)
+
+
+def shard_key(update: Update) -> Optional[str]:
+    """
+    The user id, which is what `ConversationManager` keys on; the chat id
+    for updates without a user. `None` means any worker may take it.
+    """
+    if update.effective_user is not None:
+        return str(update.effective_user.id)
+    if update.effective_chat is not None:
+        return f"chat:{update.effective_chat.id}"
+    return None
+
+
+class HashRing:
+    """Consistent hash ring with `replicas` virtual nodes per worker."""
+
+    def __init__(self, nodes: Iterable[int] = (), replicas: int = 128) -> None:
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, int] = {}
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+    @property
+    def nodes(self) -> Set[int]:
+        return set(self._owners.values())
+
+    def add(self, node: int) -> None:
+        for replica in range(self.replicas):
+            point = self._hash(f"{node}#{replica}")
+            if point not in self._owners:
+                bisect.insort(self._points, point)
+                self._owners[point] = node
+
+    def remove(self, node: int) -> None:
+        points = [p for p, n in self._owners.items() if n == node]
+        for point in points:
+            del self._owners[point]
+        self._points = sorted(self._owners)
+
+    def lookup(self, key: str) -> Optional[int]:
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+
+class _Link:
+    """The front's connection to one worker process (a restarted worker gets a new link)."""
+
+    def __init__(self, index: int, pid: int, writer: asyncio.StreamWriter) -> None:
+        self.index = index
+        self.pid = pid
+        self.writer = writer
+        self.connected_at = time.monotonic()
+        self.inflight = 0
+
+
+@dataclass
+class _Placement:
+    """Where a user's state lives, how many of their updates are in flight, and its last snapshot."""
+    owner: _Link
+    inflight: int = 0
+    state: Optional[Dict[str, Any]] = None
+
+
+class ShardSupervisor:
+    """
+    Front-process side of sharded deployment.
+
+    Spawns `workers` processes running `run_worker`, accepts their
+    connections on a Unix socket, and routes each update to the worker
+    that owns its user on a consistent hash ring. A user stays on the
+    worker that is processing their updates until it is idle, so per-user
+    ordering holds while the ring changes; the next update after a move is
+    preceded by an `adopt` frame carrying the user's conversation state as
+    of their last finished update, and the previous owner (if alive) gets a
+    `release`.
+
+    When a worker dies it leaves the ring at once, so only its users move;
+    its in-flight updates are lost, as they would be if a single process
+    crashed. The process is restarted with exponential backoff and rejoins
+    the ring when it connects again.
+    """
+
+    def __init__(
+            self,
+            workers: Optional[int] = None,
+            socket_path: Optional[str] = None,
+            replicas: Optional[int] = None,
+            restart_delay: Optional[float] = None,
+            max_restart_delay: Optional[float] = None,
+            start_timeout: Optional[float] = None,
+            state_size: Optional[int] = None,
+            worker_init: Optional[Callable[[], None]] = None,
+            bot_factory: Optional[Callable[[], Any]] = None,
+    ) -> None:
+        self.workers = settings.shard_workers if workers is None else workers
+        if self.workers < 1:
+            raise ValueError("Sharded mode needs at least one worker")
+        self.socket_path = (
+            (settings.shard_socket or os.path.join(tempfile.gettempdir(), f"phyxie-shards-{os.getpid()}.sock"))
+            if socket_path is None else socket_path
+        )
+        self.restart_delay = settings.shard_restart_delay if restart_delay is None else restart_delay
+        self.max_restart_delay = (
+            settings.shard_restart_max_delay if max_restart_delay is None else max_restart_delay
+        )
+        self.start_timeout = settings.shard_start_timeout if start_timeout is None else start_timeout
+        self.state_size = settings.shard_state_size if state_size is None else state_size
+        self.worker_init = worker_init
+        self.bot_factory = bot_factory
+
+        self._ring = HashRing(replicas=settings.shard_virtual_nodes if replicas is None else replicas)
+        self._codec = get_codec(settings.json_codec)
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: Dict[int, multiprocessing.process.BaseProcess] = {}
+        self._links: Dict[int, _Link] = {}
+        self._placements: "OrderedDict[str, _Placement]" = OrderedDict()
+        self._crashes: Dict[int, int] = {}
+        self._restart_at: Dict[int, float] = {}
+        self._restarts = 0
+        self._dispatched: Dict[int, int] = {}
+        self._connected = asyncio.Event()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._monitor: Optional[asyncio.Task] = None
+        self._closing = False
+        self.moved = 0
+        self.lost = 0
+        self.dropped = 0
+
+    # ----------------------------------------------------------------- #
+    #  Lifecycle                                                        #
+    # ----------------------------------------------------------------- #
+
+    async def start(self) -> None:
+        """Spawn the workers and wait until all of them have connected."""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._serve, path=self.socket_path)
+        for index in range(self.workers):
+            self._spawn(index)
+        self._monitor = asyncio.get_running_loop().create_task(self._watch())
+
+        try:
+            await asyncio.wait_for(self._connected.wait(), self.start_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Not all shard workers connected in time",
+                           connected=len(self._links), workers=self.workers)
+        logger.info("Shard workers ready", workers=len(self._links), socket=self.socket_path)
+
+    async def close(self, timeout: float = 60.0) -> None:
+        """Ask every worker to drain and exit; terminate the ones that do not."""
+        self._closing = True
+        if self._monitor is not None:
+            self._monitor.cancel()
+        for link in list(self._links.values()):
+            write_frame(link.writer, self._codec, {"type": "stop"})
+
+        deadline = time.monotonic() + timeout
+        for index, process in self._processes.items():
+            await asyncio.to_thread(process.join, max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning("Terminating shard worker", worker=index, pid=process.pid)
+                process.terminate()
+                await asyncio.to_thread(process.join, 5)
+
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        logger.info("Shard workers stopped", **self.stats())
+
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=run_worker,
+            args=(index, self.socket_path, self.worker_init, self.bot_factory, self.workers),
+            name=f"phyxie-worker-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+        logger.info("Shard worker spawned", worker=index, pid=process.pid)
+
+    async def _watch(self) -> None:
+        """Restart dead workers with exponential backoff."""
+        while True:
+            await asyncio.sleep(0.5)
+            now = time.monotonic()
+            for index, process in list(self._processes.items()):
+                if process.is_alive():
+                    continue
+                if index not in self._restart_at:
+                    delay = min(self.max_restart_delay, self.restart_delay * 2 ** self._crashes.get(index, 0))
+                    self._crashes[index] = self._crashes.get(index, 0) + 1
+                    self._restart_at[index] = now + delay
+                    logger.warning("Shard worker exited", worker=index, exitcode=process.exitcode,
+                                   restart_in=delay)
+                elif now >= self._restart_at[index]:
+                    del self._restart_at[index]
+                    self._restarts += 1
+                    self._spawn(index)
+
+    # ----------------------------------------------------------------- #
+    #  Worker connections                                               #
+    # ----------------------------------------------------------------- #
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            hello = await read_frame(reader, self._codec)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+
+        index = hello["index"]
+        link = _Link(index, hello["pid"], writer)
+        self._links[index] = link
+        self._ring.add(index)
+        if len(self._links) == self.workers:
+            self._connected.set()
+        logger.info("Shard worker connected", worker=index, pid=link.pid)
+
+        try:
+            while True:
+                frame = await read_frame(reader, self._codec)
+                if frame["type"] == "done":
+                    self._finished(link, frame["key"], frame.get("state"))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._disconnected(link)
+            writer.close()
+
+    def _finished(self, link: _Link, key: Optional[str], state: Optional[Dict[str, Any]]) -> None:
+        link.inflight -= 1
+        placement = self._placements.get(key) if key is not None else None
+        if placement is not None and placement.owner is link:
+            placement.inflight = max(0, placement.inflight - 1)
+            placement.state = state
+        if time.monotonic() - link.connected_at > self.max_restart_delay:
+            self._crashes.pop(link.index, None)
+
+    def _disconnected(self, link: _Link) -> None:
+        if self._links.get(link.index) is not link:
+            return
+        del self._links[link.index]
+        self._ring.remove(link.index)
+        self._connected.clear()
+
+        lost = 0
+        for placement in self._placements.values():
+            if placement.owner is link and placement.inflight:
+                lost += placement.inflight
+                placement.inflight = 0
+        self.lost += lost
+        if self._closing:
+            return
+        logger.warning("Shard worker disconnected; its users move to other workers",
+                       worker=link.index, lost_updates=lost, workers=len(self._links))
+
+        # A worker that dropped its connection but kept running is unusable.
+        process = self._processes.get(link.index)
+        if process is not None and process.is_alive():
+            process.terminate()
+
+    # ----------------------------------------------------------------- #
+    #  Routing                                                          #
+    # ----------------------------------------------------------------- #
+
+    async def dispatch(self, update: Update) -> None:
+        """Send `update` to the worker that owns its user, handing state over first if it moved."""
+        key = shard_key(update)
+        placement = self._placements.get(key) if key is not None else None
+
+        if placement is not None and placement.inflight and self._current(placement.owner):
+            link = placement.owner
+        else:
+            index = self._ring.lookup(key if key is not None else str(update.update_id))
+            if index is None:
+                self.dropped += 1
+                logger.error("No shard worker available; dropping update", update_id=update.update_id)
+                return
+            link = self._links[index]
+
+        if key is not None:
+            if placement is None:
+                placement = self._place(key, link)
+            elif placement.owner is not link:
+                write_frame(link.writer, self._codec, {"type": "adopt", "key": key, "state": placement.state})
+                if self._current(placement.owner):
+                    write_frame(placement.owner.writer, self._codec, {"type": "release", "key": key})
+                placement.owner = link
+                self.moved += 1
+            placement.inflight += 1
+            self._placements.move_to_end(key)
+
+        link.inflight += 1
+        self._dispatched[link.index] = self._dispatched.get(link.index, 0) + 1
+        write_frame(link.writer, self._codec, {"type": "update", "key": key, "update": update.to_dict()})
+        try:
+            await link.writer.drain()
+        except ConnectionError:
+            pass  # `_serve` notices the disconnect and moves the worker's users
+
+    def _current(self, link: _Link) -> bool:
+        return self._links.get(link.index) is link
+
+    def _place(self, key: str, link: _Link) -> _Placement:
+        placement = self._placements[key] = _Placement(owner=link)
+        while len(self._placements) > self.state_size:
+            oldest, entry = next(iter(self._placements.items()))
+            if entry.inflight:
+                break
+            del self._placements[oldest]
+        return placement
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": {
+                index: {
+                    "connected": index in self._links,
+                    "pid": process.pid,
+                    "inflight": self._links[index].inflight if index in self._links else 0,
+                    "dispatched": self._dispatched.get(index, 0),
+                }
+                for index, process in self._processes.items()
+            },
+            "users": len(self._placements),
+            "moved": self.moved,
+            "lost": self.lost,
+            "dropped": self.dropped,
+            "restarts": self._restarts,
+        }
+
+
+class ShardWorker:
+    """
+    Worker-process side: runs a full `PhyxieBot` whose updates come from
+    the front process instead of Telegram. Replies still go straight to
+    the Bot API. After each update the user's conversation state is
+    reported back, so the front can hand it to another worker later.
+    """
+
+    def __init__(self, bot, index: int, socket_path: str) -> None:
+        self.bot = bot
+        self.index = index
+        self.socket_path = socket_path
+        self._codec = get_codec(settings.json_codec)
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def run(self) -> None:
+        application = self.bot.application
+        async with application:
+            await self.bot.post_init(application)
+            await application.start()
+            try:
+                await self._serve()
+            finally:
+                if self._tasks:
+                    await asyncio.gather(*self._tasks, return_exceptions=True)
+                await application.stop()
+                if self._writer is not None:
+                    self._writer.close()
+        await self.bot.post_shutdown(application)
+
+    async def _serve(self) -> None:
+        reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+        write_frame(self._writer, self._codec, {"type": "hello", "index": self.index, "pid": os.getpid()})
+        await self._writer.drain()
+        logger.info("Shard worker serving", worker=self.index, pid=os.getpid())
+
+        while True:
+            try:
+                frame = await read_frame(reader, self._codec)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                logger.warning("Front process went away; draining", worker=self.index)
+                return
+
+            kind = frame["type"]
+            if kind == "update":
+                update = Update.de_json(frame["update"], self.bot.application.bot)
+                task = asyncio.get_running_loop().create_task(self._process(frame["key"], update))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            elif kind == "adopt":
+                self._import(frame["key"], frame["state"])
+            elif kind == "release":
+                self.bot.conversation_manager.import_state(frame["key"], None)
+            elif kind == "stop":
+                logger.info("Shard worker stopping", worker=self.index, inflight=len(self._tasks))
+                return
+
+    async def _process(self, key: Optional[str], update: Update) -> None:
+        application = self.bot.application
+        try:
+            # What Application's update fetcher does for each queued update.
+            await application.update_processor.process_update(update, application.process_update(update))
+        finally:
+            state = self._export(key, update) if key is not None else None
+            if self._writer is not None and not self._writer.is_closing():
+                write_frame(self._writer, self._codec, {"type": "done", "key": key, "state": state})
+
+    def _export(self, key: str, update: Update) -> Dict[str, Any]:
+        user = update.effective_user
+        username = (user.username or f"user_{user.id}") if user is not None else key
+        conversation = self.bot.conversation_manager.export_state(key)
+        conversation_id = conversation["conversation_id"] if conversation else None
+        return {
+            "username": username,
+            "conversation": conversation,
+            "affinity": self.bot.phyxie_service.balancer.export_affinity(username, conversation_id),
+        }
+
+    def _import(self, key: str, state: Optional[Dict[str, Any]]) -> None:
+        state = state or {}
+        conversation = state.get("conversation")
+        self.bot.conversation_manager.import_state(key, conversation)
+        if state.get("username"):
+            self.bot.phyxie_service.balancer.import_affinity(
+                state["username"],
+                conversation["conversation_id"] if conversation else None,
+                state.get("affinity") or {},
+            )
+
+
+def run_worker(
+        index: int,
+        socket_path: str,
+        initializer: Optional[Callable[[], None]] = None,
+        bot_factory: Optional[Callable[[], Any]] = None,
+        workers: int = 1,
+) -> None:
+    """Entry point of a worker process; `bot_factory` defaults to `PhyxieBot`."""
+    # Ctrl+C reaches the whole process group; the front decides when workers stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if initializer is not None:
+        initializer()
+
+    # Telegram's global limit is per bot: each worker gets its share.
+    settings.telegram_global_rate /= workers
+    settings.telegram_global_burst /= workers
+
+    if bot_factory is None:
+        from bot.bot import PhyxieBot
+        bot_factory = PhyxieBot
+
+    asyncio.run(ShardWorker(bot_factory(), index, socket_path).run())
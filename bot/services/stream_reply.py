@@ -0,0 +1,244 @@
+"""Streaming replies: live-edited Telegram messages fed by answer deltas."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import List, Optional
+
+import structlog
+from telegram import Message
+from telegram.constants import ChatType, MessageLimit
+from telegram.error import BadRequest, RetryAfter
+
+from config.settings import settings
+from bot.services.rate_limiter import retry_seconds
+from bot.utils.helpers import format_markdown_v2
+
+logger = structlog.get_logger(__name__)
+
+PLACEHOLDER = "💭 Thinking..."
+
+
+def _not_modified(error: BadRequest) -> bool:
+    return "not modified" in str(error).lower()
+
+
+class StreamingReply:
+    """
+    Show an answer while it is generated by editing a reply in place.
+
+    `feed` and `replace` only update the buffered text; a background task
+    flushes it to Telegram at most once per edit interval, so any number of
+    deltas between two flushes cost a single `editMessageText`. Unchanged
+    messages are never edited. The interval starts at `min_interval` (the
+    group interval in group chats) and adapts to how long edits take:
+    slow edits (queued behind the rate limiter, or flood control) stretch
+    it up to `max_interval`, fast ones shrink it back.
+
+    Text longer than `max_length` rolls over into further messages; a chunk
+    is cut at a line break or space where possible and never moves once
+    the next chunk exists. `finish` writes the final text with MarkdownV2
+    formatting, falling back to plain text per message if Telegram rejects
+    the markup.
+    """
+
+    def __init__(
+            self,
+            message: Message,
+            placeholder: str = PLACEHOLDER,
+            min_interval: Optional[float] = None,
+            max_interval: Optional[float] = None,
+            max_length: Optional[int] = None,
+    ):
+        self.message = message
+        self.placeholder = placeholder
+        if min_interval is None:
+            private = message.chat.type == ChatType.PRIVATE
+            min_interval = settings.stream_edit_interval if private else settings.stream_group_edit_interval
+        self.min_interval = min_interval
+        self.max_interval = max(
+            self.min_interval, settings.stream_max_edit_interval if max_interval is None else max_interval
+        )
+        self.max_length = min(
+            MessageLimit.MAX_TEXT_LENGTH, settings.stream_message_limit if max_length is None else max_length
+        )
+        self.interval = self.min_interval
+
+        self.text = ""
+        self.edits = 0
+        self._cuts: List[int] = []          # end offsets of sealed chunks
+        self._messages: List[Message] = []
+        self._sent: List[str] = []          # text currently shown in each message
+        self._dirty = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._next_flush = 0.0             # the first delta is shown right away
+
+    @property
+    def messages(self) -> List[Message]:
+        return list(self._messages)
+
+    async def start(self) -> None:
+        """Send the placeholder and start flushing."""
+        self._messages.append(await self.message.reply_text(self.placeholder))
+        self._sent.append(self.placeholder)
+        self._task = asyncio.create_task(self._run())
+
+    def feed(self, delta: str) -> None:
+        """Append an answer delta."""
+        if delta:
+            self.text += delta
+            self._dirty.set()
+
+    def replace(self, text: str) -> None:
+        """Replace the whole answer (Dify's `message_replace`)."""
+        self.text = text
+        self._cuts = [c for c in self._cuts if c < len(text)]
+        self._dirty.set()
+
+    async def finish(self) -> None:
+        """Stop the live updates and write the final, formatted text."""
+        await self._stop()
+        await self._flush(final=True)
+        logger.debug("Streamed reply finished",
+                     chat_id=self.message.chat_id,
+                     length=len(self.text),
+                     messages=len(self._messages),
+                     edits=self.edits)
+
+    async def discard(self) -> None:
+        """Stop and delete every message sent so far (the answer is shown some other way)."""
+        await self._stop()
+        for sent in self._messages:
+            try:
+                await sent.delete()
+            except BadRequest as e:
+                logger.warning("Could not delete streamed draft", error=str(e))
+        self._messages.clear()
+        self._sent.clear()
+
+    async def abort(self, note: Optional[str] = None) -> None:
+        """
+        Stop updating. A `note` replaces the placeholder when nothing was
+        streamed yet and is sent as a new message otherwise.
+        """
+        await self._stop()
+        if note is None:
+            return
+        if self._sent == [self.placeholder]:
+            await self._edit(0, note)
+        else:
+            await self.message.reply_text(note)
+
+    async def close(self) -> None:
+        """Stop the flusher without touching the messages (safe to call twice)."""
+        await self._stop()
+
+    # ------------------------------------------------------------------ #
+
+    async def _stop(self) -> None:
+        task, self._task = self._task, None
+        if task is None:
+            return
+        # Holding the lock means the flusher is not halfway through a flush.
+        async with self._lock:
+            task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._dirty.wait()
+            delay = self._next_flush - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)  # let more deltas coalesce
+            self._dirty.clear()
+            async with self._lock:
+                started = loop.time()
+                try:
+                    await self._flush(final=False)
+                except RetryAfter as e:
+                    # Drafts are expendable: wait it out and show the newer text later.
+                    self.interval = self.max_interval
+                    self._next_flush = loop.time() + max(retry_seconds(e), self.interval)
+                    self._dirty.set()
+                    continue
+                except Exception as e:
+                    logger.warning("Streaming edit failed", chat_id=self.message.chat_id, error=str(e))
+                    self._next_flush = loop.time() + self.max_interval
+                    continue
+                elapsed = loop.time() - started
+                if elapsed > self.interval / 2:
+                    self.interval = min(self.max_interval, self.interval * 1.5)
+                else:
+                    self.interval = max(self.min_interval, self.interval * 0.8)
+                self._next_flush = loop.time() + self.interval
+
+    def _chunks(self) -> List[str]:
+        """Split the text into sealed chunks plus the growing tail."""
+        text = self.text
+        start = self._cuts[-1] if self._cuts else 0
+        while len(text) - start > self.max_length:
+            window = text[start:start + self.max_length]
+            cut = window.rfind("\n")
+            if cut < self.max_length // 2:
+                cut = window.rfind(" ")
+            cut = start + (cut + 1 if cut >= self.max_length // 2 else self.max_length)
+            self._cuts.append(cut)
+            start = cut
+        bounds = [0] + self._cuts + [len(text)]
+        return [text[a:b] for a, b in zip(bounds, bounds[1:])]
+
+    async def _flush(self, final: bool) -> None:
+        if not self.text.strip():
+            return
+        chunks = self._chunks()
+
+        for i, chunk in enumerate(chunks):
+            if final:
+                await self._write_formatted(i, chunk)
+            elif i < len(self._sent):
+                if self._sent[i] != chunk:
+                    await self._edit(i, chunk)
+            else:
+                self._messages.append(await self.message.reply_text(chunk))
+                self._sent.append(chunk)
+
+        # A `message_replace` may have shortened the answer.
+        while len(self._messages) > len(chunks):
+            extra = self._messages.pop()
+            self._sent.pop()
+            try:
+                await extra.delete()
+            except BadRequest as e:
+                logger.warning("Could not delete streamed draft", error=str(e))
+
+    async def _write_formatted(self, index: int, chunk: str) -> None:
+        formatted = format_markdown_v2(chunk)
+        if len(formatted) <= MessageLimit.MAX_TEXT_LENGTH:
+            try:
+                if index < len(self._messages):
+                    if self._sent[index] != formatted:
+                        await self._edit(index, formatted, parse_mode="MarkdownV2")
+                else:
+                    self._messages.append(await self.message.reply_text(formatted, parse_mode="MarkdownV2"))
+                    self._sent.append(formatted)
+                return
+            except BadRequest as e:
+                logger.debug("MarkdownV2 rejected, sending plain text", error=str(e))
+
+        if index < len(self._messages):
+            if self._sent[index] != chunk:
+                await self._edit(index, chunk)
+        else:
+            self._messages.append(await self.message.reply_text(chunk))
+            self._sent.append(chunk)
+
+    async def _edit(self, index: int, text: str, parse_mode: Optional[str] = None) -> None:
+        try:
+            await self._messages[index].edit_text(text, parse_mode=parse_mode)
+        except BadRequest as e:
+            if not _not_modified(e):
+                raise
+        self._sent[index] = text
+        self.edits += 1
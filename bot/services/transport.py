@@ -0,0 +1,244 @@
+"""Pluggable HTTP transports for JSON and streaming Phyxie calls."""
+
+from __future__ import annotations
+
+import asyncio
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import Any, AsyncContextManager, AsyncIterator, Dict, Mapping, Optional, Tuple
+
+import aiohttp
+import structlog
+
+from bot.services.http_pool import HTTPPool
+from config.settings import settings
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
+
+try:
+    import h2
+except ImportError:  # pragma: no cover - optional dependency
+    h2 = None
+
+logger = structlog.get_logger(__name__)
+
+# Connection-level failures of any transport (timeouts included).
+CLIENT_ERRORS: Tuple[type, ...] = (aiohttp.ClientError,) + ((httpx.TransportError,) if httpx is not None else ())
+NETWORK_ERRORS: Tuple[type, ...] = CLIENT_ERRORS + (asyncio.TimeoutError,)
+TIMEOUT_ERRORS: Tuple[type, ...] = (asyncio.TimeoutError,) + ((httpx.TimeoutException,) if httpx is not None else ())
+
+
+class TransportResponse(ABC):
+    """Status, headers and body of a response, whatever client produced it."""
+
+    status: int
+    headers: Mapping[str, str]
+
+    @abstractmethod
+    async def read(self) -> bytes:
+        """Read the whole body."""
+
+    async def text(self) -> str:
+        return (await self.read()).decode(errors="replace")
+
+    @abstractmethod
+    def iter_chunks(self) -> AsyncIterator[bytes]:
+        """Yield body chunks as they arrive."""
+
+
+class Transport(ABC):
+    """
+    Sends JSON requests and reads (optionally streamed) responses.
+
+    Multipart uploads and Telegram downloads stay on the shared aiohttp
+    `HTTPPool`, which can stream async bodies; transports only carry the
+    JSON and SSE traffic that dominates connection usage.
+    """
+
+    name = "base"
+
+    async def start(self) -> None:
+        """Open connections lazily; override to pre-create clients."""
+
+    async def close(self) -> None:
+        """Release connections."""
+
+    @abstractmethod
+    def request(
+            self,
+            method: str,
+            url: str,
+            *,
+            headers: Optional[Mapping[str, str]] = None,
+            data: Optional[bytes] = None,
+            params: Optional[Mapping[str, str]] = None,
+            timeout: Optional[float] = None,
+    ) -> AsyncContextManager[TransportResponse]:
+        """Send a request; the response is open inside the returned context."""
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class _AiohttpResponse(TransportResponse):
+
+    def __init__(self, resp: aiohttp.ClientResponse) -> None:
+        self._resp = resp
+        self.status = resp.status
+        self.headers = resp.headers
+
+    async def read(self) -> bytes:
+        return await self._resp.read()
+
+    def iter_chunks(self) -> AsyncIterator[bytes]:
+        return self._resp.content.iter_any()
+
+
+class AiohttpTransport(Transport):
+    """HTTP/1.1 over the shared aiohttp pool: one connection per concurrent stream."""
+
+    name = "aiohttp"
+
+    def __init__(self, pool: HTTPPool) -> None:
+        self.pool = pool
+
+    @asynccontextmanager
+    async def request(self, method, url, *, headers=None, data=None, params=None, timeout=None):
+        session = await self.pool.session()
+        kwargs: Dict[str, Any] = {}
+        if timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+        async with session.request(method, url, headers=headers, data=data, params=params, **kwargs) as resp:
+            yield _AiohttpResponse(resp)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.pool.stats().__dict__)
+
+
+class _HttpxResponse(TransportResponse):
+
+    def __init__(self, resp: "httpx.Response") -> None:
+        self._resp = resp
+        self.status = resp.status_code
+        self.headers = resp.headers
+
+    async def read(self) -> bytes:
+        return await self._resp.aread()
+
+    def iter_chunks(self) -> AsyncIterator[bytes]:
+        return self._resp.aiter_bytes()
+
+
+class HttpxTransport(Transport):
+    """
+    httpx client with HTTP/2, multiplexing many concurrent streams over a
+    few connections per backend.
+
+    HTTPS backends negotiate HTTP/2 via ALPN. Plain `http://` backends
+    (e.g. a Dify instance on the local network) only speak HTTP/2 when
+    `prior_knowledge` is set, which disables HTTP/1.1 entirely.
+    """
+
+    name = "httpx"
+
+    def __init__(
+            self,
+            http2: bool = True,
+            prior_knowledge: Optional[bool] = None,
+            max_connections: Optional[int] = None,
+            keepalive_timeout: Optional[float] = None,
+            connect_timeout: Optional[float] = None,
+            request_timeout: Optional[float] = None,
+    ) -> None:
+        if httpx is None:
+            raise RuntimeError("HTTP_TRANSPORT=httpx requires `pip install httpx[http2]`")
+        if http2 and h2 is None:
+            raise RuntimeError("HTTP/2 support requires `pip install httpx[http2]`")
+
+        self.http2 = http2
+        self.prior_knowledge = (
+            settings.http2_prior_knowledge if prior_knowledge is None else prior_knowledge
+        )
+        self.max_connections = settings.http_pool_size if max_connections is None else max_connections
+        self.keepalive_timeout = (
+            settings.http_keepalive_timeout if keepalive_timeout is None else keepalive_timeout
+        )
+        self.connect_timeout = settings.http_connect_timeout if connect_timeout is None else connect_timeout
+        self.request_timeout = settings.http_request_timeout if request_timeout is None else request_timeout
+
+        self._client: Optional["httpx.AsyncClient"] = None
+        self._requests = 0
+        self._in_flight = 0
+
+    async def start(self) -> None:
+        if self._client is not None:
+            return
+        self._client = httpx.AsyncClient(
+            http1=not (self.http2 and self.prior_knowledge),
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=self.keepalive_timeout,
+            ),
+            timeout=httpx.Timeout(self.request_timeout, connect=self.connect_timeout),
+        )
+        logger.info("httpx transport opened",
+                    http2=self.http2,
+                    prior_knowledge=self.prior_knowledge,
+                    max_connections=self.max_connections)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            logger.info("Closing httpx transport", **self.stats())
+            await self._client.aclose()
+            self._client = None
+
+    @asynccontextmanager
+    async def request(self, method, url, *, headers=None, data=None, params=None, timeout=None):
+        if self._client is None:
+            await self.start()
+        request = self._client.build_request(
+            method,
+            url,
+            headers=headers,
+            content=data,
+            params=params,
+            timeout=httpx.USE_CLIENT_DEFAULT if timeout is None else timeout,
+        )
+        self._requests += 1
+        self._in_flight += 1
+        try:
+            resp = await self._client.send(request, stream=True)
+            try:
+                yield _HttpxResponse(resp)
+            finally:
+                await resp.aclose()
+        finally:
+            self._in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Request counters plus open connections, read defensively from httpcore."""
+        connections = []
+        if self._client is not None:
+            pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+            connections = list(getattr(pool, "connections", []) or [])
+        return {
+            "requests": self._requests,
+            "in_flight": self._in_flight,
+            "connections": len(connections),
+            "http2_connections": sum(1 for c in connections if "HTTP/2" in repr(c)),
+        }
+
+
+def get_transport(name: str, pool: HTTPPool) -> Transport:
+    """Return the transport selected by `HTTP_TRANSPORT` (`aiohttp` or `httpx`)."""
+    name = (name or "aiohttp").lower()
+    if name == "aiohttp":
+        return AiohttpTransport(pool)
+    if name == "httpx":
+        return HttpxTransport()
+    raise ValueError(f"Unknown HTTP transport {name!r}; choose aiohttp or httpx")
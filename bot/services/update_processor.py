@@ -0,0 +1,112 @@
+"""Update processor that keeps each chat ordered while chats run concurrently."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+import structlog
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from config.settings import settings
+
+logger = structlog.get_logger(__name__)
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Process updates from different chats concurrently, up to
+    `max_concurrent_updates` at a time, while updates of the same chat (and
+    of the same user, which is what `ConversationManager` keys on) run
+    strictly one after another in arrival order.
+
+    Each update waits for the previous update of its chat and user before
+    taking a processing slot, so waiting updates never hold slots that
+    other chats could use. `max_pending` bounds how many updates may be
+    in flight or waiting in total.
+
+    `on_arrival(update)` is called synchronously as soon as an update is
+    received, before it queues behind its chat, so that e.g. a running
+    answer can be superseded without waiting for it to finish.
+    """
+
+    def __init__(
+            self,
+            max_concurrent_updates: Optional[int] = None,
+            max_pending: Optional[int] = None,
+            on_arrival: Optional[Callable[[object], None]] = None,
+    ):
+        concurrency = settings.update_concurrency if max_concurrent_updates is None else max_concurrent_updates
+        pending = settings.update_max_pending if max_pending is None else max_pending
+        super().__init__(max(pending, concurrency))
+        self.concurrency = concurrency
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tails: Dict[Hashable, asyncio.Future] = {}
+        self.on_arrival = on_arrival
+
+    @staticmethod
+    def _ordering_keys(update: object) -> List[Hashable]:
+        if not isinstance(update, Update):
+            return []
+        keys: List[Hashable] = []
+        if update.effective_chat:
+            keys.append(("chat", update.effective_chat.id))
+        if update.effective_user:
+            keys.append(("user", update.effective_user.id))
+        return keys
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        if self.on_arrival is not None:
+            try:
+                self.on_arrival(update)
+            except Exception as e:
+                logger.error("Update arrival hook failed", error=str(e), exc_info=True)
+
+        keys = self._ordering_keys(update)
+        done = asyncio.get_running_loop().create_future()
+
+        # Chain behind the previous update of this chat/user. This runs
+        # before the first await, so chaining follows arrival order.
+        previous = {id(f): f for f in (self._tails.get(k) for k in keys) if f is not None}
+        for key in keys:
+            self._tails[key] = done
+
+        try:
+            for fut in previous.values():
+                # Shielded: cancelling this update must not cancel the
+                # predecessor's future, which its own task still resolves.
+                await asyncio.shield(fut)
+            async with self._slots:
+                await coroutine
+        except asyncio.CancelledError:
+            if asyncio.iscoroutine(coroutine):
+                coroutine.close()
+            raise
+        finally:
+            waiting = [fut for fut in previous.values() if not fut.done()]
+            if waiting:
+                # Cancelled before its turn: hand the turn on only once the
+                # predecessors finish, or the next update would overtake them.
+                asyncio.gather(*waiting).add_done_callback(lambda _: self._finish(done, keys))
+            else:
+                self._finish(done, keys)
+
+    def _finish(self, done: asyncio.Future, keys: List[Hashable]) -> None:
+        done.set_result(None)
+        for key in keys:
+            if self._tails.get(key) is done:
+                del self._tails[key]
+
+    @property
+    def waiting_chats(self) -> int:
+        """Number of chat/user keys that currently have updates in flight."""
+        return len(self._tails)
+
+    async def initialize(self) -> None:
+        logger.info("Update processor ready",
+                    max_concurrent_updates=self.concurrency,
+                    max_pending=self.max_concurrent_updates)
+
+    async def shutdown(self) -> None:
+        """Nothing to release; in-flight updates are awaited by the Application."""
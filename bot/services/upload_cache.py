@@ -0,0 +1,104 @@
+"""Cache of files already uploaded to Phyxie, to skip repeat uploads."""
+
+from __future__ import annotations
+
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+import structlog
+
+from config.settings import settings
+
+logger = structlog.get_logger(__name__)
+
+
+class UploadCache:
+    """
+    Map a Telegram `file_unique_id`, scoped to the uploading user, to the
+    `upload_file_id` Phyxie returned for it.
+
+    Entries expire after `ttl` seconds and the in-memory tier evicts least
+    recently used keys beyond `max_entries`. When `db_path` is set, entries
+    are also written to SQLite so they survive restarts.
+    """
+
+    def __init__(
+            self,
+            ttl: Optional[float] = None,
+            max_entries: Optional[int] = None,
+            db_path: Optional[str] = None,
+    ) -> None:
+        self.ttl = settings.upload_cache_ttl if ttl is None else ttl
+        self.max_entries = settings.upload_cache_size if max_entries is None else max_entries
+        db_path = settings.upload_cache_db if db_path is None else db_path
+
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS upload_cache ("
+                "key TEXT PRIMARY KEY, upload_file_id TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM upload_cache WHERE expires_at <= ?", (time.time(),))
+
+    @staticmethod
+    def key(user: str, file_unique_id: str) -> str:
+        """Build a cache key; upload ids are only valid for the uploading user."""
+        return f"{user}:tg:{file_unique_id}"
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached upload id for `key`, or None."""
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is None and self._db is not None:
+            row = self._db.execute(
+                "SELECT upload_file_id, expires_at FROM upload_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                entry = (row[0], row[1])
+                self._remember(key, entry)
+
+        if entry is None or entry[1] <= now:
+            if entry is not None:
+                self.invalidate(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: str, upload_file_id: str) -> None:
+        """Cache `upload_file_id` under `key` for `ttl` seconds."""
+        entry = (upload_file_id, time.time() + self.ttl)
+        self._remember(key, entry)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO upload_cache (key, upload_file_id, expires_at) VALUES (?, ?, ?)",
+                (key, entry[0], entry[1]),
+            )
+
+    def invalidate(self, key: str) -> None:
+        """Drop `key`, e.g. after Phyxie rejected a cached upload id."""
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM upload_cache WHERE key = ?", (key,))
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _remember(self, key: str, entry: Tuple[str, float]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
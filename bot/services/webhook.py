@@ -0,0 +1,200 @@
+"""Webhook intake: an embedded aiohttp server that feeds Telegram updates to the application."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import signal
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+import structlog
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+from bot.utils.json_codec import get_codec
+from config.settings import settings
+
+logger = structlog.get_logger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def derive_secret_token(bot_token: str) -> str:
+    """
+    A stable webhook secret derived from the bot token, so every instance
+    behind a load balancer agrees on it without extra configuration.
+    """
+    return hashlib.sha256(b"phyxie-webhook:" + bot_token.encode()).hexdigest()
+
+
+class WebhookServer:
+    """
+    Receive updates over HTTPS POSTs from Telegram.
+
+    Each request is checked against the secret token, decoded and put on
+    the application's `update_queue`, and acknowledged with 200 right away;
+    the application's update fetcher hands it to the update processor in
+    the background. Telegram therefore never waits on a handler, and never
+    redelivers an update because a reply was slow. Undecodable bodies are
+    logged and still acknowledged, since a retry would fail the same way.
+    Updates Telegram does redeliver (e.g. after a network error) are
+    recognised by `update_id` and dropped.
+    """
+
+    def __init__(
+            self,
+            application: Application,
+            url: Optional[str] = None,
+            path: Optional[str] = None,
+            listen: Optional[str] = None,
+            port: Optional[int] = None,
+            secret_token: Optional[str] = None,
+            max_connections: Optional[int] = None,
+            set_webhook: Optional[bool] = None,
+            drop_pending_updates: Optional[bool] = None,
+            recent_updates: int = 10000,
+    ) -> None:
+        self.application = application
+        self.url = settings.webhook_url if url is None else url
+        path = settings.webhook_path if path is None else path
+        self.path = path or urlparse(self.url).path or "/telegram"
+        self.listen = settings.webhook_listen if listen is None else listen
+        self.port = settings.webhook_port if port is None else port
+        secret_token = settings.webhook_secret_token if secret_token is None else secret_token
+        self.secret_token = secret_token or derive_secret_token(settings.telegram_bot_token)
+        self.max_connections = (
+            settings.webhook_max_connections if max_connections is None else max_connections
+        )
+        self.set_webhook = settings.webhook_set_on_start if set_webhook is None else set_webhook
+        self.drop_pending_updates = (
+            settings.webhook_drop_pending_updates if drop_pending_updates is None else drop_pending_updates
+        )
+
+        self._codec = get_codec(settings.json_codec)
+        self._recent: "OrderedDict[int, None]" = OrderedDict()
+        self._recent_size = recent_updates
+        self._runner: Optional[web.AppRunner] = None
+        self._started = 0.0
+        self.received = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.malformed = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get("/healthz", self.handle_health)
+        return app
+
+    async def start(self) -> None:
+        """Start listening, then point Telegram at `url` if configured to."""
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        self._started = time.monotonic()
+        logger.info("Webhook server listening", listen=self.listen, port=self.port, path=self.path)
+
+        if self.set_webhook:
+            if not self.url:
+                raise ValueError("WEBHOOK_URL is required to register the webhook")
+            await self.application.bot.set_webhook(
+                url=self.url,
+                secret_token=self.secret_token,
+                max_connections=self.max_connections,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=self.drop_pending_updates,
+            )
+            logger.info("Webhook registered",
+                        url=self.url,
+                        max_connections=self.max_connections,
+                        drop_pending_updates=self.drop_pending_updates)
+
+    async def stop(self) -> None:
+        """Stop accepting updates. The webhook stays registered for other instances."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+            logger.info("Webhook server stopped", **self.stats())
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            self.rejected += 1
+            logger.warning("Webhook request with invalid secret token", remote=request.remote)
+            return web.Response(status=403)
+
+        body = await request.read()
+        try:
+            update = Update.de_json(self._codec.decode(body), self.application.bot)
+        except Exception as e:
+            self.malformed += 1
+            logger.error("Undecodable webhook update", error=str(e), size=len(body))
+            return web.Response()
+
+        if self._seen(update.update_id):
+            self.duplicates += 1
+            logger.debug("Dropping redelivered update", update_id=update.update_id)
+            return web.Response()
+
+        self.received += 1
+        self.application.update_queue.put_nowait(update)
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    def _seen(self, update_id: int) -> bool:
+        if update_id in self._recent:
+            return True
+        self._recent[update_id] = None
+        while len(self._recent) > self._recent_size:
+            self._recent.popitem(last=False)
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "malformed": self.malformed,
+            "queued": self.application.update_queue.qsize(),
+            "uptime": round(time.monotonic() - self._started, 1) if self._started else 0.0,
+        }
+
+
+async def run_webhook(application: Application, server: Optional[WebhookServer] = None) -> None:
+    """
+    Webhook counterpart of `Application.run_polling`: run `post_init`, serve
+    updates until SIGINT/SIGTERM, then stop intake, let the application
+    drain queued updates, and run `post_shutdown`.
+    """
+    server = server or WebhookServer(application)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # pragma: no cover - Windows
+            pass
+
+    try:
+        async with application:
+            if application.post_init:
+                await application.post_init(application)
+            await application.start()
+            try:
+                await server.start()
+                await stop.wait()
+            finally:
+                await server.stop()
+                # Processes everything already queued before returning.
+                await application.stop()
+    finally:
+        if application.post_shutdown:
+            await application.post_shutdown(application)
@@ -0,0 +1,82 @@
+"""Front process of the sharded deployment: receives updates and fans them out to workers."""
+
+import asyncio
+from typing import Callable, Optional
+
+import structlog
+from telegram import Update
+from telegram.ext import Application, ContextTypes, TypeHandler
+from telegram.request import BaseRequest
+
+from config.settings import settings
+from bot.services.sharding import ShardSupervisor
+from bot.services.webhook import run_webhook
+
+logger = structlog.get_logger(__name__)
+
+
+class ShardedPhyxieBot:
+    """
+    Receive updates by polling or webhook and forward each one to the
+    worker process that owns its user (see `ShardSupervisor`). Every
+    worker runs a complete `PhyxieBot`, so conversation handling, LaTeX
+    rendering and Phyxie calls spread over `workers` cores.
+    """
+
+    def __init__(
+            self,
+            workers: Optional[int] = None,
+            worker_init: Optional[Callable[[], None]] = None,
+            bot_factory: Optional[Callable[[], object]] = None,
+            request: Optional[BaseRequest] = None,
+            get_updates_request: Optional[BaseRequest] = None,
+    ):
+        """
+        `worker_init` runs first in every worker process (e.g. to configure
+        logging); `bot_factory` builds the worker's bot instead of `PhyxieBot()`.
+        Both must be picklable, i.e. module-level functions.
+        """
+        self.token = settings.telegram_bot_token
+        self.supervisor = ShardSupervisor(workers, worker_init=worker_init, bot_factory=bot_factory)
+
+        builder = Application.builder().token(self.token)
+        if request is not None:
+            builder = builder.request(request)
+        if get_updates_request is not None:
+            builder = builder.get_updates_request(get_updates_request)
+        # Forwarding is quick and must keep arrival order: no concurrent updates here.
+        self.application = builder.build()
+        self.application.add_handler(TypeHandler(Update, self._dispatch))
+        self.application.add_error_handler(self._error_handler)
+
+    async def _dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        await self.supervisor.dispatch(update)
+
+    async def _error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+        logger.error("Forwarding update failed", error=str(context.error), exc_info=context.error)
+
+    async def post_init(self, application: Application) -> None:
+        await self.supervisor.start()
+
+    async def post_shutdown(self, application: Application) -> None:
+        await self.supervisor.close()
+
+    def run(self, mode: Optional[str] = None):
+        """Run the front process with long polling or the embedded webhook server."""
+        mode = (mode or settings.bot_mode).lower()
+        if mode not in ("polling", "webhook"):
+            raise ValueError(f"Unknown bot mode {mode!r}; choose polling or webhook")
+        logger.info("Starting sharded Phyxie Telegram Bot...", mode=mode, workers=self.supervisor.workers)
+
+        self.application.post_init = self.post_init
+        self.application.post_shutdown = self.post_shutdown
+
+        if mode == "webhook":
+            asyncio.run(run_webhook(self.application))
+        else:
+            self.application.run_polling(
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True
+            )
+
+        logger.info("Bot stopped")
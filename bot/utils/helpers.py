@@ -1,6 +1,7 @@
 """Helper functions for the bot."""
 
 import os
+import re
 import mimetypes
 from typing import Tuple, Optional
 from pathlib import Path
@@ -55,12 +56,55 @@ def format_file_size(size_bytes: int) -> str:
     return f"{size_bytes:.1f} TB"
 
 
+_MDV2_SPECIAL = re.compile(r'([_*\[\]()~`>#+\-=|{}.!\\])')
+_MD_TOKENS = re.compile(
+    r'```[^\n`]*\n(?P<pre>.*?)```'                 # fenced code block
+    r'|`(?P<code>[^`\n]+)`'                          # inline code
+    r'|\*\*(?P<bold>[^*\n]+?)\*\*'                   # **bold**
+    r'|__(?P<underline_bold>[^_\n]+?)__'              # __bold__
+    r'|(?<![\w*])\*(?P<italic>[^*\s][^*\n]*?)\*(?!\w)'  # *italic*
+    r'|(?<!\w)_(?P<italic2>[^_\s][^_\n]*?)_(?!\w)'      # _italic_
+    r'|\[(?P<link_text>[^\]\n]+)\]\((?P<link_url>[^)\s]+)\)'
+    r'|^(?P<heading>\#{1,6}[ \t]+[^\n]+)$',
+    re.DOTALL | re.MULTILINE,
+)
+
+
 def escape_markdown(text: str) -> str:
-    """Escape special characters for Telegram MarkdownV2."""
-    escape_chars = '_*[]()~`>#+-=|{}.!'
-    for char in escape_chars:
-        text = text.replace(char, f'\\{char}')
-    return text
+    """Escape every Telegram MarkdownV2 special character, backslash included."""
+    return _MDV2_SPECIAL.sub(r'\\\1', text)
+
+
+def format_markdown_v2(text: str) -> str:
+    """
+    Convert the common Markdown of model answers (code, bold, italics,
+    links, headings) to Telegram MarkdownV2 and escape everything else.
+    Unrecognised or unbalanced markup comes out literally. Every
+    MarkdownV2 reply goes through here, blocking and streaming alike.
+    """
+    out = []
+    pos = 0
+    for m in _MD_TOKENS.finditer(text):
+        out.append(escape_markdown(text[pos:m.start()]))
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == "pre":
+            body = m.group("pre").replace("\\", "\\\\").replace("`", "\\`")
+            out.append(f"```\n{body}```")
+        elif kind == "code":
+            body = m.group("code").replace("\\", "\\\\").replace("`", "\\`")
+            out.append(f"`{body}`")
+        elif kind in ("bold", "underline_bold"):
+            out.append(f"*{escape_markdown(m.group(kind))}*")
+        elif kind in ("italic", "italic2"):
+            out.append(f"_{escape_markdown(m.group(kind))}_")
+        elif kind == "link_url":
+            url = m.group("link_url").replace("\\", "\\\\").replace(")", "\\)")
+            out.append(f"[{escape_markdown(m.group('link_text'))}]({url})")
+        elif kind == "heading":
+            out.append(f"*{escape_markdown(m.group('heading').lstrip('#').strip())}*")
+    out.append(escape_markdown(text[pos:]))
+    return "".join(out)
 
 
 def truncate_text(text: str, max_length: int = 4000) -> str:
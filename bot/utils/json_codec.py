@@ -0,0 +1,134 @@
+"""Pluggable JSON codecs for Phyxie API traffic (msgspec / orjson / stdlib)."""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Type, TypeVar, Union
+
+import structlog
+
+from bot.models.schemas import StreamEvent
+
+try:  # optional fast codecs
+    import msgspec
+except ImportError:  # pragma: no cover - depends on environment
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
+
+logger = structlog.get_logger(__name__)
+
+T = TypeVar("T")
+Buffer = Union[bytes, bytearray, memoryview, str]
+
+
+@lru_cache(maxsize=None)
+def _field_names(cls: type) -> FrozenSet[str]:
+    return frozenset(f.name for f in dataclasses.fields(cls))
+
+
+class JSONCodec:
+    """
+    Stdlib codec and base class.
+
+    `encode` returns bytes ready to send as a request body; `decode_into`
+    builds a dataclass, ignoring keys the dataclass does not declare.
+    """
+
+    name = "json"
+
+    def encode(self, obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+    def decode(self, data: Buffer) -> Any:
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        return json.loads(data)
+
+    def decode_into(self, data: Buffer, cls: Type[T]) -> T:
+        raw: Dict[str, Any] = self.decode(data)
+        names = _field_names(cls)
+        return cls(**{k: v for k, v in raw.items() if k in names})
+
+    def decode_stream_event(self, data: Buffer) -> StreamEvent:
+        return StreamEvent.from_dict(self.decode(data))
+
+
+class OrjsonCodec(JSONCodec):
+    """orjson-backed codec."""
+
+    name = "orjson"
+
+    def encode(self, obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def decode(self, data: Buffer) -> Any:
+        return orjson.loads(data)
+
+
+class MsgspecCodec(JSONCodec):
+    """msgspec-backed codec that decodes straight into the schema dataclasses."""
+
+    name = "msgspec"
+
+    def __init__(self) -> None:
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+        self._typed: Dict[type, Any] = {}
+
+    def _typed_decoder(self, cls: type):
+        decoder = self._typed.get(cls)
+        if decoder is None:
+            decoder = self._typed[cls] = msgspec.json.Decoder(cls)
+        return decoder
+
+    def encode(self, obj: Any) -> bytes:
+        return self._encoder.encode(obj)
+
+    def decode(self, data: Buffer) -> Any:
+        return self._decoder.decode(data)
+
+    def decode_into(self, data: Buffer, cls: Type[T]) -> T:
+        return self._typed_decoder(cls).decode(data)
+
+    def decode_stream_event(self, data: Buffer) -> StreamEvent:
+        # Answer deltas are the hot path and need no raw payload; anything
+        # else (errors, files, thoughts) keeps the full dict in `data`.
+        try:
+            event = self._typed_decoder(StreamEvent).decode(data)
+            if event.is_answer:
+                return event
+        except msgspec.ValidationError:
+            pass
+        return StreamEvent.from_dict(self.decode(data))
+
+
+_CODECS: Dict[str, Type[JSONCodec]] = {"json": JSONCodec}
+if orjson is not None:
+    _CODECS["orjson"] = OrjsonCodec
+if msgspec is not None:
+    _CODECS["msgspec"] = MsgspecCodec
+
+
+def available_codecs() -> Dict[str, Type[JSONCodec]]:
+    """Return codecs usable in this environment, keyed by name."""
+    return dict(_CODECS)
+
+
+def get_codec(name: str = "auto") -> JSONCodec:
+    """
+    Return a codec by name. `auto` prefers msgspec, then orjson, then stdlib;
+    an unavailable explicit choice falls back the same way with a warning.
+    """
+    name = (name or "auto").lower()
+    if name != "auto" and name not in _CODECS:
+        logger.warning("JSON codec not available, falling back", requested=name)
+        name = "auto"
+    if name == "auto":
+        name = next(n for n in ("msgspec", "orjson", "json") if n in _CODECS)
+    return _CODECS[name]()
@@ -1,19 +1,39 @@
 from __future__ import annotations
 
+import asyncio
+import functools
+import hashlib
 import io
+import math
+import os
 import re
 import shutil
+import tempfile
 import textwrap
-from typing import List, Tuple
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 
 import matplotlib.pyplot as plt
+import structlog
 from matplotlib import rcParams
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from PIL import Image
 
+from config.settings import settings
+from bot.utils.markdown_lexer import Token, TokenKind, tokenize
+from bot.utils.tile_compositor import TileCompositor
+
+logger = structlog.get_logger(__name__)
+
 # --- GLOBAL CONSTANTS ---
 DPI = 100
 TILE_PX = 800
 FIGSIZE_INCHES = TILE_PX / DPI
+PAD_PX = int(0.3 * DPI)  # blank margin around the text, as savefig's pad_inches=0.3
+RENDER_REVISION = 4  # part of tile cache keys; bump when drawing changes
+ENGINES = ("compose", "agg", "pyplot")
 WRAP_WIDTH = 90
 CHAR_LIMIT = 550
 
@@ -43,122 +63,148 @@ def _patch_macros(tex: str) -> str:
     return tex
 
 
+_LATEX_ESCAPES = str.maketrans({
+    "&": r"\&",
+    "%": r"\%",
+    "$": r"\$",
+    "#": r"\#",
+    "_": r"\_",
+    "{": r"\{",
+    "}": r"\}",
+    "~": r"\textasciitilde{}",
+    "^": r"\^{}",
+    "\\": r"\textbackslash{}",
+})
+
+_HEADING_COMMANDS = {1: "chapter", 2: "section", 3: "subsection", 4: "subsubsection",
+                     5: "subparagraph", 6: "paragraph"}
+
+_STRAY_DOLLAR_RE = re.compile(r"(?<!\\)\$")
+
+
 def escape_latex(text: str) -> str:
     """
-    Escape LaTeX special chars in NON-MATH parts ONLY.
-    """
-    escape_chars = {
-        '&': r'\&',
-        '%': r'\%',
-        '$': r'\$',
-        '#': r'\#',
-        '_': r'\_',
-        '{': r'\{',
-        '}': r'\}',
-        '~': r'\textasciitilde{}',
-        '^': r'\^{}',
-        '\\': r'\textbackslash{}',
-    }
-    # Split text into segments: math ($...$ or $$...$$) and non-math
-    pattern = re.compile(r"(\$\$.*?\$\$|\$.*?\$)", re.DOTALL)
-    result = []
-    last = 0
-    for m in pattern.finditer(text):
-        non_math = text[last:m.start()]
-        for char, escape in escape_chars.items():
-            non_math = non_math.replace(char, escape)
-        result.append(non_math)
-        # math part, untouched
-        result.append(m.group(0))
-        last = m.end()
-    non_math = text[last:]
-    for char, escape in escape_chars.items():
-        non_math = non_math.replace(char, escape)
-    result.append(non_math)
-    return ''.join(result)
-
-
-def md_heading_to_latex(text: str) -> str:
-    """
-    Convert Markdown headings to LaTeX headings (optional).
+    Escape LaTeX special chars in text. Pass NON-MATH parts ONLY.
     """
-    text = re.sub(r"^###### (.*)", r"\\paragraph{\1}", text, flags=re.MULTILINE)
-    text = re.sub(r"^##### (.*)", r"\\subparagraph{\1}", text, flags=re.MULTILINE)
-    text = re.sub(r"^#### (.*)", r"\\subsubsection{\1}", text, flags=re.MULTILINE)
-    text = re.sub(r"^### (.*)", r"\\subsection{\1}", text, flags=re.MULTILINE)
-    text = re.sub(r"^## (.*)", r"\\section{\1}", text, flags=re.MULTILINE)
-    text = re.sub(r"^# (.*)", r"\\chapter{\1}", text, flags=re.MULTILINE)
-    return text
+    return text.translate(_LATEX_ESCAPES)
 
 
 class MarkdownMathTiler:
     """
     Convert mixed Markdown + LaTeX into 800x800 PNG images for Telegram.
     Handles long Markdown, headings, and robust LaTeX math.
+
+    The `engine` decides how a tile is drawn:
+
+    - "compose": every word and `$...$` expression is rasterised once by
+      mathtext and cached; tiles are blitted together from those bitmaps
+      (`TileCompositor`). Needs mathtext, so with a LaTeX install tiles
+      are drawn by "agg" instead.
+    - "agg": the tile is a figure drawn on a private Agg canvas and
+      PNG-encoded once.
+    - "pyplot": the figure goes through pyplot, `savefig(bbox_inches="tight")`
+      and a PIL re-encode.
     """
 
+    def __init__(self, engine: Optional[str] = None):
+        engine = settings.render_engine if engine is None else engine
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown render engine {engine!r}, expected one of {', '.join(ENGINES)}")
+        self.engine = "agg" if engine == "compose" and FULL_LATEX else engine
+        self._compositor: Optional[TileCompositor] = None
+
+    @property
+    def compositor(self) -> TileCompositor:
+        if self._compositor is None:
+            self._compositor = TileCompositor(TILE_PX, PAD_PX, DPI, rcParams["font.size"])
+        return self._compositor
+
     def render(self, markdown: str) -> List[io.BytesIO]:
         """
         Return list of 800x800 PNG image buffers from the markdown string.
         """
-        cleaned = self._normalise_delimiters(markdown)
-        if FULL_LATEX:
-            cleaned = md_heading_to_latex(cleaned)
-            cleaned = escape_latex(cleaned)
-        blocks = self._split_blocks(cleaned)
-        chunks = self._pack_blocks(blocks)
-        return [self._draw_tile(chunk, is_math) for chunk, is_math in chunks]
-
-    # ---------- STEP A : delimiters & macro fix -------------------------
-    _INLINE_RE = re.compile(r"\\\((.*?)\\\)", re.DOTALL)
-    _DISPLAY_RE = re.compile(r"\\\[(.*?)\\\]", re.DOTALL)
-    _BOXED_RE = re.compile(r"\\boxed\s*\{([^{}]*?)\}")
-
-    def _normalise_delimiters(self, text: str) -> str:
-        # \( … \)  →  $ … $
-        text = self._INLINE_RE.sub(r"$\1$", text)
+        return [self.draw_tile(chunk, is_math) for chunk, is_math in self.plan(markdown)]
 
-        # \[ … \]  →  $$ … $$ (LaTeX) or $ … $ (mathtext)
-        def _disp(m):
-            body = " ".join(m.group(1).splitlines())
-            return f"$${body}$$" if FULL_LATEX else f"${body}$"
+    def plan(self, markdown: str) -> List[Tuple[str, bool]]:
+        """
+        Return the (chunk, is_math) pairs `render` draws, one per tile.
+        Cheap; the drawing is what takes time.
+        """
+        blocks = self._split_blocks(tokenize(markdown))
+        # Trailing spaces never show; dropping them lets equal tiles share a cache key.
+        return [("\n".join(l.rstrip() for l in chunk.splitlines()), is_math)
+                for chunk, is_math in self._pack_blocks(blocks)]
 
-        text = self._DISPLAY_RE.sub(_disp, text)
+    # ---------- STEP A : math bodies & macro fix ------------------------
+    _BOXED_RE = re.compile(r"\\boxed\s*\{([^{}]*?)\}")
 
-        if not FULL_LATEX:
-            text = self._BOXED_RE.sub(r"\1", text)
-            text = _patch_macros(text)
-        return text
+    def _math(self, token: Token) -> str:
+        """
+        A math token as `$...$`, or `$$...$$` for display math under LaTeX.
+        Its lines are joined; math tiles break lines at `\\` only.
+        """
+        body = " ".join(token.body.splitlines())
+        if FULL_LATEX:
+            return f"$${body}$$" if token.kind is TokenKind.DISPLAY_MATH else f"${body}$"
+        body = _patch_macros(self._BOXED_RE.sub(r"\1", body))
+        return f"${body}$"
 
-    # ---------- STEP B : block splitter & tagging math -----------------
-    _BLOCK_RE = re.compile(
-        r"(```.*?```|"  # fenced code
-        r"\$\$.*?\$\$|"  # display math
-        r"\$.*?\$|"  # inline math
-        r"^\s*#{1,6} .*?$|"  # Markdown heading
-        r"\s*---\s*$|"  # horizontal rule
-        r"[^\n]*?(?:\n|$))",  # one normal line
-        re.DOTALL | re.MULTILINE
-    )
-
-    def _split_blocks(self, text: str) -> List[Tuple[str, bool]]:
+    # ---------- STEP B : blocks from tokens -----------------------------
+    def _split_blocks(self, tokens: List[Token]) -> List[Tuple[str, bool]]:
         """
-        Return list of (block, is_math).
+        Return list of (block, is_math): one per line of text (with its
+        inline math), code fence, rule or display equation. A line that is
+        only an inline equation counts as math.
         """
-        blocks = []
-        for m in self._BLOCK_RE.finditer(text):
-            block = m.group(0).rstrip("\n")
-            if not block.strip():
-                continue
-            # Math: starts/ends with $$...$$ or $...$ and is not a code block or heading
-            block_stripped = block.strip()
-            is_math = (
-                    (block_stripped.startswith("$$") and block_stripped.endswith("$$")) or
-                    (block_stripped.startswith("$") and block_stripped.endswith("$") and len(block_stripped) > 2)
-            )
-            blocks.append((block, is_math))
+        blocks: List[Tuple[str, bool]] = []
+        line: List[Token] = []
+
+        def end_line() -> None:
+            shown = [t for t in line if t.kind is not TokenKind.TEXT or t.text.strip()]
+            if len(shown) == 1 and shown[0].kind is TokenKind.INLINE_MATH:
+                blocks.append((self._math(shown[0]), True))
+            elif shown:
+                blocks.append((self._line(line), False))
+            line.clear()
+
+        for token in tokens:
+            if token.kind is TokenKind.TEXT:
+                for k, part in enumerate(token.text.split("\n")):
+                    if k:
+                        end_line()
+                    if part:
+                        line.append(Token(TokenKind.TEXT, part, part))
+            elif token.kind in (TokenKind.CODE_FENCE, TokenKind.RULE):
+                end_line()
+                blocks.append((escape_latex(token.text) if FULL_LATEX else token.text, False))
+            elif token.kind is TokenKind.DISPLAY_MATH:
+                end_line()
+                if token.delimiter in ("$$", "\\["):
+                    blocks.append((self._math(token), True))
+                else:
+                    # \begin{env}: LaTeX gets it as is, mathtext cannot lay it out and shows the source.
+                    blocks.append((token.text, False))
+            else:
+                line.append(token)
+        end_line()
         return blocks
 
+    def _line(self, tokens: List[Token]) -> str:
+        parts = []
+        for token in tokens:
+            if token.kind is TokenKind.INLINE_MATH:
+                parts.append(self._math(token))
+            elif token.kind is TokenKind.HEADING and FULL_LATEX:
+                continue
+            elif FULL_LATEX:
+                parts.append(escape_latex(token.text))
+            else:
+                parts.append(_STRAY_DOLLAR_RE.sub(r"\\$", token.text))  # a `$` that opens no math
+        text = "".join(parts)
+        if tokens[0].kind is TokenKind.HEADING and FULL_LATEX:
+            return f"\\{_HEADING_COMMANDS[len(tokens[0].delimiter)]}{{{text.strip()}}}"
+        return text
+
     # ---------- STEP C : greedy packer ---------------------------------
     def _pack_blocks(self, blocks: List[Tuple[str, bool]]) -> List[Tuple[str, bool]]:
         tiles, current, current_is_math = [], "", None
@@ -175,7 +221,7 @@ class MarkdownMathTiler:
         return tiles
 
     # ---------- STEP D : soft-wrap for text only -----------------------
-    _INLINE_MATH_RE = re.compile(r"(\$[^$]*\$)")
+    _INLINE_MATH_RE = re.compile(r"((?<!\\)\$(?:[^$\\]|\\.)*\$)")
 
     def _wrap_line(self, line: str) -> str:
         if line.lstrip().startswith(("```", "#", "\\")):
@@ -192,10 +238,12 @@ class MarkdownMathTiler:
         return wrapped
 
     # ---------- STEP E : drawing one tile ------------------------------
-    def _draw_tile(self, chunk: str, is_math: bool) -> io.BytesIO:
+    def draw_tile(self, chunk: str, is_math: bool) -> io.BytesIO:
         """
-        Draw one tile. For math chunks, strip $$ and render with ismath=True.
-        For text, wrap lines and render as ismath=False.
+        Draw one tile. Math chunks are centred, one `$...$` per line; text
+        is wrapped and its inline `$...$` rendered by mathtext. If mathtext
+        cannot parse the tile, it is drawn again as plain text; the
+        "compose" engine falls back per expression instead.
         """
         if is_math:
             # Support both $$...$$ and $...$
@@ -204,25 +252,36 @@ class MarkdownMathTiler:
                 content = content[2:-2].strip()
             elif content.startswith("$") and content.endswith("$"):
                 content = content[1:-1].strip()
-            # Replace double-backslash with newline for multiline equations
-            content = content.replace("\\\\", "\n")
-            fig = plt.figure()
-            fig.patch.set_facecolor("white")
-            fig.subplots_adjust(left=0.03, right=0.97, top=0.97, bottom=0.03)
-            # Math is centered
-            fig.text(0.5, 0.5, content, ha="center", va="center", wrap=True, ismath=True)
+            # Replace double-backslash with newline for multiline equations;
+            # mathtext lays out line by line, so each line gets its own $...$
+            # (packed tiles hold several blocks, each still in its own $$...$$)
+            lines = [l.strip().strip("$").strip() for l in content.replace("\\\\", "\n").splitlines()]
+            lines = [l for l in lines if l]
+            if self.engine == "compose":
+                return self._encode(self.compositor.compose([f"${l}$" for l in lines], centred=True))
+            text = "\n".join(f"${l}$" for l in lines)
+            position = dict(x=0.5, y=0.5, ha="center", va="center")
         else:
+            if self.engine == "compose":
+                return self._encode(self.compositor.compose(chunk.splitlines(), centred=False))
             # Wrap each line
-            wrapped = "\n".join(self._wrap_line(l) for l in chunk.splitlines())
-            fig = plt.figure()
-            fig.patch.set_facecolor("white")
-            fig.subplots_adjust(left=0.03, right=0.97, top=0.97, bottom=0.03)
-            fig.text(0.03, 0.97, wrapped, ha="left", va="top", wrap=True, ismath=False)
+            text = "\n".join(self._wrap_line(l) for l in chunk.splitlines())
+            position = dict(x=0.03, y=0.97, ha="left", va="top")
 
-        tmp = io.BytesIO()
-        fig.savefig(tmp, format="png", bbox_inches="tight", pad_inches=0.3)
-        plt.close(fig)
-        tmp.seek(0)
+        fallback = (chunk.replace("$", r"\$"), dict(x=0.03, y=0.97, ha="left", va="top"))
+        if self.engine == "agg":
+            try:
+                image = self._draw_agg(text, position)
+            except ValueError:
+                # Unsupported macro or unbalanced math: show the source instead.
+                image = self._draw_agg(*fallback)
+            return self._encode(image)
+
+        try:
+            tmp = self._savefig(text, position)
+        except ValueError:
+            # Unsupported macro or unbalanced math: show the source instead.
+            tmp = self._savefig(*fallback)
 
         # Centre-pad to exactly 800 × 800 px
         img = Image.open(tmp).convert("RGB")
@@ -230,8 +289,293 @@ class MarkdownMathTiler:
         xoff = max((TILE_PX - img.width) // 2, 0)
         yoff = max((TILE_PX - img.height) // 2, 0)
         canvas.paste(img, (xoff, yoff))
+        return self._encode(canvas)
 
+    @staticmethod
+    def _encode(image: Image.Image) -> io.BytesIO:
         out = io.BytesIO()
-        canvas.save(out, format="PNG")
+        image.save(out, format="PNG")
         out.seek(0)
         return out
+
+    @staticmethod
+    def _draw_agg(text: str, position: dict) -> Image.Image:
+        """
+        Draw the tile straight into an 800 × 800 Agg canvas and return it
+        as an RGB image. Same layout as `_savefig` + centre-padding: the
+        text's extent is measured once, the text is moved so that the
+        extent plus `PAD_PX` is centred (or pinned top-left when it does
+        not fit), and the figure is rasterised a single time. No pyplot
+        state involved.
+        """
+        fig = Figure(figsize=(FIGSIZE_INCHES, FIGSIZE_INCHES), dpi=DPI, facecolor="white")
+        canvas = FigureCanvasAgg(fig)
+        artist = fig.text(s=text, **position)
+        renderer = canvas.get_renderer()
+
+        # Wrap as `wrap=True` would, but once and at the original position:
+        # the text is moved below.
+        if not artist.get_usetex():
+            x, ha = position["x"], position["ha"]
+            limit = TILE_PX * ((1 - x) if ha == "left" else 2 * min(x, 1 - x))
+            artist.set_text(_wrap_to_width(text, renderer, artist.get_fontproperties(), limit))
+
+        # Layout (mathtext parsing) happens here, once.
+        extent = artist.get_window_extent(renderer)
+
+        width, height = extent.width + 2 * PAD_PX, extent.height + 2 * PAD_PX
+        left = (TILE_PX - width) // 2 if width <= TILE_PX else 0
+        top = (TILE_PX - height) // 2 if height <= TILE_PX else 0
+        dx = left + PAD_PX - extent.x0
+        dy = (TILE_PX - top - PAD_PX) - extent.y1  # display y grows upwards
+        x, y = artist.get_position()
+        artist.set_position((x + dx / TILE_PX, y + dy / TILE_PX))
+
+        canvas.draw()
+        # The white figure background makes every pixel opaque, so dropping
+        # alpha is all the compositing left; PIL reads Agg's buffer in place.
+        rgba = Image.frombuffer("RGBA", (TILE_PX, TILE_PX), canvas.buffer_rgba(), "raw", "RGBA", 0, 1)
+        return rgba.convert("RGB")
+
+    @staticmethod
+    def _savefig(text: str, position: dict) -> io.BytesIO:
+        fig = plt.figure()
+        try:
+            fig.patch.set_facecolor("white")
+            fig.subplots_adjust(left=0.03, right=0.97, top=0.97, bottom=0.03)
+            fig.text(s=text, wrap=True, **position)
+            tmp = io.BytesIO()
+            fig.savefig(tmp, format="png", bbox_inches="tight", pad_inches=0.3)
+        finally:
+            plt.close(fig)
+        tmp.seek(0)
+        return tmp
+
+
+def _wrap_to_width(text: str, renderer, prop, limit: float) -> str:
+    """
+    Greedy word wrap of `text` to `limit` pixels, by the rule matplotlib's
+    `Text(wrap=True)` uses: lines break at spaces, and a line is math when
+    it holds an even, non-zero number of unescaped `$`.
+    """
+    out: List[str] = []
+    for line in text.split("\n"):
+        words = line.split(" ")
+        current = words[0]
+        for word in words[1:]:
+            candidate = f"{current} {word}"
+            dollars = len(_STRAY_DOLLAR_RE.findall(candidate))
+            width, _, _ = renderer.get_text_width_height_descent(
+                candidate, prop, ismath=dollars > 0 and dollars % 2 == 0)
+            if math.ceil(width) > limit:
+                out.append(current)
+                current = word
+            else:
+                current = candidate
+        out.append(current)
+    return "\n".join(out)
+
+
+# ---------- tile cache ---------------------------------------------------
+
+class TileCache:
+    """
+    Content-addressed cache of rendered tiles.
+
+    Keys hash the tile's chunk text and everything else that changes its
+    pixels (RENDER_REVISION, engine, DPI, TILE_PX, font settings, FULL_LATEX), so a
+    changed setting never serves stale images. The memory tier is an LRU bounded by
+    `max_bytes`; with `disk_dir` set, tiles are also written there as PNG
+    files and the oldest are deleted once they exceed `max_disk_bytes`.
+    The directory may be shared by several processes. File reads, writes
+    and deletions run in a thread, off the event loop.
+
+    `get_or_render` single-flights misses: concurrent requests for the
+    same key wait for one render. It is only abandoned when every caller
+    waiting for it has gone.
+    """
+
+    def __init__(
+            self,
+            max_bytes: Optional[int] = None,
+            disk_dir: Optional[str] = None,
+            max_disk_bytes: Optional[int] = None,
+    ) -> None:
+        self.max_bytes = settings.render_cache_bytes if max_bytes is None else max_bytes
+        disk_dir = settings.render_cache_dir if disk_dir is None else disk_dir
+        self.max_disk_bytes = settings.render_cache_disk_bytes if max_disk_bytes is None else max_disk_bytes
+
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()  # key -> file size, oldest first
+        self._disk_bytes = 0
+        self._inflight: Dict[str, List] = {}  # key -> [task, waiters]
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+        self.disk_dir: Optional[Path] = Path(disk_dir) if disk_dir else None
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._load_disk_index()
+
+    @staticmethod
+    def key(chunk: str, is_math: bool, engine: str) -> str:
+        parts = (RENDER_REVISION, engine, DPI, TILE_PX, WRAP_WIDTH, rcParams["font.size"], rcParams["mathtext.fontset"],
+                 FULL_LATEX, is_math, chunk)
+        return hashlib.sha256("\x1f".join(map(str, parts)).encode()).hexdigest()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Return the cached PNG for `key` from memory or disk, or None."""
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return data
+
+        if self.disk_dir is None:
+            return None
+        data = await asyncio.to_thread(self._read_file, self._path(key))
+        if data is None:
+            self._forget_disk(key)
+            return None
+        await self._delete(self._index_disk(key, len(data)))
+        self._remember(key, data)
+        self.disk_hits += 1
+        return data
+
+    async def put(self, key: str, data: bytes) -> None:
+        self._remember(key, data)
+        if self.disk_dir is None or len(data) > self.max_disk_bytes:
+            return
+        path = self._path(key)
+        try:
+            await asyncio.to_thread(self._write_file, path, data)
+        except OSError as e:
+            logger.warning("Could not write tile to the disk cache", path=str(path), error=str(e))
+            return
+        await self._delete(self._index_disk(key, len(data)))
+
+    async def get_or_render(self, key: str, render: Callable[[], Awaitable[bytes]]) -> bytes:
+        """Return the cached tile for `key`, rendering it once if needed."""
+        data = await self.get(key)
+        if data is not None:
+            return data
+
+        entry = self._inflight.get(key)
+        if entry is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._fill(key, render))
+            entry = self._inflight[key] = [task, 0]
+            task.add_done_callback(functools.partial(self._settle, key, entry))
+        else:
+            self.coalesced += 1
+
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0])
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                entry[0].cancel()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+        }
+
+    async def _fill(self, key: str, render: Callable[[], Awaitable[bytes]]) -> bytes:
+        data = await render()
+        await self.put(key, data)
+        return data
+
+    def _settle(self, key: str, entry: List, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # raised to the waiters; don't warn when they had all gone
+
+    def _remember(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.evictions += 1
+
+    def _path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.png"
+
+    def _load_disk_index(self) -> None:
+        files = []
+        for path in self.disk_dir.glob("??/*.png"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(files):
+            self._unlink(self._index_disk(key, size))
+
+    def _index_disk(self, key: str, size: int) -> List[Path]:
+        """Record a file on disk; return the files evicted to stay within `max_disk_bytes`."""
+        self._forget_disk(key)
+        self._disk[key] = size
+        self._disk_bytes += size
+        evicted = []
+        while self._disk_bytes > self.max_disk_bytes and self._disk:
+            old_key, old_size = self._disk.popitem(last=False)
+            self._disk_bytes -= old_size
+            evicted.append(self._path(old_key))
+        return evicted
+
+    def _forget_disk(self, key: str) -> None:
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
+
+    async def _delete(self, paths: List[Path]) -> None:
+        if paths:
+            await asyncio.to_thread(self._unlink, paths)
+
+    @staticmethod
+    def _read_file(path: Path) -> Optional[bytes]:
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        # Reads refresh the file's age so popular tiles survive eviction.
+        os.utime(path)
+        return data
+
+    @staticmethod
+    def _write_file(path: Path, data: bytes) -> None:
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _unlink(paths: List[Path]) -> None:
+        for path in paths:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
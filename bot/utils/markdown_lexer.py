@@ -0,0 +1,196 @@
+"""
+Single-pass lexer for answers mixing Markdown and LaTeX math.
+
+`tokenize` walks the text once and returns typed tokens whose `text`
+fields join back to the input. Finding a closing delimiter never scans
+the same text twice: a search that failed is remembered, and `\end{...}`
+positions are indexed by name in one scan, so an answer with thousands of
+unbalanced `$`, unclosed fences or unclosed environments stays linear.
+"""
+
+from __future__ import annotations
+
+import re
+from bisect import bisect_left
+from enum import Enum
+from typing import Dict, List, NamedTuple, Optional
+
+
+class TokenKind(str, Enum):
+    """Kinds of tokens produced by `tokenize`."""
+    TEXT = "text"
+    INLINE_MATH = "inline_math"  # $...$ or \(...\)
+    DISPLAY_MATH = "display_math"  # $$...$$, \[...\] or \begin{env}...\end{env}
+    CODE_FENCE = "code_fence"  # ```...```
+    HEADING = "heading"  # the "## " marker; the title follows as text and math tokens
+    RULE = "rule"  # a --- line
+
+
+class Token(NamedTuple):
+    kind: TokenKind
+    text: str  # source, delimiters included
+    body: str = ""  # math without delimiters, fence contents
+    delimiter: str = ""  # opening delimiter: "$", "\\(", "$$", "\\[", "align", "```", "#"
+
+
+MATH_KINDS = (TokenKind.INLINE_MATH, TokenKind.DISPLAY_MATH)
+
+_PLAIN_RE = re.compile(r"[^$\\\n]+")  # runs without anything the lexer stops at
+_HEADING_RE = re.compile(r"[ \t]*(#{1,6}) ")
+_RULE_RE = re.compile(r"[ \t]*---[ \t]*(?=\n|$)")
+_FENCE_RE = re.compile(r"[ \t]*```")
+_BEGIN_RE = re.compile(r"\\begin\{([A-Za-z*]+)\}")
+_END_RE = re.compile(r"\\end\{([A-Za-z*]+)\}")
+
+
+class _Lexer:
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.tokens: List[Token] = []
+        self._plain_start: Optional[int] = None
+        # Closers known to be absent from a position on: delimiter -> position.
+        self._missing: Dict[str, int] = {}
+        # Environment name -> ascending `\end{name}` positions, built on first use.
+        self._ends: Optional[Dict[str, List[int]]] = None
+
+    def run(self) -> List[Token]:
+        text, i, n = self.text, 0, len(self.text)
+        line_start = True
+        while i < n:
+            if line_start:
+                line_start = False
+                j = self._line(i)
+                if j != i:
+                    i = j
+                    continue
+
+            char = text[i]
+            if char == "\n":
+                self._plain(i, i + 1)
+                i += 1
+                line_start = True
+            elif char == "$":
+                i = self._dollar(i)
+            elif char == "\\":
+                i = self._backslash(i)
+            else:
+                match = _PLAIN_RE.match(text, i)
+                self._plain(i, match.end())
+                i = match.end()
+        self._flush()
+        return self.tokens
+
+    # ---------- line-level constructs ---------------------------------
+    def _line(self, i: int) -> int:
+        """Lex a fence, heading marker or rule at line start `i`; return where lexing continues."""
+        text = self.text
+        match = _FENCE_RE.match(text, i)
+        if match:
+            close = self._find("```", match.end())
+            if close >= 0:
+                end = close + 3
+                self._emit(TokenKind.CODE_FENCE, i, end, text[match.end():close], "```")
+                return end
+            return i
+
+        match = _HEADING_RE.match(text, i)
+        if match:
+            self._emit(TokenKind.HEADING, i, match.end(), "", match.group(1))
+            return match.end()
+
+        match = _RULE_RE.match(text, i)
+        if match:
+            self._emit(TokenKind.RULE, i, match.end(), "", "---")
+            return match.end()
+        return i
+
+    # ---------- math ----------------------------------------------------
+    def _dollar(self, i: int) -> int:
+        text = self.text
+        if text.startswith("$$", i):
+            close = self._find("$$", i + 2)
+            if close > i + 2:
+                self._emit(TokenKind.DISPLAY_MATH, i, close + 2, text[i + 2:close], "$$")
+                return close + 2
+            self._plain(i, i + 2)
+            return i + 2
+
+        # Pandoc's rule: `$` hugs its content and the closing `$` is not
+        # followed by a digit, so "$5 and $10" stays text.
+        close = self._find("$", i + 1)
+        if (close > i + 1 and not text[i + 1].isspace() and not text[close - 1].isspace()
+                and text[close - 1] != "\\" and not text[close + 1:close + 2].isdigit()
+                and "\n\n" not in text[i + 1:close]):
+            self._emit(TokenKind.INLINE_MATH, i, close + 1, text[i + 1:close], "$")
+            return close + 1
+        self._plain(i, i + 1)
+        return i + 1
+
+    def _backslash(self, i: int) -> int:
+        text = self.text
+        pair = text[i:i + 2]
+        if pair in ("\\(", "\\["):
+            closer = "\\)" if pair == "\\(" else "\\]"
+            close = self._find(closer, i + 2)
+            if close >= 0:
+                kind = TokenKind.INLINE_MATH if pair == "\\(" else TokenKind.DISPLAY_MATH
+                self._emit(kind, i, close + 2, text[i + 2:close], pair)
+                return close + 2
+        elif pair == "\\b":
+            match = _BEGIN_RE.match(text, i)
+            if match:
+                close = self._find_end(match.group(1), match.end())
+                if close >= 0:
+                    end = _END_RE.match(text, close).end()
+                    self._emit(TokenKind.DISPLAY_MATH, i, end, text[i:end], match.group(1))
+                    return end
+        # An escape (`\$`, `\\`) or a command in text: keep both characters.
+        end = min(i + 2, len(text)) if text[i + 1:i + 2] != "\n" else i + 1
+        self._plain(i, end)
+        return end
+
+    def _find(self, closer: str, start: int) -> int:
+        """`str.find`, remembering failures so no stretch of text is searched twice."""
+        if self._missing.get(closer, len(self.text) + 1) <= start:
+            return -1
+        found = self.text.find(closer, start)
+        if found < 0:
+            self._missing[closer] = start
+        return found
+
+    def _find_end(self, name: str, start: int) -> int:
+        """Position of the first `\\end{name}` at or after `start`, or -1."""
+        if self._ends is None:
+            self._ends = {}
+            for match in _END_RE.finditer(self.text):
+                self._ends.setdefault(match.group(1), []).append(match.start())
+        positions = self._ends.get(name, [])
+        k = bisect_left(positions, start)
+        return positions[k] if k < len(positions) else -1
+
+    # ---------- output ------------------------------------------------
+    def _plain(self, start: int, end: int) -> None:
+        if self._plain_start is None:
+            self._plain_start = start
+
+    def _flush(self, end: Optional[int] = None) -> None:
+        if self._plain_start is not None:
+            stop = len(self.text) if end is None else end
+            chunk = self.text[self._plain_start:stop]
+            self.tokens.append(Token(TokenKind.TEXT, chunk, chunk))
+            self._plain_start = None
+
+    def _emit(self, kind: TokenKind, start: int, end: int, body: str, delimiter: str) -> None:
+        self._flush(start)
+        self.tokens.append(Token(kind, self.text[start:end], body, delimiter))
+
+
+def tokenize(text: str) -> List[Token]:
+    """Split `text` into typed tokens in one linear pass; `"".join(t.text for t in tokens) == text`."""
+    return _Lexer(text).run()
+
+
+def contains_math(text: str) -> bool:
+    """Whether `text` has any inline or display math."""
+    return any(token.kind in MATH_KINDS for token in tokenize(text))
@@ -0,0 +1,86 @@
+"""Sending rendered images to Telegram."""
+
+import io
+import math
+from typing import List, Optional, Sequence, Union
+
+import structlog
+from telegram import InputMediaPhoto, Message
+from telegram.constants import MediaGroupLimit
+from telegram.error import NetworkError, TimedOut
+
+from bot.services.photo_cache import PhotoCache
+
+logger = structlog.get_logger(__name__)
+
+Photo = Union[bytes, io.BytesIO]
+
+
+def _batches(items: Sequence, size: int) -> List[Sequence]:
+    """Split into as few batches of at most `size` as possible, evenly sized (no lone trailing photo)."""
+    if not items:
+        return []
+    count = math.ceil(len(items) / size)
+    base, extra = divmod(len(items), count)
+    batches, start = [], 0
+    for i in range(count):
+        end = start + base + (1 if i < extra else 0)
+        batches.append(items[start:end])
+        start = end
+    return batches
+
+
+async def reply_photos(
+        message: Message,
+        photos: Sequence[Photo],
+        batch_size: int = MediaGroupLimit.MAX_MEDIA_LENGTH,
+        cache: Optional[PhotoCache] = None,
+) -> List[Message]:
+    """
+    Reply with `photos` in order, as albums of up to `batch_size` images.
+
+    Each album is a single `sendMediaGroup` request carrying all of its
+    files, so a 6-tile answer costs one round trip instead of six. Albums
+    are sent one after another to keep the tiles in reading order. An album
+    Telegram rejects is resent photo by photo; timeouts are raised instead,
+    since the album may have been delivered.
+
+    With a `cache`, images sent before go out by their Telegram file id
+    and new uploads are added to it.
+    """
+    data = [p.getvalue() if isinstance(p, io.BytesIO) else p for p in photos]
+    batch_size = max(MediaGroupLimit.MIN_MEDIA_LENGTH, min(batch_size, MediaGroupLimit.MAX_MEDIA_LENGTH))
+
+    sent: List[Message] = []
+    for batch in _batches(data, batch_size):
+        sent.extend(await _send_batch(message, batch, cache))
+    return sent
+
+
+async def _send_batch(message: Message, batch: Sequence[bytes], cache: Optional[PhotoCache]) -> List[Message]:
+    sources: List[Union[bytes, str]] = [(cache.get(p) if cache else None) or p for p in batch]
+    cached = [isinstance(s, str) for s in sources]
+    try:
+        if len(batch) == 1:
+            messages = [await message.reply_photo(photo=sources[0])]
+        else:
+            messages = list(await message.reply_media_group(media=[InputMediaPhoto(s) for s in sources]))
+    except TimedOut:
+        raise
+    except NetworkError as e:
+        if len(batch) == 1 and not cached[0]:
+            raise
+        logger.warning("Media group failed, sending photos one by one",
+                       size=len(batch), cached=sum(cached), error=str(e))
+        messages = []
+        for photo, was_cached in zip(batch, cached):
+            if was_cached:
+                cache.invalidate(photo)  # the file id may be what Telegram rejected
+            messages.append(await message.reply_photo(photo=photo))
+        cached = [False] * len(batch)
+
+    if cache is not None:
+        for photo, was_cached, sent in zip(batch, cached, messages):
+            if not was_cached and sent.photo:
+                cache.put(photo, sent.photo[-1].file_id)
+    return messages
@@ -0,0 +1,138 @@
+"""Incremental Server-Sent Events decoder."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional
+
+_BOM = b"\xef\xbb\xbf"
+
+
+@dataclass(slots=True)
+class ServerSentEvent:
+    """One dispatched SSE event (raw `data` bytes, not yet decoded)."""
+    event: str = "message"
+    data: bytes = b""
+    id: Optional[str] = None
+    retry: Optional[int] = None
+
+
+class SSEDecoder:
+    """
+    Incremental SSE decoder working on raw byte buffers.
+
+    Feed it arbitrary network chunks; complete events are returned as soon
+    as their terminating blank line arrives. Follows the WHATWG
+    event-stream rules (CR, LF and CRLF line endings, multi-line `data`,
+    `event`/`id`/`retry` fields, `:` comments), except that events carrying
+    only an `event:` name (e.g. Dify's `event: ping`) are dispatched too so
+    callers can see keep-alives.
+    """
+
+    def __init__(self) -> None:
+        self._buf = bytearray()
+        self._started = False
+        self._pending_cr = False
+        self.last_event_id: Optional[str] = None
+        self.retry: Optional[int] = None
+
+    def feed(self, chunk: bytes) -> List[ServerSentEvent]:
+        """Add a chunk and return every event it completes."""
+        if not chunk:
+            return []
+
+        if not self._started:
+            self._started = True
+            if chunk.startswith(_BOM):
+                chunk = chunk[len(_BOM):]
+
+        if self._pending_cr:
+            # A CR ended the previous chunk; swallow the LF of a split CRLF.
+            self._pending_cr = False
+            if chunk[:1] == b"\n":
+                chunk = chunk[1:]
+
+        if b"\r" in chunk:
+            if chunk.endswith(b"\r"):
+                self._pending_cr = True
+            chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+        buf = self._buf
+        buf += chunk
+
+        events: List[ServerSentEvent] = []
+        start = 0
+        size = len(buf)
+        while True:
+            nl = buf.find(b"\n", start)
+            if nl < 0 or nl + 1 >= size:
+                break
+            if buf[nl + 1] == 0x0A and buf.startswith(b"data: ", start):
+                # Fast path: the common single-line `data:` event.
+                events.append(ServerSentEvent("message", bytes(buf[start + 6:nl]), self.last_event_id, self.retry))
+                start = nl + 2
+                continue
+
+            end = buf.find(b"\n\n", start)
+            if end < 0:
+                break
+            event = self._parse_block(bytes(buf[start:end]))
+            if event is not None:
+                events.append(event)
+            start = end + 2
+
+        if start:
+            del buf[:start]
+        return events
+
+    def reset(self) -> None:
+        """
+        Drop any incomplete trailing event.
+
+        Per the spec an event without its terminating blank line is never
+        dispatched, so nothing is lost at end of stream.
+        """
+        self._buf.clear()
+        self._pending_cr = False
+
+    def _parse_block(self, block: bytes) -> Optional[ServerSentEvent]:
+        event_name = b""
+        data_parts: List[bytes] = []
+        has_data = False
+
+        for line in block.split(b"\n"):
+            if not line or line[0] == 0x3A:  # empty or ":" comment
+                continue
+
+            name, sep, value = line.partition(b":")
+            if sep and value[:1] == b" ":
+                value = value[1:]
+
+            if name == b"data":
+                data_parts.append(value)
+                has_data = True
+            elif name == b"event":
+                event_name = value
+            elif name == b"id":
+                if b"\0" not in value:
+                    self.last_event_id = value.decode("utf-8", "replace")
+            elif name == b"retry":
+                if value.isdigit():
+                    self.retry = int(value)
+
+        if not has_data and not event_name:
+            return None
+
+        return ServerSentEvent(
+            event=event_name.decode("utf-8", "replace") if event_name else "message",
+            data=b"\n".join(data_parts) if len(data_parts) != 1 else data_parts[0],
+            id=self.last_event_id,
+            retry=self.retry,
+        )
+
+
+def iter_events(chunks: Iterable[bytes]) -> Iterator[ServerSentEvent]:
+    """Decode a synchronous iterable of byte chunks (handy for replays)."""
+    decoder = SSEDecoder()
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
@@ -0,0 +1,189 @@
+"""
+Tiles composed from cached mathtext bitmaps instead of whole figures.
+
+Each distinct word or `$...$` expression is laid out and rasterised by
+matplotlib's mathtext parser once, trimmed to its ink, and kept in a
+byte-bounded LRU. A tile is then a matter of line breaking on known
+advances and copying those bitmaps into an 800 × 800 greyscale canvas.
+"""
+
+from __future__ import annotations
+
+import re
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import structlog
+from matplotlib.font_manager import FontProperties
+from matplotlib.mathtext import MathTextParser
+from PIL import Image
+
+from config.settings import settings
+
+logger = structlog.get_logger(__name__)
+
+LINE_SPACING = 1.2  # as matplotlib's Text
+
+# A token is a run of non-space characters, escapes (`\$`) and whole
+# `$...$` expressions, so lines only break between words, never inside an
+# expression.
+_TOKEN_RE = re.compile(r"(?:\\\S|\$[^$]*\$|[^\s$\\]|[$\\])+")
+
+
+class Bitmap(NamedTuple):
+    """A rasterised token: coverage trimmed to its ink, placed relative to the pen."""
+    alpha: np.ndarray  # uint8 coverage, rows x columns
+    left: int  # first inked column, from the pen position
+    top: int  # first inked row, from the baseline (negative = above)
+    advance: float  # pen advance, including side bearings
+    ascent: int  # layout box above / below the baseline
+    descent: int
+
+
+class ExpressionCache:
+    """
+    Mathtext bitmaps by source string, evicted least recently used once
+    they exceed `max_bytes`. Sources mathtext rejects are cached as the
+    bitmap of their escaped source, so a bad macro costs one failed parse.
+    """
+
+    def __init__(self, dpi: int, font_size: float, max_bytes: Optional[int] = None) -> None:
+        self.max_bytes = settings.render_expr_cache_bytes if max_bytes is None else max_bytes
+        self.dpi = dpi
+        self._parser = MathTextParser("agg")
+        self._prop = FontProperties(size=font_size)
+        self._entries: "OrderedDict[str, Bitmap]" = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    def get(self, source: str) -> Bitmap:
+        bitmap = self._entries.get(source)
+        if bitmap is not None:
+            self._entries.move_to_end(source)
+            self.hits += 1
+            return bitmap
+
+        self.misses += 1
+        try:
+            bitmap = self._rasterise(source)
+        except ValueError:
+            # Unsupported macro or unbalanced `$`: show the source instead.
+            self.failures += 1
+            bitmap = self._rasterise(source.replace("$", r"\$"))
+        self._remember(source, bitmap)
+        return bitmap
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "failures": self.failures,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def _rasterise(self, source: str) -> Bitmap:
+        parsed = self._parser.parse(source, dpi=self.dpi, prop=self._prop, antialiased=True)
+        alpha = np.asarray(parsed.image)
+        ascent = int(round(parsed.height - parsed.depth))
+        descent = int(round(parsed.depth))
+
+        rows, cols = np.flatnonzero(alpha.any(axis=1)), np.flatnonzero(alpha.any(axis=0))
+        if not rows.size:
+            return Bitmap(alpha[:0, :0], 0, 0, parsed.width, ascent, descent)
+        # Copy, so the trimmed array does not pin mathtext's full-size buffer.
+        trimmed = np.ascontiguousarray(alpha[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1])
+        return Bitmap(trimmed, int(cols[0]), int(rows[0]) - ascent, parsed.width, ascent, descent)
+
+    def _remember(self, source: str, bitmap: Bitmap) -> None:
+        size = bitmap.alpha.nbytes + len(source)
+        if size > self.max_bytes:
+            return
+        self._entries[source] = bitmap
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            old_source, old = self._entries.popitem(last=False)
+            self._bytes -= old.alpha.nbytes + len(old_source)
+
+
+class TileCompositor:
+    """
+    Lay out lines of text with inline `$...$` math, or centred display
+    lines, from `ExpressionCache` bitmaps, and blit them into a tile.
+
+    Text lines wrap at word boundaries to fit between the margins; leading
+    spaces are kept as indentation. The block is centred in the tile with
+    `pad` pixels around it, or pinned top-left when it does not fit, like
+    the figure-based renderer.
+    """
+
+    def __init__(self, size: int, pad: int, dpi: int, font_size: float, max_bytes: Optional[int] = None) -> None:
+        self.size = size
+        self.pad = pad
+        self.cache = ExpressionCache(dpi, font_size, max_bytes)
+        # Line metrics and word spacing of the text font, measured once.
+        lp = self.cache.get("lp")
+        self._line_ascent, self._line_descent = lp.ascent, lp.descent
+        self._gap = int(round((LINE_SPACING - 1) * (lp.ascent + lp.descent)))
+        self._space = self.cache.get("x x").advance - 2 * self.cache.get("x").advance
+
+    def compose(self, lines: List[str], centred: bool) -> Image.Image:
+        """Return a greyscale tile with `lines` drawn black on white."""
+        placed: List[Tuple[List[Tuple[float, Bitmap]], float]] = []  # (pen x, bitmap) per line, width
+        for line in lines:
+            placed.extend(self._break(line))
+
+        heights = [self._metrics(runs) for runs, _ in placed]
+        block_width = max((width for _, width in placed), default=0)
+        block_height = sum(a + d for a, d in heights) + self._gap * max(len(placed) - 1, 0)
+
+        outer_w, outer_h = block_width + 2 * self.pad, block_height + 2 * self.pad
+        left = int((self.size - outer_w) // 2 if outer_w <= self.size else 0) + self.pad
+        y = int((self.size - outer_h) // 2 if outer_h <= self.size else 0) + self.pad
+
+        canvas = np.full((self.size, self.size), 255, dtype=np.uint8)
+        for (runs, width), (ascent, descent) in zip(placed, heights):
+            baseline = y + ascent
+            x0 = left + ((block_width - width) / 2 if centred else 0)
+            for x, bitmap in runs:
+                self._blit(canvas, bitmap, int(round(x0 + x)) + bitmap.left, baseline + bitmap.top)
+            y = baseline + descent + self._gap
+        return Image.fromarray(canvas, "L")
+
+    def _break(self, line: str) -> List[Tuple[List[Tuple[float, Bitmap]], float]]:
+        """Greedy line breaking on cached token advances."""
+        limit = self.size - 2 * self.pad
+        indent = (len(line) - len(line.lstrip(" "))) * self._space
+        out: List[Tuple[List[Tuple[float, Bitmap]], float]] = []
+        runs: List[Tuple[float, Bitmap]] = []
+        x = indent
+        for match in _TOKEN_RE.finditer(line):
+            bitmap = self.cache.get(match.group(0))
+            start = x + self._space if runs else x
+            if runs and start + bitmap.advance > limit:
+                out.append((runs, x))
+                runs, start = [], indent
+            runs.append((start, bitmap))
+            x = start + bitmap.advance
+        out.append((runs, x if runs else 0))
+        return out
+
+    def _metrics(self, runs: List[Tuple[float, Bitmap]]) -> Tuple[int, int]:
+        ascent = max([self._line_ascent] + [b.ascent for _, b in runs])
+        descent = max([self._line_descent] + [b.descent for _, b in runs])
+        return ascent, descent
+
+    @staticmethod
+    def _blit(canvas: np.ndarray, bitmap: Bitmap, x: int, y: int) -> None:
+        height, width = bitmap.alpha.shape
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, canvas.shape[1]), min(y + height, canvas.shape[0])
+        if x0 >= x1 or y0 >= y1:
+            return
+        ink = 255 - bitmap.alpha[y0 - y:y1 - y, x0 - x:x1 - x]
+        region = canvas[y0:y1, x0:x1]
+        np.minimum(region, ink, out=region)
@@ -0,0 +1,257 @@
+"""
+Simple inline LaTeX as Unicode text.
+
+Answers often contain math like `$x^2$`, `$\\alpha$` or `$E = h\\nu$`
+that Telegram can show as plain text: Greek letters, operators, sub- and
+superscripts with a Unicode form, fractions written as a/b. Anything
+else (display math, environments, nested fractions, scripts without a
+Unicode form, unknown macros) is left to the image renderer.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Optional
+
+from bot.utils.markdown_lexer import TokenKind, tokenize
+
+_GREEK = {
+    "alpha": "α", "beta": "β", "gamma": "γ", "delta": "δ", "epsilon": "ϵ", "varepsilon": "ε",
+    "zeta": "ζ", "eta": "η", "theta": "θ", "vartheta": "ϑ", "iota": "ι", "kappa": "κ",
+    "lambda": "λ", "mu": "μ", "nu": "ν", "xi": "ξ", "pi": "π", "varpi": "ϖ", "rho": "ρ",
+    "varrho": "ϱ", "sigma": "σ", "varsigma": "ς", "tau": "τ", "upsilon": "υ", "phi": "ϕ",
+    "varphi": "φ", "chi": "χ", "psi": "ψ", "omega": "ω",
+    "Gamma": "Γ", "Delta": "Δ", "Theta": "Θ", "Lambda": "Λ", "Xi": "Ξ", "Pi": "Π",
+    "Sigma": "Σ", "Upsilon": "Υ", "Phi": "Φ", "Psi": "Ψ", "Omega": "Ω",
+}
+
+_SYMBOLS = {
+    "cdot": "·", "times": "×", "div": "÷", "pm": "±", "mp": "∓", "ast": "∗",
+    "leq": "≤", "le": "≤", "geq": "≥", "ge": "≥", "neq": "≠", "ne": "≠", "ll": "≪", "gg": "≫",
+    "approx": "≈", "sim": "∼", "simeq": "≃", "equiv": "≡", "propto": "∝",
+    "to": "→", "rightarrow": "→", "leftarrow": "←", "Rightarrow": "⇒", "implies": "⇒",
+    "Leftarrow": "⇐", "leftrightarrow": "↔", "Leftrightarrow": "⇔", "mapsto": "↦",
+    "infty": "∞", "partial": "∂", "nabla": "∇", "hbar": "ħ", "ell": "ℓ", "circ": "∘",
+    "degree": "°", "prime": "′", "in": "∈", "notin": "∉", "subset": "⊂", "cup": "∪", "cap": "∩",
+    "forall": "∀", "exists": "∃", "perp": "⊥", "parallel": "∥", "angle": "∠",
+    "ldots": "…", "cdots": "⋯", "dots": "…", "langle": "⟨", "rangle": "⟩",
+    "sum": "∑", "prod": "∏", "int": "∫", "oint": "∮",
+    "{": "{", "}": "}", "%": "%", "$": "$", "#": "#", "&": "&", "_": "_", "|": "‖",
+}
+
+_FUNCTIONS = {"sin", "cos", "tan", "cot", "sec", "csc", "arcsin", "arccos", "arctan", "sinh", "cosh",
+              "tanh", "ln", "log", "exp", "lim", "max", "min", "det"}
+
+# Explicit spacing becomes a thin or em space, which survives the removal
+# of source spaces between factors in `convert`.
+_SPACES = {",": "\u2009", ":": "\u2009", ";": "\u2009", " ": "\u2009", "quad": "\u2003",
+           "qquad": "\u2003\u2003", "!": ""}
+
+# Combining marks placed after the accented character.
+_ACCENTS = {"vec": "\u20d7", "hat": "\u0302", "bar": "\u0304", "overline": "\u0305",
+            "dot": "\u0307", "ddot": "\u0308", "tilde": "\u0303"}
+
+_TEXT_FONTS = {"text", "textrm", "mathrm", "mathit", "operatorname", "mbox"}
+
+_SUPERSCRIPT = dict(zip(
+    "0123456789+-−=()nihjklmoprstuvwxyzabcdefgTβγδθφχ∗*′°",
+    "⁰¹²³⁴⁵⁶⁷⁸⁹⁺⁻⁻⁼⁽⁾ⁿⁱʰʲᵏˡᵐᵒᵖʳˢᵗᵘᵛʷˣʸᶻᵃᵇᶜᵈᵉᶠᵍᵀᵝᵞᵟᶿᵠᵡ**′°",
+))
+_SUBSCRIPT = dict(zip(
+    "0123456789+-−=()aehijklmnoprstuvxβγρφχ",
+    "₀₁₂₃₄₅₆₇₈₉₊₋₋₌₍₎ₐₑₕᵢⱼₖₗₘₙₒₚᵣₛₜᵤᵥₓᵦᵧᵨᵩᵪ",
+))
+
+# An argument shown as a/b needs no parentheses when it is a number or a
+# single symbol, possibly with accents and scripts, or a root of one.
+_ATOM_RE = re.compile(r"\d+(?:\.\d+)?|\w[\u0300-\u036f\u20d7]*[\u2070-\u209c\u00b9\u00b2\u00b3\u2032]*")
+
+# Spaces in math source are not output: `2 m_e e V` is "2mₑeV". Around
+# operators they are kept for readability.
+_FACTOR_SPACE_RE = re.compile(r"(?<=[\w\u0300-\u036f\u20d7\u2070-\u209f\u00b2\u00b3\u00b9)′]) +(?=[\w(√])")
+
+# What may follow a fraction: a factor, a script, or a command (group 1),
+# which is a factor unless it is an operator or spacing.
+_NEXT_ATOM_RE = re.compile(r"\s*(?:[\w({^_]|\\([A-Za-z]+|.))")
+
+# Brackets text-font output (`\text{if }`) so `convert` leaves its spaces alone.
+_VERBATIM = "\ue000"
+
+
+class _Unsupported(Exception):
+    pass
+
+
+class _Converter:
+    """Recursive-descent conversion of one expression; raises `_Unsupported`."""
+
+    def __init__(self, tex: str) -> None:
+        self.tex = tex
+        self.pos = 0
+        self.fractions = 0
+
+    def convert(self) -> str:
+        out = self._sequence(closing=None)
+        if self.pos != len(self.tex):
+            raise _Unsupported(self.tex)
+        # Pieces alternate math / verbatim text, as `_VERBATIM` brackets the latter.
+        pieces = out.split(_VERBATIM)
+        pieces[::2] = [_FACTOR_SPACE_RE.sub("", piece) for piece in pieces[::2]]
+        return re.sub(r" {2,}", " ", "".join(pieces)).strip()
+
+    def _sequence(self, closing: Optional[str]) -> str:
+        out = []
+        while self.pos < len(self.tex):
+            char = self.tex[self.pos]
+            if char == closing:
+                return "".join(out)
+            if char in "^_":
+                self.pos += 1
+                out.append(self._script(char))
+            else:
+                out.append(self._atom())
+        if closing is not None:
+            raise _Unsupported("unbalanced group")
+        return "".join(out)
+
+    def _atom(self) -> str:
+        char = self.tex[self.pos]
+        self.pos += 1
+        if char == "{":
+            inner = self._sequence("}")
+            self.pos += 1
+            return inner
+        if char == "\\":
+            return self._command()
+        if char.isspace():
+            return " "
+        if char == "-":
+            return "−"
+        if char.isalnum() or char in "+=<>/()[]|,.;:!'*":
+            return char
+        raise _Unsupported(char)  # &, }, ~ and friends
+
+    def _argument(self) -> str:
+        while self.pos < len(self.tex) and self.tex[self.pos].isspace():
+            self.pos += 1
+        if self.pos >= len(self.tex) or self.tex[self.pos] in "}^_":
+            raise _Unsupported("missing argument")
+        return self._atom()
+
+    def _raw_argument(self) -> str:
+        """The source of a `{...}` argument, for text fonts where spaces count."""
+        match = re.compile(r"\s*\{([^{}\\$]*)\}").match(self.tex, self.pos)
+        if not match:
+            raise _Unsupported("text argument")
+        self.pos = match.end()
+        return match.group(1)
+
+    def _command(self) -> str:
+        match = re.compile(r"[A-Za-z]+|.").match(self.tex, self.pos)
+        if not match:
+            raise _Unsupported("lone backslash")
+        name = match.group(0)
+        self.pos = match.end()
+
+        if name in _GREEK:
+            return _GREEK[name]
+        if name in _FUNCTIONS:
+            # `\sin x` is "sin x", not "sinx"
+            followed = re.compile(r" *(?=[\w\\])").match(self.tex, self.pos)
+            if followed:
+                self.pos = followed.end()
+            return name + ("\u2009" if followed else "")
+        if name in _SPACES:
+            return _SPACES[name]
+        if name in _SYMBOLS:
+            return _SYMBOLS[name]
+        if name in ("left", "right", "big", "Big", "displaystyle"):
+            return self._delimiter() if name in ("left", "right") else ""
+        if name in _TEXT_FONTS:
+            return _VERBATIM + self._raw_argument() + _VERBATIM
+        if name in _ACCENTS:
+            base = self._argument().replace(_VERBATIM, "")
+            if len(base) != 1:
+                raise _Unsupported(name)
+            return base + _ACCENTS[name]
+        if name == "sqrt":
+            if self.tex.startswith("[", self.pos):
+                raise _Unsupported("root index")
+            return "√" + self._wrap(self._argument())
+        if name in ("frac", "dfrac", "tfrac"):
+            if self.fractions:
+                raise _Unsupported("nested fraction")
+            self.fractions += 1
+            numerator, denominator = self._argument(), self._argument()
+            self.fractions -= 1
+            fraction = f"{self._wrap(numerator)}/{self._wrap(denominator)}"
+            # `\frac{1}{2} m v^2` is "(1/2)mv²": "1/2mv²" would divide by mv².
+            return f"({fraction})" if self._factor_follows() else fraction
+        raise _Unsupported(name)
+
+    def _factor_follows(self) -> bool:
+        """Whether the next atom multiplies what precedes it (or scripts it)."""
+        match = _NEXT_ATOM_RE.match(self.tex, self.pos)
+        if not match:
+            return False
+        command = match.group(1)
+        return command is None or command not in _SYMBOLS and command not in _SPACES
+
+    def _delimiter(self) -> str:
+        if self.pos >= len(self.tex):
+            raise _Unsupported("missing delimiter")
+        char = self.tex[self.pos]
+        if char == ".":
+            self.pos += 1
+            return ""
+        self.pos += 1
+        return self._command() if char == "\\" else char
+
+    def _script(self, kind: str) -> str:
+        text = self._argument().replace(" ", "").replace(_VERBATIM, "")
+        table = _SUPERSCRIPT if kind == "^" else _SUBSCRIPT
+        if kind == "^" and text in ("∘", "°"):
+            return "°"
+        if not text or any(c not in table for c in text):
+            raise _Unsupported(f"{kind}{text}")
+        return "".join(table[c] for c in text)
+
+    @staticmethod
+    def _wrap(text: str) -> str:
+        text = text.replace(_VERBATIM, "").strip()
+        if text.startswith("√"):  # a root is one factor: √x, √(x+1)
+            text, root = text[1:], "√"
+        else:
+            root = ""
+        if _ATOM_RE.fullmatch(text) or root and text.startswith("(") and text.endswith(")"):
+            return root + text
+        return f"({root}{text})"
+
+
+def latex_to_unicode(tex: str) -> Optional[str]:
+    """Return the Unicode form of the math expression `tex`, or None if it is not simple."""
+    try:
+        return _Converter(tex).convert()
+    except _Unsupported:
+        return None
+
+
+def simplify_inline_math(text: str) -> Optional[str]:
+    """
+    Return `text` with every inline `$...$` / `\\(...\\)` expression
+    replaced by Unicode, or None when any math in it needs rendering
+    (display math, environments, or an expression `latex_to_unicode`
+    does not handle).
+    """
+    out = []
+    for token in tokenize(text):
+        if token.kind is TokenKind.DISPLAY_MATH:
+            return None
+        if token.kind is TokenKind.INLINE_MATH:
+            converted = latex_to_unicode(token.body)
+            if converted is None:
+                return None
+            out.append(converted)
+        else:
+            out.append(token.text)
+    return "".join(out)
@@ -21,14 +21,140 @@ class Settings(BaseSettings):
     phyxie_api_base_url: str = os.getenv("PHYXIE_API_BASE_URL", "https://dify.com/v1")
     phyxie_api_key: str = os.getenv("PHYXIE_API_KEY", "")
 
+    # Several Phyxie backends: comma-separated `[name=]url|api_key[|weight]`.
+    # When set, it replaces the single base URL and key above.
+    phyxie_backends: str = os.getenv("PHYXIE_BACKENDS", "")
+    phyxie_affinity_size: int = int(os.getenv("PHYXIE_AFFINITY_SIZE", "100000"))
+    phyxie_upload_affinity_ttl: float = float(os.getenv("PHYXIE_UPLOAD_AFFINITY_TTL", "600"))
+    phyxie_health_interval: float = float(os.getenv("PHYXIE_HEALTH_INTERVAL", "10"))
+    phyxie_health_path: str = os.getenv("PHYXIE_HEALTH_PATH", "/parameters")
+    phyxie_health_timeout: float = float(os.getenv("PHYXIE_HEALTH_TIMEOUT", "5"))
+    phyxie_unhealthy_threshold: int = int(os.getenv("PHYXIE_UNHEALTHY_THRESHOLD", "2"))
+    phyxie_healthy_threshold: int = int(os.getenv("PHYXIE_HEALTHY_THRESHOLD", "1"))
+
     # Bot Configuration
     log_level: str = os.getenv("LOG_LEVEL", "INFO")
     max_file_size_mb: int = int(os.getenv("MAX_FILE_SIZE_MB", "15"))
+    upload_chunk_size: int = int(os.getenv("UPLOAD_CHUNK_SIZE", str(64 * 1024)))
+
+    # Upload dedupe cache (reuse Phyxie upload ids for repeated files)
+    upload_cache_ttl: int = int(os.getenv("UPLOAD_CACHE_TTL", "86400"))
+    upload_cache_size: int = int(os.getenv("UPLOAD_CACHE_SIZE", "10000"))
+    upload_cache_db: str = os.getenv("UPLOAD_CACHE_DB", "")
+
+    # Telegram file ids of rendered images, reused instead of re-uploading
+    photo_cache_size: int = int(os.getenv("PHOTO_CACHE_SIZE", "10000"))
+    photo_cache_db: str = os.getenv("PHOTO_CACHE_DB", "")
+
     allowed_file_extensions: List[str] = os.getenv(
         "ALLOWED_FILE_EXTENSIONS",
         "jpg,jpeg,png,gif,webp,svg,pdf,txt,md,markdown,html,xlsx,xls,docx,csv,eml,msg,pptx,ppt,xml,epub"
     ).split(",")
 
+    # LaTeX rendering in worker processes (0 = draw in the event loop)
+    render_workers: int = int(os.getenv("RENDER_WORKERS", "2"))
+    render_queue_size: int = int(os.getenv("RENDER_QUEUE_SIZE", "64"))
+    render_timeout: float = float(os.getenv("RENDER_TIMEOUT", "10"))
+    # Rendered tiles by content: memory LRU in bytes, optional disk tier
+    render_cache_bytes: int = int(os.getenv("RENDER_CACHE_BYTES", str(64 * 1024 * 1024)))
+    render_cache_dir: str = os.getenv("RENDER_CACHE_DIR", "")
+    render_cache_disk_bytes: int = int(os.getenv("RENDER_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
+    # How tiles are drawn (compose/agg/pyplot); compose caches expression bitmaps per worker
+    render_engine: str = os.getenv("RENDER_ENGINE", "compose")
+    render_expr_cache_bytes: int = int(os.getenv("RENDER_EXPR_CACHE_BYTES", str(32 * 1024 * 1024)))
+    # Send answers whose math is all simple inline LaTeX as Unicode text instead of images
+    math_unicode: bool = os.getenv("MATH_UNICODE", "true").lower() == "true"
+
+    # Update processing: chats run concurrently, each chat stays ordered
+    update_concurrency: int = int(os.getenv("UPDATE_CONCURRENCY", "64"))
+    update_max_pending: int = int(os.getenv("UPDATE_MAX_PENDING", "1024"))
+
+    # Update intake: `polling` or `webhook` (embedded aiohttp server).
+    # WEBHOOK_URL is the public HTTPS URL Telegram posts to; the server
+    # listens on WEBHOOK_PATH (default: the URL's path). An empty secret
+    # token is derived from the bot token.
+    bot_mode: str = os.getenv("BOT_MODE", "polling")
+    webhook_url: str = os.getenv("WEBHOOK_URL", "")
+    webhook_path: str = os.getenv("WEBHOOK_PATH", "")
+    webhook_listen: str = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+    webhook_port: int = int(os.getenv("WEBHOOK_PORT", "8080"))
+    webhook_secret_token: str = os.getenv("WEBHOOK_SECRET_TOKEN", "")
+    webhook_max_connections: int = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+    webhook_set_on_start: bool = os.getenv("WEBHOOK_SET_ON_START", "true").lower() == "true"
+    # Registering the webhook keeps updates that queued up while no instance
+    # was listening; true discards them on every start.
+    webhook_drop_pending_updates: bool = os.getenv("WEBHOOK_DROP_PENDING_UPDATES", "false").lower() == "true"
+
+    # Text replies: `blocking` sends the finished answer, `streaming` edits
+    # a reply as the answer arrives. Edits are at least STREAM_EDIT_INTERVAL
+    # seconds apart (STREAM_GROUP_EDIT_INTERVAL in groups) and back off up
+    # to STREAM_MAX_EDIT_INTERVAL when Telegram is slow to accept them.
+    reply_mode: str = os.getenv("REPLY_MODE", "blocking")
+    stream_edit_interval: float = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+    stream_group_edit_interval: float = float(os.getenv("STREAM_GROUP_EDIT_INTERVAL", "3.0"))
+    stream_max_edit_interval: float = float(os.getenv("STREAM_MAX_EDIT_INTERVAL", "5.0"))
+    stream_message_limit: int = int(os.getenv("STREAM_MESSAGE_LIMIT", "4000"))
+
+    # Outbound Telegram rate limits (messages per second). Telegram allows
+    # about 30/s per bot, 1/s per private chat and 20/min per group.
+    telegram_rate_limit: bool = os.getenv("TELEGRAM_RATE_LIMIT", "true").lower() == "true"
+    telegram_global_rate: float = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))
+    telegram_global_burst: float = float(os.getenv("TELEGRAM_GLOBAL_BURST", "30"))
+    telegram_chat_rate: float = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+    telegram_chat_burst: float = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+    telegram_group_rate: float = float(os.getenv("TELEGRAM_GROUP_RATE", "0.33"))
+    telegram_group_burst: float = float(os.getenv("TELEGRAM_GROUP_BURST", "3"))
+    telegram_max_retries: int = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+    telegram_max_retry_after: float = float(os.getenv("TELEGRAM_MAX_RETRY_AFTER", "60"))
+
+    # Sharded deployment: with SHARD_WORKERS > 0 the main process only
+    # receives updates and forwards them to that many worker processes,
+    # routed by a consistent hash of the user id.
+    shard_workers: int = int(os.getenv("SHARD_WORKERS", "0"))
+    shard_socket: str = os.getenv("SHARD_SOCKET", "")
+    shard_virtual_nodes: int = int(os.getenv("SHARD_VIRTUAL_NODES", "128"))
+    shard_restart_delay: float = float(os.getenv("SHARD_RESTART_DELAY", "1"))
+    shard_restart_max_delay: float = float(os.getenv("SHARD_RESTART_MAX_DELAY", "30"))
+    shard_start_timeout: float = float(os.getenv("SHARD_START_TIMEOUT", "60"))
+    shard_state_size: int = int(os.getenv("SHARD_STATE_SIZE", "100000"))
+
+    # HTTP connection pool (outbound API traffic)
+    http_pool_size: int = int(os.getenv("HTTP_POOL_SIZE", "100"))
+    http_pool_size_per_host: int = int(os.getenv("HTTP_POOL_SIZE_PER_HOST", "30"))
+    http_dns_cache_ttl: int = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+    http_keepalive_timeout: float = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+    http_connect_timeout: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+    http_request_timeout: float = float(os.getenv("HTTP_REQUEST_TIMEOUT", "300"))
+
+    # Transport for JSON/streaming Phyxie calls: aiohttp (HTTP/1.1) or httpx
+    # (HTTP/2 multiplexing; needs `pip install httpx[http2]`). Prior knowledge
+    # makes plain http:// backends speak HTTP/2 without an upgrade.
+    http_transport: str = os.getenv("HTTP_TRANSPORT", "aiohttp")
+    http2_prior_knowledge: bool = os.getenv("HTTP2_PRIOR_KNOWLEDGE", "false").lower() == "true"
+
+    # Flow control in front of the Phyxie API
+    phyxie_concurrency_initial: int = int(os.getenv("PHYXIE_CONCURRENCY_INITIAL", "20"))
+    phyxie_concurrency_min: int = int(os.getenv("PHYXIE_CONCURRENCY_MIN", "2"))
+    phyxie_concurrency_max: int = int(os.getenv("PHYXIE_CONCURRENCY_MAX", "200"))
+    phyxie_queue_size: int = int(os.getenv("PHYXIE_QUEUE_SIZE", "100"))
+    phyxie_queue_timeout: float = float(os.getenv("PHYXIE_QUEUE_TIMEOUT", "30"))
+    phyxie_latency_tolerance: float = float(os.getenv("PHYXIE_LATENCY_TOLERANCE", "2.0"))
+    phyxie_breaker_failure_threshold: int = int(os.getenv("PHYXIE_BREAKER_FAILURE_THRESHOLD", "5"))
+    phyxie_breaker_reset_timeout: float = float(os.getenv("PHYXIE_BREAKER_RESET_TIMEOUT", "30"))
+    phyxie_breaker_half_open_probes: int = int(os.getenv("PHYXIE_BREAKER_HALF_OPEN_PROBES", "1"))
+
+    # Retries for transient Phyxie errors (5xx, 429, connection errors)
+    phyxie_retry_attempts: int = int(os.getenv("PHYXIE_RETRY_ATTEMPTS", "3"))
+    phyxie_retry_base_delay: float = float(os.getenv("PHYXIE_RETRY_BASE_DELAY", "1"))
+    phyxie_retry_max_delay: float = float(os.getenv("PHYXIE_RETRY_MAX_DELAY", "10"))
+    phyxie_retry_deadline: float = float(os.getenv("PHYXIE_RETRY_DEADLINE", "60"))  # no new attempts after
+
+    # Stop a user's running answer when they send a new message, /new or /clear
+    supersede_generations: bool = os.getenv("SUPERSEDE_GENERATIONS", "true").lower() == "true"
+
+    # JSON codec for API traffic: auto, msgspec, orjson or json
+    json_codec: str = os.getenv("JSON_CODEC", "auto")
+
     # Paths
     base_dir: Path = Path(__file__).parent.parent
     logs_dir: Path = base_dir / "logs"
@@ -51,7 +177,7 @@ class Settings(BaseSettings):
 
     @validator("phyxie_api_key")
     def validate_api_key(cls, v):
-        if not v:
+        if not v and not os.getenv("PHYXIE_BACKENDS"):
             raise ValueError("PHYXIE_API_KEY is required")
         return v
 
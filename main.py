@@ -1,9 +1,11 @@
 """Main entry point for the bot."""
 
+import argparse
 import logging
 import structlog
 
 from bot.bot import PhyxieBot
+from bot.sharded import ShardedPhyxieBot
 from config.settings import settings
 
 
@@ -44,21 +46,39 @@ def setup_logging():
     logging.getLogger("telegram").setLevel(logging.INFO)
 
 
+def parse_args():
+    """Parse command-line options; they override the matching settings."""
+    parser = argparse.ArgumentParser(description="Phyxie Telegram Bot")
+    parser.add_argument("--mode", choices=("polling", "webhook"), default=None,
+                        help=f"how updates are received (default: BOT_MODE={settings.bot_mode})")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes; 0 runs everything in this process "
+                             f"(default: SHARD_WORKERS={settings.shard_workers})")
+    return parser.parse_args()
+
+
 def main():
     """Main function."""
+    args = parse_args()
+    workers = settings.shard_workers if args.workers is None else args.workers
     setup_logging()
 
     logger = structlog.get_logger(__name__)
     logger.info("Starting Phyxie Telegram Bot",
                 api_base_url=settings.phyxie_api_base_url,
+                mode=args.mode or settings.bot_mode,
+                workers=workers,
                 log_level=settings.log_level)
 
     try:
         # Create and run bot
-        bot = PhyxieBot()
+        if workers > 0:
+            bot = ShardedPhyxieBot(workers, worker_init=setup_logging)
+        else:
+            bot = PhyxieBot()
 
         # Run the bot
-        bot.run()
+        bot.run(mode=args.mode)
 
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
@@ -13,8 +13,8 @@ def main():
     print("=" * 40)
 
     # Check Python version
-    if sys.version_info < (3, 8):
-        print("❌ Error: Python 3.8 or higher is required!")
+    if sys.version_info < (3, 10):
+        print("❌ Error: Python 3.10 or higher is required!")
         sys.exit(1)
 
     print(f"✅ Python {sys.version.split()[0]} detected")